@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str((Path(__file__).parent / '../..').resolve()))  # vidlu
+sys.path.insert(0, str((Path(__file__).parent / '..').resolve()))  # dirs
@@ -0,0 +1,44 @@
+import argparse
+
+import torch
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Record, DataLoader
+from vidlu.data.datasets import WhiteNoise
+from vidlu.utils.misc import Stopwatch
+
+# python batch_buffers.py --shape 3 512 1024 --batch_size 8 --num_workers 4
+
+parser = argparse.ArgumentParser(description='Collate throughput with and without shared-memory'
+                                             + ' batch buffers (CPU)')
+parser.add_argument('--shape', type=int, nargs='+', default=[3, 256, 512])
+parser.add_argument('--size', type=int, default=512)
+parser.add_argument('--batch_size', type=int, default=16)
+parser.add_argument('--num_workers', type=int, default=2)
+parser.add_argument('--epochs', type=int, default=2)
+args = parser.parse_args()
+
+shape = tuple(args.shape)
+ds = WhiteNoise(example_shape=shape, size=args.size)
+ds = ds.map(lambda r: Record(x=torch.from_numpy(r.x).float(), y=torch.tensor(r.x.shape[0])),
+            func_name='to_torch').cache()  # data loading should not be measured
+
+for batch_buffers in [False, True]:
+    data_loader = DataLoader(ds, batch_size=args.batch_size, num_workers=args.num_workers,
+                             batch_buffers=batch_buffers, drop_last=True, persistent_workers=True)
+    next(iter(data_loader))  # start the workers
+    batch_count = 0
+    with Stopwatch() as sw:
+        for _ in range(args.epochs):
+            for batch in data_loader:
+                batch_count += 1
+    batch_mib = sum(v.nbytes for v in batch.values()) / 2 ** 20
+    # Without buffers, every batch is stacked into newly allocated shared memory that has to be
+    # mapped by the main process. With buffers, only the first batch and the buffers of each worker
+    # are allocated.
+    allocated_batches = (batch_count if batch_buffers is False else
+                         args.num_workers * (data_loader.collate_fn.buffer_count + 1))
+    print(f"batch_buffers={str(batch_buffers):>5}: {batch_count / sw.time:.1f} batches/s,"
+          + f" {batch_mib:.1f} MiB stacked per batch,"
+          + f" {allocated_batches * batch_mib:.0f} MiB of shared memory allocated in total")
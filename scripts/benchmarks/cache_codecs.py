@@ -0,0 +1,62 @@
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Dataset, Record
+from vidlu.data.utils import benchmark_codecs
+from vidlu.utils.misc import Stopwatch
+
+# python cache_codecs.py --shape 512 1024 --codecs pickle zlib lzma bz2 png png:1 --read
+
+parser = argparse.ArgumentParser(description='Cache codecs: compression ratio vs. throughput')
+parser.add_argument('--size', type=int, default=32)
+parser.add_argument('--shape', type=int, nargs=2, default=[256, 512])
+parser.add_argument('--codecs', type=str, nargs='+', default=['pickle', 'zlib', 'lzma', 'bz2',
+                                                              'png', 'png:1'])
+parser.add_argument('--sample_count', type=int, default=8)
+parser.add_argument('--disk_speed', type=float, default=100, help='assumed disk speed in MB/s')
+parser.add_argument('--read', action='store_true',
+                    help='also measure reading from an HDD cache with the best codecs per field')
+args = parser.parse_args()
+
+
+def make_example(i):  # a smooth noisy image and a label map with regions, like road scenes
+    rand = np.random.RandomState(i)
+    h, w = args.shape
+    small = rand.randint(0, 256, (h // 32, w // 32, 3), dtype=np.uint8)
+    x = cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+    x = np.clip(x + rand.randint(-2, 3, x.shape), 0, 255).astype(np.uint8)
+    y = cv2.resize(rand.randint(-1, 19, (h // 32, w // 32)).astype(np.int8).view(np.uint8),
+                   (w, h), interpolation=cv2.INTER_NEAREST).view(np.int8)
+    return Record(x=x, y=y)
+
+
+ds = Dataset(name='Scenes', data=list(range(args.size))).map(make_example, func_name='make')
+
+results = benchmark_codecs(ds, args.codecs, sample_count=args.sample_count)
+best = {}  # the codec with the highest throughput of reading from the disk and decoding
+print(f"{'field':>6} {'codec':>8} {'ratio':>7} {'encode MB/s':>12} {'decode MB/s':>12}"
+      + f" {f'read MB/s @{args.disk_speed:g}':>14}")
+for r in results:
+    read_speed = 1 / (1 / (args.disk_speed * 1e6 * r['ratio']) + 1 / r['decode_speed'])
+    if read_speed > best.get(r['field'], (None, 0))[1]:
+        best[r['field']] = (r['codec'], read_speed)
+    print(f"{r['field'] or '':>6} {r['codec']:>8} {r['ratio']:7.2f} {r['encode_speed'] / 1e6:12.1f}"
+          + f" {r['decode_speed'] / 1e6:12.1f} {read_speed / 1e6:14.1f}")
+field_codecs = {k: c for k, (c, _) in best.items()}
+print("Best codecs:", field_codecs)
+
+if args.read:  # files are read from the page cache, so only decoding costs are measured
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for codec in [None, field_codecs]:
+            cached = ds.cache_hdd(cache_dir + f"/{codec}", codec=codec)
+            cached.populate(num_workers=0)
+            with Stopwatch() as sw:
+                for r in cached:
+                    r.evaluate()
+            print(f"HDD cache read with {str(cached.codec):>20}: {len(ds) / sw.time:.0f}"
+                  + f" examples/s, {cached.cached_size() / 2 ** 20:.1f} MiB")
@@ -0,0 +1,42 @@
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Dataset, Record
+from vidlu.utils.misc import Stopwatch
+from vidlu.utils.path import get_size
+
+# python cache_open.py --size 5000 --load_time 0.05
+
+parser = argparse.ArgumentParser(description='Opening and measuring an existing HDD cache')
+parser.add_argument('--size', type=int, default=2000)
+parser.add_argument('--load_time', type=float, default=0.05)
+args = parser.parse_args()
+
+
+def load(i):  # simulates expensive preprocessing
+    time.sleep(args.load_time)
+    return Record(x=np.full((64, 64, 3), i % 256, dtype=np.uint8), y=i)
+
+
+ds = Dataset(name='Slow', data=list(range(args.size))).map(load, func_name='load')
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    cached = ds.cache_hdd(cache_dir)
+    cached.populate(num_workers=0, chunk_size=args.size)
+    for name, kwargs in [('consistency check of 4 examples',
+                          dict(consistency_check_sample_count=4)),
+                         ('manifest fingerprint only', dict())]:
+        with Stopwatch() as sw:
+            ds.cache_hdd(cache_dir, **kwargs)
+        print(f"{'open, ' + name:>42}: {sw.time * 1000:.1f} ms")
+    with Stopwatch() as sw:
+        size = get_size(cached.cache_dir)
+    print(f"{'size, path.get_size (walks files)':>42}: {sw.time * 1000:.1f} ms ({size} B)")
+    with Stopwatch() as sw:
+        size = ds.cache_hdd(cache_dir).cached_size()
+    print(f"{'size, open + cached_size (entry log)':>42}: {sw.time * 1000:.1f} ms ({size} B)")
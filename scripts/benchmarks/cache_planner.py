@@ -0,0 +1,61 @@
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Dataset, DataLoader, Record
+from vidlu.data.utils import plan_cache_placement
+from vidlu.utils.misc import Stopwatch
+
+# python cache_planner.py --size 1000 --ram_budget_mib 64 --epochs 4
+
+parser = argparse.ArgumentParser(description='Planned vs. fixed cache placement benchmark')
+parser.add_argument('--size', type=int, default=500)
+parser.add_argument('--shape', type=int, nargs=3, default=[256, 512, 3])
+parser.add_argument('--load_time', type=float, default=0.004)
+parser.add_argument('--ram_budget_mib', type=float, default=32)
+parser.add_argument('--disk_budget_mib', type=float, default=4096)
+parser.add_argument('--num_workers', type=int, default=0)
+parser.add_argument('--epochs', type=int, default=4)
+args = parser.parse_args()
+
+
+def load(i):  # simulates reading and decoding
+    time.sleep(args.load_time)
+    return Record(x=np.full(args.shape, i % 256, dtype=np.uint8), y=i)
+
+
+def downscale(r):  # a cheap stage that makes examples smaller
+    return Record(r, x=r.x[::4, ::4].copy())
+
+
+def to_float(r):  # a cheap stage that makes examples larger
+    return Record(r, x=r.x.astype(np.float32) / 255)
+
+
+ds = Dataset(name='Slow', data=list(range(args.size))).map(load, func_name='load') \
+    .map(downscale, func_name='downscale').map(to_float, func_name='to_float')
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    plan = plan_cache_placement(ds, ram_budget=int(args.ram_budget_mib * 2 ** 20),
+                                disk_budget=int(args.disk_budget_mib * 2 ** 20),
+                                cache_dir=cache_dir, epochs=args.epochs)
+    print(plan.report())
+    configurations = [('no cache', lambda: ds),
+                      ('cache_hdd() of the whole chain', lambda: ds.cache_hdd(cache_dir + '/all')),
+                      ('planned', plan.apply)]
+    for name, create in configurations:
+        with Stopwatch() as sw:
+            cached = create()
+            epoch_times = []
+            for _ in range(args.epochs):
+                with Stopwatch() as sw_epoch:
+                    for _ in DataLoader(cached, batch_size=16, shuffle=True,
+                                        num_workers=args.num_workers):
+                        pass
+                epoch_times.append(sw_epoch.time)
+        print(f"{name:>32}: total {sw.time:.2f} s, epochs "
+              + ", ".join(f"{t:.2f}" for t in epoch_times) + " s")
@@ -0,0 +1,43 @@
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Dataset, Record
+from vidlu.utils.misc import Stopwatch
+
+# python cache_population.py --size 2000 --num_workers 8
+
+parser = argparse.ArgumentParser(description='Cache building with data loader worker processes')
+parser.add_argument('--size', type=int, default=500)
+parser.add_argument('--shape', type=int, nargs=3, default=[128, 256, 3])
+parser.add_argument('--load_time', type=float, default=0.005)
+parser.add_argument('--num_workers', type=int, default=4)
+args = parser.parse_args()
+
+
+def load(i):  # simulates reading and decoding, which mostly waits for I/O
+    time.sleep(args.load_time)
+    return Record(x=np.full(args.shape, i % 256, dtype=np.uint8), y=i)
+
+
+ds = Dataset(name='Slow', data=list(range(args.size))).map(load, func_name='load')
+
+for name, build in [
+    ('cache()', lambda d, nw: d.cache(num_workers=nw)),
+    ('cache(directory=...)', lambda d, nw: d.cache(directory=cache_dir, num_workers=nw)),
+    ('cache_hdd(sharded=True)', lambda d, nw: d.cache_hdd(cache_dir, sharded=True,
+                                                          num_workers=nw)),
+    ('cache_hdd().populate()', lambda d, nw: d.cache_hdd(cache_dir).populate(num_workers=nw)),
+]:
+    times = []
+    for num_workers in [0, args.num_workers]:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with Stopwatch() as sw:
+                build(ds, num_workers)
+        times.append(sw.time)
+    print(f"{name:>24}: {times[0]:.2f} s serially, {times[1]:.2f} s with"
+          + f" {args.num_workers} workers")
@@ -0,0 +1,63 @@
+import argparse
+
+import numpy as np
+import cv2
+import torch
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Dataset, Record
+from vidlu.data.utils import class_incidence
+from vidlu.utils.misc import Stopwatch
+
+# python class_incidence.py --size 64 --shape 1024 2048 --num_workers 4
+
+parser = argparse.ArgumentParser(description='Segmentation class incidence analysis benchmark')
+parser.add_argument('--size', type=int, default=32)
+parser.add_argument('--shape', type=int, nargs=2, default=[512, 1024])
+parser.add_argument('--class_count', type=int, default=19)
+parser.add_argument('--num_workers', type=int, default=None)
+args = parser.parse_args()
+
+
+def serial_class_info(ds):  # the previous implementation
+    def get_class_segment_boxes(y, classes):
+        image_instances = {c: [] for c in classes}
+        for c in classes:
+            num, masks = cv2.connectedComponents(np.uint8(y == c))
+            for j in range(1, num):
+                component = masks == j
+                cols = np.where(np.any(component, axis=0))[0]
+                rows = np.where(np.any(component, axis=1))[0]
+                image_instances[c] += [[cols.min().item(), cols.max().item(),
+                                        rows.min().item(), rows.max().item()]]
+        return {c: np.array(v, dtype=np.uint16) for c, v in image_instances.items()}
+
+    class_dist = np.zeros((len(ds), ds.info.class_count + 1), dtype=np.uint64)
+    instances = []
+    for i, example in enumerate(ds):
+        y = example['y'].squeeze().numpy()
+        classes, counts = np.unique(y, return_counts=True)
+        class_dist[i, classes] = counts  # "+=" fails with NumPy 2
+        instances.append(get_class_segment_boxes(y, classes))
+    return dict(incidence=class_dist.sum(0), instances=instances, dist=class_dist)
+
+
+def get_label(i):  # blocky labels with a moderate number of segments
+    rand = np.random.RandomState(i)
+    blocks = rand.randint(-1, args.class_count, [d // 64 for d in args.shape], dtype=np.int8)
+    y = np.kron(blocks, np.ones((64, 64), dtype=np.int8))
+    return Record(y=torch.from_numpy(y))
+
+
+ds = Dataset(name='Labels', data=list(range(args.size)), info=dict(class_count=args.class_count))
+ds = ds.map(get_label).cache()  # label loading should not be measured
+
+results = []
+for name, func in [('serial (previous)', serial_class_info),
+                   ('segmentation_class_info', lambda d: class_incidence.segmentation_class_info(
+                       d, num_workers=args.num_workers, chunk_size=4, progress_bar=False))]:
+    with Stopwatch() as sw:
+        results.append(func(ds))
+    print(f"{name:>24}: {args.size / sw.time:.1f} images/s")
+assert np.array_equal(results[0]['dist'], results[1]['dist'])
@@ -0,0 +1,72 @@
+import argparse
+import multiprocessing as mp
+import resource
+
+import torch
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu import metrics
+from vidlu.ops import one_hot
+from vidlu.utils.misc import Stopwatch
+
+# python confusion_matrix.py --shape 2 1024 2048 --class_count 19
+
+parser = argparse.ArgumentParser(description='Confusion matrix computation benchmark (CPU)')
+parser.add_argument('--shape', type=int, nargs='+', default=[2, 1024, 2048])
+parser.add_argument('--class_count', type=int, default=19)
+parser.add_argument('--ignored_proportion', type=float, default=0.1)
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--threads', type=int, default=None)
+args = parser.parse_args()
+
+
+def one_hot_confusion_matrix(true, pred, class_count):
+    # the previous implementation
+    non_ignored = true != -1
+    return torch.einsum("ni,nj->ij",
+                        one_hot(true[non_ignored], class_count, dtype=torch.float64),
+                        one_hot(pred, class_count, dtype=torch.float64)[non_ignored]
+                        ).to(torch.int64)
+
+
+def bincount_confusion_matrix(true, pred, class_count):
+    return metrics.multiclass_confusion_matrix(true, pred, class_count)
+
+
+def get_inputs():
+    gen = torch.Generator().manual_seed(53)
+    true = torch.randint(0, args.class_count, args.shape, generator=gen)
+    true[torch.rand(args.shape, generator=gen) < args.ignored_proportion] = -1
+    pred = torch.randint(0, args.class_count, args.shape, generator=gen)
+    return true.flatten(), pred.flatten()
+
+
+def run(name, queue):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    true, pred = get_inputs()
+    func = globals()[name]
+    func(true[:1000], pred[:1000], args.class_count)  # warmup
+    maxrss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with Stopwatch() as sw:
+        for _ in range(args.repeat):
+            cm = func(true, pred, args.class_count)
+    maxrss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((sw.time / args.repeat, (maxrss_after - maxrss_before) / 1024, cm.numpy()))
+
+
+if __name__ == '__main__':
+    ctx = mp.get_context('spawn')  # a fresh process for each peak memory measurement
+    cms = []
+    numel = torch.Size(args.shape).numel()
+    for name in ['one_hot_confusion_matrix', 'bincount_confusion_matrix']:
+        queue = ctx.Queue()
+        p = ctx.Process(target=run, args=(name, queue))
+        p.start()
+        time, peak_mem_mib, cm = queue.get()
+        p.join()
+        cms.append(cm)
+        print(f"{name:>26}: {time:.3f} s, {numel / time / 1e6:.1f} M elements/s,"
+              + f" peak memory increase {peak_mem_mib:.0f} MiB")
+    assert (cms[0] == cms[1]).all()
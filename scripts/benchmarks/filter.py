@@ -0,0 +1,52 @@
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Dataset, Record
+from vidlu.utils.misc import Stopwatch
+
+# python filter.py --size 4000 --num_workers 4
+
+parser = argparse.ArgumentParser(description='Dataset.filter benchmark')
+parser.add_argument('--size', type=int, default=2000)
+parser.add_argument('--num_workers', type=int, default=os.cpu_count())
+args = parser.parse_args()
+
+
+def load_label(i):  # simulates decoding a segmentation label
+    return np.random.RandomState(i).randint(0, 19, (256, 512), dtype=np.uint8)
+
+
+def load_image(i):  # simulates decoding an image that the predicate does not need
+    return np.random.RandomState(i).randint(0, 256, (256, 512, 3), dtype=np.uint8)
+
+
+def get_example(i):
+    return Record(x_=lambda: load_image(i), y_=lambda: load_label(i))
+
+
+def contains_rare_class(r):
+    return bool(np.any(r.y[::8, ::8] == 18))
+
+
+ds = Dataset(name='Lazy', data=list(range(args.size))).map(get_example, func_name='get_example')
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    results = []
+    for name, kwargs in [('serial, all fields evaluated',
+                          dict(predicate=lambda r: r.evaluate() or contains_rare_class(r))),
+                         ('serial', dict()),
+                         (f'{args.num_workers} workers', dict(num_workers=args.num_workers)),
+                         ('first run, cache_dir', dict(cache_dir=cache_dir)),
+                         ('second run, cache_dir', dict(cache_dir=cache_dir))]:
+        kwargs = {'predicate': contains_rare_class, **kwargs}
+        if 'cache_dir' in kwargs:
+            kwargs['func_name'] = 'contains_rare_class'
+        with Stopwatch() as sw:
+            results.append(ds.filter_indices(**kwargs))
+        print(f"{name:>30}: {sw.time:.3f} s")
+    assert all(np.array_equal(results[0], r) for r in results[1:])
@@ -0,0 +1,55 @@
+import argparse
+import tempfile
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Record, DataLoader
+from vidlu.data.datasets import WhiteNoise
+from vidlu.utils.misc import Stopwatch
+
+# python get_examples.py --size 20000 --shape 32 32 3 --batch_size 128
+
+parser = argparse.ArgumentParser(description='Per-example indexing vs. get_examples throughput')
+parser.add_argument('--size', type=int, default=10000)
+parser.add_argument('--shape', type=int, nargs='+', default=[32, 32, 3])
+parser.add_argument('--batch_size', type=int, default=128)
+parser.add_argument('--num_workers', type=int, default=0)
+parser.add_argument('--cache_dir', type=str, default=None)
+args = parser.parse_args()
+
+
+def to_float32(r):
+    return Record(x=np.float32(r.x), y=r.x.shape[0])
+
+
+def measure(name, func, example_count):
+    with Stopwatch() as sw:
+        func()
+    print(f"{name:>36}: {example_count / sw.time:.0f} examples/s")
+
+
+ds = WhiteNoise(example_shape=tuple(args.shape), size=args.size).map(to_float32)
+
+with tempfile.TemporaryDirectory(dir=args.cache_dir) as cache_dir:
+    ds = ds.cache_hdd(cache_dir, sharded=True)[::-1].map(lambda r: r)
+    batch_count = len(ds) // args.batch_size
+    batches = np.random.RandomState(53).permutation(len(ds))[:batch_count * args.batch_size]
+    batches = batches.reshape(batch_count, args.batch_size)
+
+    def read_per_example():
+        for indices in batches:
+            for i in indices:
+                ds[int(i)].evaluate()
+
+    def read_get_examples():
+        for indices in batches:
+            ds.get_examples(indices)
+
+    measure("indexing", read_per_example, batches.size)
+    measure("get_examples", read_get_examples, batches.size)
+    for fetch_batches in [False, True]:
+        data_loader = DataLoader(ds, batch_size=args.batch_size, shuffle=True,
+                                 num_workers=args.num_workers, fetch_batches=fetch_batches)
+        measure(f"DataLoader, fetch_batches={fetch_batches}", lambda: list(data_loader), len(ds))
@@ -0,0 +1,54 @@
+import argparse
+import tempfile
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Record
+from vidlu.data.datasets import WhiteNoise, DummyClassification
+from vidlu.utils.misc import Stopwatch
+
+# python hdd_cache.py --size 20000 --shape 32 32 3
+
+parser = argparse.ArgumentParser(description='HDD cache layout benchmark')
+parser.add_argument('--dataset', type=str, default='WhiteNoise',
+                    choices=['WhiteNoise', 'DummyClassification'])
+parser.add_argument('--size', type=int, default=10000)
+parser.add_argument('--shape', type=int, nargs='+', default=[32, 32, 3])
+parser.add_argument('--reads', type=int, default=5000)
+parser.add_argument('--cache_dir', type=str, default=None)
+args = parser.parse_args()
+
+ds_class = dict(WhiteNoise=WhiteNoise, DummyClassification=DummyClassification)[args.dataset]
+if ds_class is WhiteNoise:
+    ds = WhiteNoise(example_shape=tuple(args.shape), size=args.size)
+else:
+    ds = DummyClassification(shape=tuple(args.shape), size=args.size)
+ds = ds.map(lambda r: Record(x=np.float32(r.x), y=r.y), func_name='float32')
+
+
+def evaluate(r):
+    if isinstance(r, Record):
+        r.evaluate()
+    return r
+
+
+layouts = dict(files=dict(separate_fields=False),
+               files_separate=dict(separate_fields=True),
+               sharded=dict(sharded=True))
+
+with tempfile.TemporaryDirectory(dir=args.cache_dir) as cache_dir:
+    indices = np.random.RandomState(53).randint(0, len(ds), size=args.reads)
+    for name, kwargs in layouts.items():
+        with Stopwatch() as sw_build:  # HDDCacheDataset is filled on first access
+            ds_cached = ds.cache_hdd(f"{cache_dir}/{name}", **kwargs)
+            for r in ds_cached:
+                evaluate(r)
+        with Stopwatch() as sw_open:
+            ds_cached = ds.cache_hdd(f"{cache_dir}/{name}", **kwargs)
+        with Stopwatch() as sw_read:
+            for i in indices:
+                evaluate(ds_cached[int(i)])
+        print(f"{name:>16}: build {sw_build.time:.3f} s, open {sw_open.time:.3f} s,"
+              + f" {len(indices) / sw_read.time:.0f} random reads/s")
@@ -0,0 +1,52 @@
+import argparse
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Dataset, Record, DataLoader, in_ram_data_loader
+from vidlu.data.dataset import FieldsMap
+from vidlu.transforms.input_preparation import prepare_input_image, prepare_label
+from vidlu.utils.misc import Stopwatch, to_shared_array
+
+# python in_ram_loader.py --size 50000 --batch_size 128 --num_workers 4
+
+parser = argparse.ArgumentParser(description='In-RAM loader vs. DataLoader throughput (CPU)')
+parser.add_argument('--size', type=int, default=20000)
+parser.add_argument('--shape', type=int, nargs='+', default=[32, 32, 3])
+parser.add_argument('--batch_size', type=int, default=128)
+parser.add_argument('--num_workers', type=int, nargs='+', default=[0, 2])
+args = parser.parse_args()
+
+
+class CifarLike(Dataset):
+    def __init__(self):
+        rand = np.random.RandomState(53)
+        self.x = to_shared_array(rand.randint(0, 256, (args.size, *args.shape), dtype=np.uint8))
+        self.y = to_shared_array(rand.randint(0, 10, args.size).astype(np.int8))
+        super().__init__(name='CifarLike', info=dict(class_count=10, in_ram=True))
+
+    def get_example(self, idx):
+        return Record(x=self.x[idx], y=self.y[idx])
+
+    def get_arrays(self):
+        return dict(x=self.x, y=self.y)
+
+    def __len__(self):
+        return len(self.x)
+
+
+ds = CifarLike()[:int(args.size * 0.9)].map(
+    FieldsMap(dict(x=prepare_input_image, y=prepare_label)), func_name='prepare')
+
+
+def measure(name, data_loader):
+    with Stopwatch() as sw:
+        example_count = sum(len(b.y) for b in data_loader)
+    print(f"{name:>24}: {example_count / sw.time:.0f} examples/s")
+
+
+for num_workers in args.num_workers:
+    measure(f"DataLoader, {num_workers} workers",
+            DataLoader(ds, batch_size=args.batch_size, shuffle=True, num_workers=num_workers))
+measure("InRAMDataLoader", in_ram_data_loader(ds, batch_size=args.batch_size, shuffle=True))
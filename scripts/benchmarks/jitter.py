@@ -0,0 +1,60 @@
+import argparse
+
+import numpy as np
+import torch
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Record, DataLoader
+from vidlu.data.datasets import WhiteNoise
+from vidlu.transforms import jitter
+from vidlu.utils.misc import Stopwatch
+
+# python jitter.py --task segmentation --shape 512 1024 --size 64 --batch_size 8
+
+parser = argparse.ArgumentParser(description='Per-example vs. batch jitter throughput (CPU)')
+parser.add_argument('--task', type=str, default='classification',
+                    choices=['classification', 'segmentation'])
+parser.add_argument('--shape', type=int, nargs=2, default=None)
+parser.add_argument('--size', type=int, default=2048)
+parser.add_argument('--batch_size', type=int, default=128)
+parser.add_argument('--num_workers', type=int, default=0)
+args = parser.parse_args()
+
+if args.task == 'classification':
+    shape = args.shape or (32, 32)
+    jitters = dict(per_example=jitter.CifarPadRandCropHFlip(),
+                   batch=jitter.BatchCifarPadRandCropHFlip())
+else:
+    shape = args.shape or (512, 1024)
+    crop_shape = tuple(d // 2 for d in shape)
+    jitters = dict(
+        per_example=jitter.SegRandScaleCropPadHFlip(shape=crop_shape, max_scale=2, overflow=0),
+        batch=jitter.BatchSegRandScaleCropPadHFlip(shape=crop_shape, max_scale=2, overflow=0))
+
+
+def to_torch(r):
+    x = torch.from_numpy(np.float32(r.x)).permute(2, 0, 1)
+    y = (torch.tensor(r.x.shape[0] % 10) if args.task == 'classification' else
+         torch.from_numpy((r.x[..., 0] > 0).astype(np.int64)))
+    return Record(x=x, y=y)
+
+
+ds = WhiteNoise(example_shape=(*shape, 3), size=args.size).map(to_torch, func_name='to_torch')
+ds = ds.cache()  # data loading should not be measured
+
+for mode, jitter_ in jitters.items():
+    ds_jittered = ds.map(jitter_) if mode == 'per_example' else ds
+    data_loader = DataLoader(ds_jittered, batch_size=args.batch_size, shuffle=True,
+                             num_workers=args.num_workers, drop_last=True)
+    jitter_time = 0
+    with Stopwatch() as sw:
+        for batch in data_loader:
+            if mode == 'batch':
+                with Stopwatch() as sw_jitter:
+                    batch = jitter_(batch)
+                jitter_time += sw_jitter.time
+    example_count = len(data_loader) * args.batch_size
+    jitter_info = f" (jitter only: {example_count / jitter_time:.0f} examples/s)" if jitter_time \
+        else ""
+    print(f"{mode:>12}: {example_count / sw.time:.0f} examples/s" + jitter_info)
@@ -0,0 +1,56 @@
+import argparse
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data.datasets.datasets import LabelTranslator, CamVid
+from vidlu.data.datasets._cityscapes_labels import labels as cslabels
+from vidlu.utils.misc import Stopwatch
+
+# python label_translation.py --shape 1024 2048
+
+parser = argparse.ArgumentParser(description='Segmentation label translation benchmark')
+parser.add_argument('--shape', type=int, nargs=2, default=[1024, 2048])
+parser.add_argument('--repeat', type=int, default=5)
+args = parser.parse_args()
+
+
+def loop_translation(lab, id_to_label):  # the previous implementation for integer IDs
+    lab = np.array(lab, dtype=np.int8)
+    for id_, lb in id_to_label.items():
+        lab[lab == id_] = lb
+    return lab
+
+
+def unique_translation(lab, id_to_label):  # the previous implementation for colors
+    scalarizer = np.array([256 ** 2, 256, 1])
+    u, inv = np.unique(lab.reshape(-1, 3).dot(scalarizer), return_inverse=True)
+    id_to_label = {np.array(k).dot(scalarizer): v for k, v in id_to_label.items()}
+    return np.array([id_to_label.get(k, -1) for k in u], dtype=np.int8)[inv].reshape(lab.shape[:2])
+
+
+def measure(name, func, lab):
+    result = func(lab)  # warmup (LabelTranslator computes the table)
+    with Stopwatch() as sw:
+        for _ in range(args.repeat):
+            func(lab)
+    print(f"{name:>28}: {sw.time / args.repeat * 1000:.1f} ms")
+    return result
+
+
+rand = np.random.RandomState(53)
+
+cs_id_to_label = {l.id: l.trainId for l in cslabels}
+ids = rand.randint(0, 34, args.shape).astype(np.uint8)
+print(f"Cityscapes-like label IDs {tuple(args.shape)}:")
+results = [measure('loop', lambda x: loop_translation(x, cs_id_to_label), ids),
+           measure('LabelTranslator', LabelTranslator(cs_id_to_label), ids)]
+assert np.array_equal(*results)
+
+colors = np.array(list(CamVid.color_to_label.keys()), dtype=np.uint8)
+color_lab = colors[rand.randint(0, len(colors), args.shape)]
+print(f"CamVid-like color-coded labels {tuple(args.shape)}:")
+results = [measure('unique', lambda x: unique_translation(x, CamVid.color_to_label), color_lab),
+           measure('LabelTranslator', LabelTranslator(CamVid.color_to_label), color_lab)]
+assert np.array_equal(*results)
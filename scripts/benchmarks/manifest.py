@@ -0,0 +1,37 @@
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data.datasets.datasets import ClassificationFolderDataset
+from vidlu.utils.misc import Stopwatch
+
+# python manifest.py --classes 1000 --files_per_class 100 --dir /mnt/network_storage
+
+parser = argparse.ArgumentParser(description='Directory scanning vs. loading a file-list manifest')
+parser.add_argument('--classes', type=int, default=200)
+parser.add_argument('--files_per_class', type=int, default=100)
+parser.add_argument('--dir', type=str, default=None)
+args = parser.parse_args()
+
+with tempfile.TemporaryDirectory(dir=args.dir) as tmp_dir:
+    root = Path(tmp_dir) / 'data'
+    for c in range(args.classes):
+        os.makedirs(root / f'class{c}')
+        for i in range(args.files_per_class):
+            (root / f'class{c}/{i}.png').touch()
+
+    def create(manifest_dir):
+        os.environ['VIDLU_MANIFEST_DIR'] = manifest_dir
+        with Stopwatch() as sw:
+            ds = ClassificationFolderDataset(str(root), load_func=str, extensions=('.png',))
+        return ds, sw.time
+
+    _, time_scan = create('')  # manifests disabled
+    _, time_first = create(f'{tmp_dir}/manifests')
+    ds, time_load = create(f'{tmp_dir}/manifests')
+    print(f"{len(ds)} files in {args.classes} directories:"
+          + f" scanning {time_scan * 1000:.1f} ms, scanning and storing {time_first * 1000:.1f} ms,"
+          + f" loading the manifest {time_load * 1000:.1f} ms")
@@ -0,0 +1,23 @@
+import argparse
+import functools
+import timeit
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.utils.func import partial
+
+# python partial_call.py --number 1000000
+
+parser = argparse.ArgumentParser(description='Per-call overhead of vidlu.utils.func.partial')
+parser.add_argument('--number', type=int, default=200000)
+args = parser.parse_args()
+
+
+def func(x, y=1, z=2):
+    return x
+
+
+for name, p in dict(functools_partial=functools.partial(func, y=3),
+                    vidlu_partial=partial(func, y=3)).items():
+    time = min(timeit.repeat(lambda: p(1, z=4), number=args.number, repeat=3))
+    print(f"{name:>18}: {time / args.number * 1e9:.0f} ns/call")
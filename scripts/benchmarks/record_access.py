@@ -0,0 +1,47 @@
+import argparse
+import timeit
+
+import torch
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Record, default_collate
+
+# python record_access.py --number 100000
+
+parser = argparse.ArgumentParser(description='Record field access and collate benchmark')
+parser.add_argument('--number', type=int, default=100000)
+parser.add_argument('--batch_size', type=int, default=64)
+args = parser.parse_args()
+
+
+def measure(name, func, number=args.number):
+    time = min(timeit.repeat(func, number=number, repeat=3))
+    print(f"{name:>36}: {time / number * 1e9:.0f} ns/call")
+
+
+def create():
+    return Record(x_=lambda: 1, y_=lambda r: r.x + 1, z=3)
+
+
+def create_evaluate():
+    r = create()
+    return r.x, r.y, r.z
+
+
+r = Record(x=1, y=2, z=3)
+fr = r.freeze()
+measure("Record creation with 2 lazy fields", create)
+measure("... and evaluation of all fields", create_evaluate)
+measure("Record, field by key", lambda: r['y'])
+measure("Record, field by index", lambda: r[1])
+measure("FrozenRecord, field by key", lambda: fr['y'])
+measure("FrozenRecord, field by index", lambda: fr[1])
+
+examples = [Record(x=torch.zeros(3, 8, 8), y=torch.tensor(i)) for i in range(args.batch_size)]
+frozen_examples = [e.freeze() for e in examples]
+collate_number = max(1, args.number // 100)
+measure(f"default_collate, {args.batch_size} Records", lambda: default_collate(examples),
+        collate_number)
+measure(f"default_collate, {args.batch_size} FrozenRecords",
+        lambda: default_collate(frozen_examples), collate_number)
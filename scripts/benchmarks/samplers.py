@@ -0,0 +1,75 @@
+import argparse
+import itertools
+import multiprocessing as mp
+import resource
+
+import numpy as np
+import torch.utils.data as tud
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data.utils import samplers
+from vidlu.utils.misc import Stopwatch
+
+# python samplers.py --sizes 50000 10000000 --draws 1000000
+
+parser = argparse.ArgumentParser(description='Sampler construction and sampling benchmark')
+parser.add_argument('--sizes', type=int, nargs='+', default=[50000, 5000000])
+parser.add_argument('--draws', type=int, default=1000000)
+args = parser.parse_args()
+
+
+def mixed_weighted_random_sampler(sizes):  # the previous mixed_data_loader implementation
+    dataset_weights = [n / sum(sizes) for n in sizes]
+    weights = sum([[wd / n] * n for n, wd in zip(sizes, dataset_weights)], [])
+    return tud.WeightedRandomSampler(weights=weights, num_samples=sum(sizes), replacement=False)
+
+
+def morsic_subset_random_sampler(sizes):  # the previous morsic_semisup_data_loader implementation
+    nl, nu = sizes[:2]
+    multiplier = max(1, nu // nl)
+    indices = list(range(nl)) * multiplier + list(range(nl, nl + nu))
+    return tud.SubsetRandomSampler(indices=indices)
+
+
+def mixture_sampler(sizes, replacement):
+    return samplers.MixtureSampler(sizes, replacement=replacement)
+
+
+def morsic_multiset_sampler(sizes):
+    nl, nu = sizes[:2]
+    return samplers.MultisetSampler([max(1, nu // nl), 1], ranges=[(0, nl), (nl, nl + nu)])
+
+
+SAMPLER_FACTORIES = {
+    'MixtureSampler (with replacement)': lambda: mixture_sampler(args.sizes, True),
+    'MixtureSampler (without replacement)': lambda: mixture_sampler(args.sizes, False),
+    'WeightedRandomSampler (previous)': lambda: mixed_weighted_random_sampler(args.sizes),
+    'MultisetSampler (ranges)': lambda: morsic_multiset_sampler(args.sizes),
+    'SubsetRandomSampler (previous)': lambda: morsic_subset_random_sampler(args.sizes),
+}
+
+
+def run(name, queue):
+    maxrss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with Stopwatch() as sw_create:
+        sampler = SAMPLER_FACTORIES[name]()
+    with Stopwatch() as sw_draw:  # includes the per-epoch setup, e.g. shuffling
+        for _ in itertools.islice(sampler, args.draws):
+            pass
+    maxrss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((sw_create.time, sw_draw.time, (maxrss_after - maxrss_before) / 1024))
+
+
+if __name__ == '__main__':
+    ctx = mp.get_context('spawn')  # a fresh process for each peak memory measurement
+    print(f"Dataset sizes: {args.sizes}")
+    for name in SAMPLER_FACTORIES:
+        queue = ctx.Queue()
+        p = ctx.Process(target=run, args=(name, queue))
+        p.start()
+        create_time, draw_time, peak_mem_mib = queue.get()
+        p.join()
+        print(f"{name:>38}: construction {create_time:.3f} s,"
+              + f" {args.draws / draw_time / 1e6:.2f} M samples/s,"
+              + f" peak memory increase {peak_mem_mib:.0f} MiB")
@@ -0,0 +1,53 @@
+import argparse
+import pickle
+import time
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Dataset, DataLoader, Record
+from vidlu.utils.misc import Stopwatch
+
+# python shared_ram_cache.py --size 2000 --num_workers 4 --epochs 3
+
+parser = argparse.ArgumentParser(description='RAM cache benchmark with data loader workers')
+parser.add_argument('--size', type=int, default=1000)
+parser.add_argument('--shape', type=int, nargs=3, default=[128, 256, 3])
+parser.add_argument('--load_time', type=float, default=0.002)
+parser.add_argument('--num_workers', type=int, default=2)
+parser.add_argument('--epochs', type=int, default=3)
+args = parser.parse_args()
+
+
+def load(i):  # simulates decoding and preprocessing
+    time.sleep(args.load_time)
+    return Record(x=np.full(args.shape, i % 256, dtype=np.uint8), y=i)
+
+
+ds = Dataset(name='Slow', data=list(range(args.size))).map(load, func_name='load')
+example_bytes = -(-len(pickle.dumps(ds[0], protocol=4)) // 4096) * 4096  # whole pages
+
+configurations = [('no cache', lambda: ds),
+                  ('cache() (built in main process)', lambda: ds.cache())]
+for fraction, policy in [(1.0, 'lru'), (0.5, 'lru'), (0.5, 'lfu')]:
+    configurations.append(
+        (f'cache(max_bytes={fraction:.0%} of data, {policy})',
+         lambda fraction=fraction, policy=policy: ds.cache(
+             max_bytes=int(fraction * args.size * example_bytes), policy=policy)))
+
+for name, create in configurations:
+    with Stopwatch() as sw:
+        cached = create()
+        epoch_times = []
+        for _ in range(args.epochs):
+            with Stopwatch() as sw_epoch:
+                for _ in DataLoader(cached, batch_size=32, shuffle=True,
+                                    num_workers=args.num_workers):
+                    pass
+            epoch_times.append(sw_epoch.time)
+    stats = cached.cache_stats() if hasattr(cached, 'cache_stats') else None
+    stats_str = "" if stats is None else \
+        f", hit rate {stats['hit_rate']:.2f}, {stats['used_bytes'] / 2 ** 20:.0f} MiB used"
+    print(f"{name:>38}: total {sw.time:.2f} s, epochs "
+          + ", ".join(f"{t:.2f}" for t in epoch_times) + " s" + stats_str)
@@ -0,0 +1,37 @@
+import argparse
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import _context
+from vidlu.data import Dataset, Record
+from vidlu.utils.misc import Stopwatch
+
+# python wrapper_fusion.py --depth 8 --size 100000
+
+parser = argparse.ArgumentParser(description='Per-example access time of deep wrapper chains')
+parser.add_argument('--size', type=int, default=50000)
+parser.add_argument('--depth', type=int, default=4, help='number of split-permute-map blocks')
+parser.add_argument('--reads', type=int, default=50000)
+args = parser.parse_args()
+
+
+def increment(x):
+    return x + 1
+
+
+ds = Dataset(name='Numbers', data=[Record(x=i, y=i % 10) for i in range(args.size)])
+for i in range(args.depth):
+    ds = ds[:len(ds) - 1].permute(seed=i).repeat(2)[::2].map_fields(dict(x=increment))
+
+with Stopwatch() as sw_fuse:
+    ds_fused = ds.fuse()
+assert ds_fused.identifier == ds.identifier
+
+indices = np.random.RandomState(53).randint(0, len(ds), size=args.reads).tolist()
+for name, d in dict(original=ds, fused=ds_fused).items():
+    with Stopwatch() as sw:
+        examples = [d[i] for i in indices]
+    print(f"{name:>10}: {sw.time / args.reads * 1e6:.2f} us/example")
+    assert examples == [ds[i] for i in indices[:100]] + examples[100:]
+print(f"fusion: {sw_fuse.time * 1000:.1f} ms")
@@ -1,4 +1,6 @@
 from collections import Counter
+import os
+import pickle
 
 import pytest
 from collections.abc import Sequence
@@ -6,7 +8,10 @@ from collections.abc import Sequence
 import numpy as np
 import torch
 
-from vidlu.data import Record, Dataset, PartedDataset, DataLoader
+from vidlu.data import (Record, FrozenRecord, Dataset, PartedDataset, DataLoader, InRAMDataLoader,
+                        in_ram_data_loader)
+import vidlu.data as vd
+import vidlu.data.utils as vdu
 
 
 class TestRecord:
@@ -55,6 +60,22 @@ class TestRecord:
         r5.evaluate()
         assert str(r5) == "Record(a=2, b=3, c=6, d=3)"
 
+    def test_frozen_record(self):
+        import pickle
+        r = Record(a_=lambda: 2 + 3, b=7, c_=lambda r: r.a * r.b)
+        fr = r.freeze()
+        assert str(fr) == "Record(a=5, b=7, c=35)"
+        assert fr == r and fr.a == fr['a'] == fr[0] and fr[-1] == 35
+        assert list(fr.keys()) == ['a', 'b', 'c'] and tuple(fr) == (5, 7, 35)
+        assert Record(b=1, a=2).freeze()._index is not fr._index
+        assert r.freeze()._index is fr._index  # the key index is shared
+        assert pickle.loads(pickle.dumps(fr)) == fr
+        ds = [Record(x=torch.tensor([i]), y=i).freeze() for i in range(4)]
+        batch = next(iter(DataLoader(ds, batch_size=4)))
+        assert type(batch) is FrozenRecord
+        assert torch.equal(batch.x, torch.arange(4)[:, None])
+        assert torch.equal(batch.y, torch.arange(4))
+
 
 class TestDataset:
     def test_dataset_length(self):
@@ -101,6 +122,24 @@ class TestDataset:
         assert all(a == b for a, b in zip(ds1 + ds2, ds1.join(ds2)))
         assert all(a == b for a, b in zip(ds1 + ds2, ds[:3]))
 
+    def test_dataset_filter_parallel_cached(self, tmpdir):
+        def fail():
+            raise AssertionError("A field not needed by the predicate was evaluated.")
+
+        ds = Dataset(name="Lazy", data=list(range(50))).map(lambda i: Record(x_=fail, y=i % 5))
+        for num_workers in [0, 2]:
+            assert list(ds.filter_indices(lambda r: r.y == 2, num_workers=num_workers)) \
+                   == list(range(2, 50, 5))
+            groups = ds.filter_split_indices([lambda r: r.y < 1, lambda r: r.y < 3],
+                                             num_workers=num_workers, chunk_size=7)
+            assert [list(g) for g in groups] == [[i for i in range(50) if i % 5 in c]
+                                                 for c in [[0], [1, 2], [3, 4]]]
+        ds.filter(lambda r: r.y == 2, cache_dir=tmpdir, func_name="y==2")
+        cached = ds.filter(lambda r: fail(), cache_dir=tmpdir, func_name="y==2")
+        assert len(cached) == 10 and all(r.y == 2 for r in cached)
+        with pytest.raises(ValueError):
+            ds.filter(lambda r: r.y == 2, cache_dir=tmpdir)
+
     def test_dataset_zip_collate(self):
         dsa = Dataset(name="Numbers", data=list(range(10)))
         dsb = dsa.map(lambda x: -x, func_name="neg")
@@ -160,6 +199,159 @@ class TestDataset:
             pds_t = pds.with_transform(lambda x: x)
             run_tests(pds_t)
 
+    def test_cache_hdd_sharded(self, tmpdir):
+        ds = Dataset(name="Arrays", data=[Record(x=np.full((2, 3), i, dtype=np.float32),
+                                                 y=torch.arange(i % 3 + 1), z=str(i))
+                                          for i in range(10)])
+        for _ in range(2):  # in the second run, the cache is only opened
+            ds_cached = ds.cache_hdd(tmpdir, sharded=True, shard_size=3)
+            assert len(ds_cached) == len(ds)
+            for a, b in zip(ds, ds_cached):
+                assert np.all(a.x == b.x) and b.x.dtype == a.x.dtype
+                assert torch.equal(a.y, b.y) and a.z == b.z
+        assert list(Dataset(name="Numbers", data=list(range(5))).cache_hdd(
+            tmpdir, sharded=True)) == list(range(5))
+
+    def test_cache_population(self, tmpdir):
+        loaded, interrupt = [], [True]
+
+        def load(i):
+            if i == 7 and interrupt[0]:
+                raise KeyboardInterrupt
+            loaded.append(i)
+            return Record(x=np.full((2, 3), i, dtype=np.float32), y=i)
+
+        ds = Dataset(name="Interrupted", data=list(range(10))).map(load)
+        for make_cache in [lambda: ds.cache_hdd(tmpdir, sharded=True, shard_size=3),
+                           lambda: ds.cache(directory=tmpdir, chunk_size=3)]:
+            interrupt[0] = True
+            with pytest.raises(KeyboardInterrupt):
+                make_cache()
+            interrupt[0] = False
+            loaded.clear()
+            cached = make_cache()
+            assert loaded == [6, 7, 8, 9]  # the 2 complete chunks are not recomputed
+            assert all(np.all(c.x == e.x) and c.y == e.y for c, e in zip(cached, ds))
+
+        assert [r.y for r in ds.cache(num_workers=2)] == list(range(10))
+        ds_hdd = ds.cache_hdd(tmpdir / "hdd")
+        ds_hdd[4].evaluate()  # cached on access
+        assert 4 not in ds_hdd._get_uncached_indices() and 1 in ds_hdd._get_uncached_indices()
+        ds_hdd.populate(num_workers=2, background=True).join()
+        assert len(ds_hdd._get_uncached_indices()) == 0
+        assert all(np.all(c.x == e.x) and c.y == e.y for c, e in zip(ds_hdd, ds))
+        ds_ram = ds.cache(max_bytes=10 ** 6)
+        ds_ram.populate(num_workers=2)
+        assert ds_ram.cache_stats()['cached_count'] == 10
+
+    def test_cache_hdd_manifest(self, tmpdir):
+        computed = []
+
+        def square(i):
+            computed.append(i)
+            return i ** 2
+
+        ds = Dataset(name="Numbers", data=list(range(6)))
+        cached = ds.map(square, func_name='f').cache_hdd(tmpdir, separate_fields=False)
+        assert computed == [] and list(cached) == [i ** 2 for i in range(6)]
+        file_sizes = sum(os.path.getsize(f"{cached.cache_dir}/{i}.p") for i in range(6))
+        assert cached.cached_size() == file_sizes
+
+        computed.clear()
+        cached = ds.map(square, func_name='f').cache_hdd(tmpdir, separate_fields=False)
+        with open(f"{cached.cache_dir}/2.p", 'wb') as file:  # corrupted
+            file.write(pickle.dumps(5))
+        assert list(cached) == [i ** 2 for i in range(6)] and computed == [2]
+
+        with pytest.warns(UserWarning, match="stale"):  # the same identifier, but another function
+            cached = ds.map(lambda i: -i, func_name='f').cache_hdd(tmpdir, separate_fields=False)
+        assert cached.cached_size() == 0 and list(cached) == [-i for i in range(6)]
+
+    def test_fingerprint(self):
+        from functools import partial
+        from pathlib import Path
+        get_fingerprint = vd.dataset._get_fingerprint
+
+        def add(x, k):
+            return x + k
+
+        def create(k, depth=12):  # maps deeper than the default fingerprint depth
+            ds = Dataset(name="Numbers", data=list(range(6))).map(partial(add, k=k), func_name='f')
+            for _ in range(depth):
+                ds = ds.map(lambda x: x, func_name='id')
+            return ds
+
+        assert get_fingerprint(create(1)) == get_fingerprint(create(1))
+        assert get_fingerprint(create(1)) != get_fingerprint(create(2))
+
+        def create_reader(path):
+            return Dataset(name="Files", data=list(range(6))).map(lambda i: path / str(i))
+
+        ds = create_reader(Path("/data/a"))
+        fingerprint = get_fingerprint(ds)
+        path = ds.func.__closure__[0].cell_contents
+        _ = ds[0], str(path), hash(path)
+        assert get_fingerprint(ds) == fingerprint  # lazily computed path attributes are ignored
+        assert get_fingerprint(create_reader(Path("/data/b"))) != fingerprint
+
+    @pytest.mark.parametrize("codec", ['zlib', 'lzma:1', 'bz2', 'png', dict(x='png', y='png')])
+    def test_cache_codecs(self, tmpdir, codec):
+        ds = Dataset(name="Images", data=[
+            Record(x=np.full((32, 24, 3), i, dtype=np.uint8),
+                   y=torch.full((32, 24), i - 1).to(torch.int8), z=np.arange(i, dtype=np.float32))
+            for i in range(5)])
+        for make_cache in [lambda: ds.cache_hdd(tmpdir, codec=codec),
+                           lambda: ds.cache_hdd(tmpdir, separate_fields=False, codec=codec),
+                           lambda: ds.cache(directory=tmpdir, codec=codec)]:
+            for cached in [make_cache(), make_cache()]:  # the second one loads the stored data
+                for a, b in zip(ds, cached):
+                    assert vd.dataset._examples_equal(a, b)
+        raw = ds.cache_hdd(tmpdir / "raw")
+        raw.populate(num_workers=0)
+        assert ds.cache_hdd(tmpdir, codec=codec).cached_size() < raw.cached_size()
+
+        results = vdu.benchmark_codecs(ds, ['pickle', codec], sample_count=3)
+        assert [(r['field'], r['codec']) for r in results] \
+               == [(k, c) for k in 'xyz' for c in ['pickle', str(vd.misc.get_codec(codec)
+                                                                   .for_field(k))]]
+        assert results[0]['ratio'] == 1 and results[1]['ratio'] > 1
+
+    def test_get_examples(self, tmpdir):
+        ds = Dataset(name="Arrays", data=[Record(x=np.full((2, 3), i, dtype=np.float32),
+                                                 y=torch.arange(i % 3 + 1), z=str(i))
+                                          for i in range(10)])
+        datasets = [ds.cache_hdd(tmpdir, sharded=True, shard_size=3), ds.cache(max_cache_size=4),
+                    ds[1:].permute().repeat(2)[::-3], ds.map(lambda r: Record(r, z=r.z + "!")),
+                    ds.zip(ds[::-1])]
+        indices = [4, 0, 5, 4, 2]
+        for d in datasets:
+            for a, b in zip(d.get_examples(indices), [d[i] for i in indices]):
+                assert vd.dataset._examples_equal(a, b)
+        ds_xz = datasets[2].map(lambda r: Record(x=r.x, z=r.z))  # y cannot be collated
+        dl = DataLoader(ds_xz, batch_size=4, fetch_batches=True, num_workers=2)
+        assert len(dl) == 2
+        for a, b in zip(dl, DataLoader(ds_xz, batch_size=4)):
+            assert torch.equal(a.x, b.x) and a.z == b.z
+
+    @pytest.mark.parametrize("policy", ["lru", "lfu"])
+    def test_shared_ram_cache(self, policy):
+        ds = Dataset(name="Arrays", data=list(range(40))).map(
+            lambda i: Record(x=np.full((i % 7 + 1) * 100, i, dtype=np.float64), y=i))
+        cached = ds.cache(max_bytes=10 ** 6, policy=policy)
+        for _ in range(2):  # the second epoch reads what the workers cached in the first one
+            for b, e in zip(DataLoader(cached, batch_size=1, num_workers=2), ds):
+                assert b.y[0] == e.y and np.array_equal(b.x[0].numpy(), e.x)
+        stats = cached.cache_stats()
+        assert stats['hits'] == stats['misses'] == stats['cached_count'] == 40
+        assert 0 < stats['used_bytes'] <= stats['max_bytes'] and stats['evictions'] == 0
+
+        small = ds.cache(max_bytes=20000, policy=policy)
+        for i in list(range(40)) + [0, 1, 2] * 3 + list(range(40)) + [39] * 5:
+            assert small[i].y == i and np.array_equal(small[i].x, ds[i].x)
+        stats = small.cache_stats()
+        assert stats['evictions'] > 0 and stats['used_bytes'] <= 20000
+        assert 0 < stats['hit_rate'] < 1
+
     def test_info_cache_hdd(self, tmpdir):
         upper = 9
         for i in range(2):
@@ -201,6 +393,191 @@ class TestDataset:
         assert ds.info.cache.first == lower
 
 
+    @pytest.mark.parametrize("num_workers", [0, 2])
+    def test_compute_pixel_statistics(self, num_workers):
+        rand = np.random.RandomState(53)
+        images = [rand.randint(0, 256, (rand.randint(4, 12), rand.randint(4, 12), 3))
+                  for _ in range(50)]
+        ds = Dataset(name="Images", data=[Record(x=x) for x in images])
+        pixels = np.concatenate([x.reshape(-1, 3) for x in images])
+        stats = vdu.compute_pixel_statistics(ds, histogram_bins=8, num_workers=num_workers,
+                                             chunk_size=7)
+        assert np.allclose(stats.mean, pixels.mean(0)) and np.allclose(stats.std, pixels.std(0))
+        assert np.all(stats.histogram.sum(1) == len(pixels))
+        mean, std = vdu.compute_pixel_mean_std(ds, scale01=True, num_workers=num_workers,
+                                               sample_count=20)
+        assert mean.shape == std.shape == (3,)
+        assert np.allclose(mean, vdu.compute_pixel_mean_std(ds, scale01=True, num_workers=0,
+                                                            sample_count=20)[0])
+
+    def test_segmentation_class_info(self, tmpdir):
+        from vidlu.data.utils import class_incidence
+
+        rand = np.random.RandomState(53)
+        labels = [torch.from_numpy(rand.randint(-1, 4, (1, 9, 11)) * (rand.rand(9, 11) < 0.3))
+                  for _ in range(10)]
+        ds = Dataset(name="Labels", data=[Record(y=y) for y in labels], info=dict(class_count=5))
+        info = class_incidence.segmentation_class_info(ds, num_workers=0, chunk_size=3,
+                                                       progress_bar=False)
+        for y, dist, instances in zip(labels, info['dist'], info['instances']):
+            y = y.squeeze().numpy()
+            classes, counts = np.unique(y, return_counts=True)
+            assert list(instances.keys()) == sorted(classes, key=lambda c: c % 6)
+            assert np.all(dist[classes] == counts) and dist.sum() == y.size
+            for c, boxes in instances.items():
+                mask = np.zeros_like(y, dtype=bool)
+                for x0, x1, y0, y1 in boxes:
+                    mask[y0:y1 + 1, x0:x1 + 1] = True
+                assert np.all(mask[y == c])
+        assert np.all(info['incidence'] == info['dist'].sum(0))
+
+        partial_dir = tmpdir / "partial"
+        ds_sub = ds[:7]  # simulates an interrupted computation
+        class_incidence.segmentation_class_info(ds_sub, num_workers=0, chunk_size=3,
+                                                partial_dir=partial_dir, progress_bar=False)
+        ds.data[0] = Record(y=torch.zeros(1, 9, 11))  # must not be recomputed
+        resumed = class_incidence.segmentation_class_info(
+            ds, num_workers=0, chunk_size=3, partial_dir=partial_dir, progress_bar=False)
+        assert np.all(resumed['dist'] == info['dist'])
+
+    def test_plan_cache_placement(self, tmpdir):
+        import time
+
+        def slow(i):
+            time.sleep(0.003)
+            return np.full(10, i, dtype=np.int32)
+
+        ds = Dataset(name="Slow", data=list(range(16))).map(slow, func_name='slow') \
+            .map(lambda x: np.resize(x, 10 ** 5).astype(np.uint8), func_name='inflate')[::2]
+        plan = vdu.plan_cache_placement(ds, ram_budget=100 * 2 ** 10, sample_count=4)
+        assert [s.example_count for s in plan.stages] == [8, 8, 8, 8]
+        assert (plan.choice.medium, plan.choice.stage) == ('ram', 1)  # after the slow map
+        assert "Chosen: in RAM after 1:map_slow" in plan.report()
+        ds_cached = plan.apply()
+        assert ds_cached.identifier == ds.identifier
+        assert type(ds_cached.data.data).__name__ == 'SharedRAMCacheDataset'
+        assert all(np.all(a == b) for a, b in zip(ds_cached, ds))
+
+        plan = vdu.plan_cache_placement(ds, disk_budget=2 ** 17, cache_dir=tmpdir, sample_count=4)
+        assert (plan.choice.medium, plan.choice.stage) == ('hdd', 1)  # the larger outputs don't fit
+        assert all(np.all(a == b) for a, b in zip(plan.apply(), ds))
+
+    def test_cache_data_planned(self, tmpdir, monkeypatch):
+        from vidlu.data.utils import caching
+
+        budgets = []
+
+        def plan_cache_placement(ds, ram_budget, disk_budget, **kwargs):
+            budgets.append((ram_budget, disk_budget))
+            return plan_cache_placement_orig(ds, ram_budget, disk_budget, **kwargs)
+
+        plan_cache_placement_orig = caching.plan_cache_placement
+        monkeypatch.setattr(caching, 'plan_cache_placement', plan_cache_placement)
+        ds = Dataset(name="Parted", data=list(range(20))).map(lambda i: np.full(100, i))
+        pds = PartedDataset({'all': ds}, {'all': (('trainval', 'test'), 0.8),
+                                          'trainval': (('train', 'val'), 0.75)})
+        pds = pds.with_transform(lambda d: d.map(lambda x: x + 1))
+        assert pds.top_level_parts == ['all']
+        pds_cached = vdu.cache_data_planned(pds, tmpdir, ram_budget=1000, disk_budget=2000,
+                                            sample_count=2)
+        assert len(budgets) == 3  # only the leaf parts: train, val and test
+        assert sum(r for r, _ in budgets) <= 1000 and sum(d for _, d in budgets) <= 2000
+        for k in pds.keys():
+            assert pds_cached[k].identifier.startswith(pds[k].identifier)
+            assert all(np.all(a == b) for a, b in zip(pds_cached[k], pds[k]))
+
+    @pytest.mark.parametrize("frozen", [False, True])
+    def test_data_loader_batch_buffers(self, frozen):
+        def get_example(i):
+            r = Record(x=np.full((2, 3), i, dtype=np.float32), y=torch.tensor(i),
+                       z=torch.zeros(i // 4 % 3))  # the shape of z varies between batches
+            return r.freeze() if frozen else r
+
+        ds = Dataset(name="Buffered", data=list(range(23))).map(get_example)
+        expected = list(DataLoader(ds, batch_size=4))
+        dl = DataLoader(ds, batch_size=4, num_workers=2, batch_buffers=True)
+        previous = None
+        for _ in range(2):  # buffers are reused between epochs
+            for b, e in zip(dl, expected):
+                assert type(b) is type(e) and list(b.keys()) == list(e.keys())
+                for k in ['x', 'y', 'z']:
+                    assert torch.equal(b[k], e[k])
+                if previous is not None:  # the previous batch is still intact
+                    assert torch.equal(previous[0].x, previous[1].x)
+                previous = b, e
+
+    def test_fuse(self):
+        from vidlu.data.dataset import FieldsMap, MapDataset, SubDataset
+
+        ds = Dataset(name="Numbers", data=[Record(x=i, y=-i) for i in range(20)])
+        ds_deep = ds[2:].permute(seed=1).repeat(3)[::-2][5:].map(
+            FieldsMap(dict(x=lambda x: x * 2))).map_fields(dict(x=lambda x: x + 1, y=abs),
+                                                           func_name='abs').map(lambda r: r)
+        fused = ds_deep.fuse()
+        assert fused.identifier == ds_deep.identifier and fused.modifiers == ds_deep.modifiers
+        assert type(fused) is MapDataset and type(fused.data) is SubDataset
+        assert fused.data.data is ds
+        assert list(fused) == list(ds_deep)
+        assert ds.fuse() is ds and ds[2:].fuse().data is ds
+
+    def test_in_ram_data_loader(self):
+        from vidlu.data.dataset import FieldsMap
+        from vidlu.transforms.input_preparation import prepare_input_image, prepare_label
+
+        class InRAM(Dataset):
+            def __init__(self):
+                rand = np.random.RandomState(53)
+                self.x = rand.randint(0, 256, (30, 4, 5, 3)).astype(np.uint8)
+                self.y = np.arange(30, dtype=np.int8)
+                super().__init__(name="InRAM", info=dict(in_ram=True))
+
+            def get_example(self, idx):
+                return Record(x=self.x[idx], y=self.y[idx])
+
+            def get_arrays(self):
+                return dict(x=self.x, y=self.y)
+
+            def __len__(self):
+                return len(self.x)
+
+        prepare = FieldsMap(dict(x=prepare_input_image, y=prepare_label))
+        ds = InRAM()[3:].repeat(2)[::-3].map(prepare)
+        dl = in_ram_data_loader(ds, batch_size=4, num_workers=2)
+        assert type(dl) is InRAMDataLoader and len(dl) == 5
+        for b, e in zip(dl, DataLoader(ds, batch_size=4)):
+            assert torch.equal(b.x, e.x) and torch.equal(b.y, e.y) and b.y.dtype == torch.int64
+        shuffled = [b.y for b in in_ram_data_loader(ds, batch_size=4, shuffle=True,
+                                                     drop_last=True)]
+        assert len(shuffled) == 4 and set(torch.cat(shuffled).tolist()) <= {e.y.item() for e in ds}
+        assert type(in_ram_data_loader(ds.map(lambda r: r), batch_size=4)) is DataLoader
+
+    def test_samplers(self):
+        from vidlu.data.utils import samplers
+
+        rand = np.random.default_rng(53)
+        table = samplers.AliasTable([1, 0, 3, 4])
+        counts = np.bincount(table.sample(rand, 80000), minlength=4)
+        assert counts[1] == 0 and np.allclose(counts / 80000, [1 / 8, 0, 3 / 8, 1 / 2], atol=0.01)
+
+        sampler = samplers.MultisetSampler([3, 1], ranges=[(0, 4), (4, 10)])
+        assert len(sampler) == 18
+        assert Counter(sampler) == Counter(list(range(4)) * 3 + list(range(4, 10)))
+        assert Counter(samplers.multiset_sampler([0, 2, 1])) == Counter([1, 1, 2])
+        torch.manual_seed(53)
+        order = list(sampler)
+        torch.manual_seed(53)
+        assert list(sampler) == order
+
+        sampler = samplers.MixtureSampler([10, 1000], dataset_weights=[1, 1],
+                                          example_weights=[None, np.arange(1000) % 2],
+                                          num_samples=20000, replacement=True)
+        indices = np.array(list(sampler))
+        assert np.all(indices >= 0) and np.all(indices < 1010) and len(indices) == 20000
+        assert abs(np.mean(indices < 10) - 0.5) < 0.02 and np.all(indices[indices >= 10] % 2 == 1)
+        sampler = samplers.MixtureSampler([10, 1000], dataset_weights=[1000, 1], replacement=False)
+        indices = list(sampler)
+        assert sorted(indices) == list(range(1010)) and set(indices[:10]) == set(range(10))
+
 # test_cache_lazy_info_hdd_parallel
 
 class SubFirst:
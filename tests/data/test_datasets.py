@@ -1,4 +1,7 @@
-from vidlu.data.datasets import DatasetFactory
+import numpy as np
+
+from vidlu.data.datasets import DatasetFactory, TinyImages
+from vidlu.data.datasets.datasets import LabelTranslator
 
 
 def test_datasets(tmpdir):
@@ -14,3 +17,63 @@ def test_datasets(tmpdir):
     # assert all(np.all(a.x == b.x)
     #           for a, b in zip(*[factory("hblobs", size=10, seed=6).all for _ in range(2)]))
     # whitenoise.join(rademachernoise, hblobs)
+
+
+def test_tiny_images(tmpdir, monkeypatch):
+    size = 20
+    monkeypatch.setattr(TinyImages, '_size', size)
+    data = np.random.RandomState(53).randint(0, 256, size * 3072).astype(np.uint8)
+    data.tofile(f"{tmpdir}/tiny_images.bin")
+    images = [data[i * 3072:(i + 1) * 3072].reshape((32, 32, 3), order="F") for i in range(size)]
+
+    ds = TinyImages(tmpdir)
+    assert len(ds) == size and all(np.all(ds[i].x == images[i]) for i in range(size))
+    assert np.all(ds.get_images(slice(3, 9)) == np.stack(images[3:9]))
+    assert np.all(ds.get_images([1, 5, 7]) == np.stack([images[i] for i in [1, 5, 7]]))
+
+    cifar = [2, 10, 18]
+    with open(f"{tmpdir}/cifar.txt", "w") as file:
+        file.write("\n".join(str(i + 1) for i in cifar))
+    ds = TinyImages(tmpdir, exclude_cifar=True, cifar_indexes_file=f"{tmpdir}/cifar.txt")
+    assert len(ds) == size - len(cifar)
+    xs = ds.get_images(range(len(ds)))
+    non_cifar = [x for i, x in enumerate(images) if i not in cifar]
+    assert all(np.all(ds[i].x == x) for i, x in enumerate(xs))
+    assert sorted(x.tobytes() for x in xs) == sorted(x.tobytes() for x in non_cifar)
+
+
+def test_label_translator():
+    lab = np.array([[0, 3, 7], [200, 3, 0]], dtype=np.uint8)
+    translate = LabelTranslator({0: -1, 3: 1, 200: 2})
+    assert np.array_equal(translate(lab), [[-1, 1, 7], [2, 1, -1]])
+    assert translate(lab).dtype == np.int8
+    assert np.array_equal(translate(lab.astype(np.int32)), translate(lab))
+    assert np.array_equal(LabelTranslator({3: 1}, default=-1)(lab), [[-1, 1, -1], [-1, 1, -1]])
+
+    colors = np.array([[[0, 0, 0], [128, 64, 128]], [[1, 2, 3], [128, 64, 128]]], dtype=np.uint8)
+    translate = LabelTranslator({(0, 0, 0): -1, (128, 64, 128): 5})
+    assert np.array_equal(translate(colors), [[-1, 5], [-1, 5]])
+
+
+def test_classification_folder_manifest(tmpdir, monkeypatch):
+    import os
+    from vidlu.data.datasets.datasets import ClassificationFolderDataset
+
+    monkeypatch.setenv('VIDLU_MANIFEST_DIR', str(tmpdir / 'manifests'))
+    root = tmpdir / 'data'
+    for path in ['cat/1.png', 'cat/sub/2.PNG', 'cat/3.txt', 'dog/4.png']:
+        (root / path).write_text('', encoding='utf-8', ensure=True)
+
+    walk, walk_calls = os.walk, []
+    monkeypatch.setattr(os, 'walk', lambda *a, **k: walk_calls.append(a) or walk(*a, **k))
+
+    def get_items():
+        ds = ClassificationFolderDataset(str(root), load_func=str, extensions=('.png',))
+        return [(os.path.relpath(p, root), y) for p, y in ds.path_to_class]
+
+    items = [('cat/1.png', 0), ('cat/sub/2.PNG', 0), ('dog/4.png', 1)]
+    assert get_items() == items and len(walk_calls) == 2
+    assert get_items() == items and len(walk_calls) == 2  # loaded from the manifest
+    (root / 'cat/sub/5.png').write_text('', encoding='utf-8')  # changes the mtime of cat/sub
+    assert get_items() == items[:2] + [('cat/sub/5.png', 0)] + items[2:]
+    assert len(walk_calls) == 4
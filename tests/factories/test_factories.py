@@ -1,7 +1,14 @@
 import pytest
 
 import random
+from types import SimpleNamespace
+
+import torch
+
 from vidlu import factories
+from vidlu.factories import defaults
+from vidlu.factories.problem import Classification
+from vidlu.torch_utils import DeferredScalar
 from vidlu.utils import tree
 
 
@@ -22,3 +29,12 @@ def test_get_datasets_multiple(tmpdir):
     data = dict(factories.get_data("WhiteNoise{trainval,test}, WhiteNoise(example_shape=(8,8,8)){val}",
                                    tmpdir))
     assert len(data) == 3
+
+
+def test_default_metrics_deferred_scalars():
+    metric_fs, _ = defaults.get_metrics(SimpleNamespace(extensions=[]),
+                                        Classification(class_count=3))
+    metric = metric_fs[3]()
+    for v in [1., 2.]:
+        metric.update(dict(corr_c=DeferredScalar(torch.tensor(v)), corr_p=v, loss=v))
+    assert metric.compute() == pytest.approx(dict(corr_c=1.5, corr_p=1.5))
@@ -2,6 +2,7 @@ import pytest
 
 from vidlu.modules import *
 from vidlu.modules.components import Baguette
+from vidlu.modules import tensor_extra
 from vidlu.utils.collections import NameDict
 import weakref
 import gc
@@ -64,6 +65,31 @@ class TestModule:
         assert inner in [p for p, cname in inner.lin1.parents]
     """
 
+    def test_output_naming(self):
+        m = Seq(a=Linear(4), b=Seq(c=Linear(3)))
+        x = torch.randn(2, 5)
+        name = tensor_extra.Name.get(m(x))
+        with output_naming('precomputed', m):
+            assert tensor_extra.Name.get(m(x)) == name
+        with output_naming('off', m):
+            assert not tensor_extra.Name.has(m(x))
+        with output_naming('off'):
+            assert not tensor_extra.Name.has(m(x))
+            with output_naming('call_stack', m):  # the module mode overrides the default
+                assert tensor_extra.Name.get(m(x)) == name
+        assert tensor_extra.Name.get(m(x)) == name
+
+        class Lazy(Module):
+            def build(self, x):
+                self.inner = Linear(3)
+
+            def forward(self, x):
+                return self.inner(x)
+
+        lazy = Lazy()
+        set_output_naming('off', lazy)  # before building
+        assert not tensor_extra.Name.has(lazy(x)) and lazy.inner._output_naming == 'off'
+
 
 class TestFunc:
     def test_square(self):
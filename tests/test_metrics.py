@@ -0,0 +1,60 @@
+import pytest
+
+import torch
+
+from vidlu import metrics
+from vidlu.ops import one_hot
+from vidlu.torch_utils import DeferredScalar
+
+
+def test_deferred_scalar():
+    a = DeferredScalar(torch.tensor(3.))
+    b = (a + 1) * 2 / 4 - a
+    assert isinstance(b, DeferredScalar)
+    assert b.item() == pytest.approx(-1.)
+    assert float(1 - a) == pytest.approx(-2.)
+    assert f"{a:.2f}" == "3.00"
+    assert a > 2 and a <= 3 and bool(a)
+
+
+@pytest.mark.parametrize("metric_class", [metrics.AverageMetric, metrics.HarmonicMeanMetric])
+def test_mean_metric_deferred(metric_class):
+    values = [0.5, 2., 4., 1.5]
+    m, m_deferred = metric_class('loss'), metric_class('loss')
+    for i, v in enumerate(values):
+        m.update(dict(loss=v))
+        m_deferred.update(dict(loss=DeferredScalar(torch.tensor(v)) if i % 2 else v))
+    assert m_deferred.compute()['loss'] == pytest.approx(m.compute()['loss'])
+
+
+def test_extremum_metric_deferred():
+    m = metrics.MaxMetric('loss')
+    for v in [0.5, 2., 1.]:
+        m.update(dict(loss=DeferredScalar(torch.tensor(v))))
+    assert type(m.compute()['loss']) is float
+    assert m.compute()['loss'] == 2.
+
+
+def _one_hot_confusion_matrix(true, pred, class_count):
+    non_ignored = true != -1
+    return torch.einsum("ni,nj->ij", one_hot(true[non_ignored], class_count, torch.float64),
+                        pred[non_ignored].to(torch.float64))
+
+
+@pytest.mark.parametrize("chunk_size", [7, 2 ** 22])
+def test_multiclass_confusion_matrix(chunk_size):
+    torch.manual_seed(53)
+    C = 5
+    true, pred = torch.randint(-1, C, (3, 40)), torch.randint(0, C, (3, 40))
+    cm = metrics.multiclass_confusion_matrix(true, pred, C, chunk_size=chunk_size)
+    assert cm.dtype == torch.int64
+    assert torch.equal(cm, _one_hot_confusion_matrix(true, one_hot(pred, C), C).long())
+    cm_batch = metrics.multiclass_confusion_matrix(true, pred, C, batch=True,
+                                                   chunk_size=chunk_size)
+    for i in range(len(true)):
+        assert torch.equal(cm_batch[i], metrics.multiclass_confusion_matrix(true[i], pred[i], C))
+
+    probs = torch.rand(3, 40, C).softmax(-1)
+    cm_soft = metrics.soft_pred_multiclass_confusion_matrix(true, probs, dtype=torch.float64,
+                                                            chunk_size=chunk_size)
+    assert torch.allclose(cm_soft, _one_hot_confusion_matrix(true, probs, C))
@@ -2,7 +2,10 @@ import pytest
 
 from functools import partial
 
-from vidlu.training.checkpoint_manager import CheckpointManager
+import numpy as np
+import torch
+
+from vidlu.training.checkpoint_manager import CheckpointManager, Checkpoint
 
 
 @pytest.mark.parametrize("scores,kept", [({1: 2, 2: 4, 3: 3, 4: 2, 5: 1, 6: 0}, {2, 3, 5, 6})])
@@ -33,3 +36,77 @@ def test_training_experiment(tmpdir, scores, kept):
     cpman3.save(dict(s=8), dict(i=0, s=8))
     cpman4: CheckpointManager = cpman_f(mode='restart')
     assert len(cpman4.saved) == 0
+
+
+def test_checkpoint_manifest(tmpdir, monkeypatch):
+    cpman_f = partial(CheckpointManager, checkpoints_dir=tmpdir, experiment_name="test",
+                      info=dict(name="Foo"), n_last_kept=1, n_best_kept=1,
+                      perf_func=lambda s: s['s'])
+    cpman = cpman_f()
+    for i, s in enumerate([3, 5, 1]):
+        cpman.save(dict(s=s), dict(i=i, s=s))
+    assert set(cpman.manifest) == set(cpman.saved) == {'2', '3'}
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Checkpoints should not be loaded when syncing.")
+
+    with monkeypatch.context() as m:
+        m.setattr(Checkpoint, 'load', fail)
+        cpman2: CheckpointManager = cpman_f(mode='resume')
+    assert cpman2.id_to_perf == {'2': 5, '3': 1}
+    assert cpman2.best_checkpoint_path.name == '2'
+
+    cpman2.manifest_path.unlink()  # checkpoints missing from the manifest are added
+    cpman3: CheckpointManager = cpman_f(mode='resume')
+    assert cpman3.id_to_perf == cpman2.id_to_perf and cpman3.manifest_path.exists()
+
+
+@pytest.mark.parametrize("perf_func", [lambda s: (s['s'], -s['i']),
+                                       lambda s: np.float32(s['s']),
+                                       lambda s: torch.tensor(s['s'])])
+def test_checkpoint_manifest_perf_types(tmpdir, perf_func):
+    cpman_f = partial(CheckpointManager, checkpoints_dir=tmpdir, experiment_name="test",
+                      n_last_kept=1, n_best_kept=1, perf_func=perf_func)
+    cpman = cpman_f()
+    for i, s in enumerate([3, 5, 1]):
+        cpman.save(dict(s=s), dict(i=i, s=s))
+    cpman2: CheckpointManager = cpman_f(mode='resume')
+    assert cpman2.id_to_perf == cpman.id_to_perf
+    assert cpman2.best_checkpoint_path.name == '2'
+    cpman2.load_last()
+    cpman2.save(dict(s=4), dict(i=4, s=4))  # compared with loaded values
+    assert set(cpman2.saved) == {'2', '4'}
+
+    with pytest.raises(TypeError):
+        cpman_f(mode='new', experiment_name="test2", perf_func=lambda s: "bad").save(
+            dict(s=0), dict(i=0, s=0))
+
+
+def test_checkpoint_manager_async(tmpdir, monkeypatch):
+    cpman_f = partial(CheckpointManager, checkpoints_dir=tmpdir, experiment_name="test",
+                      info=dict(name="Foo"), n_last_kept=1, n_best_kept=1,
+                      perf_func=lambda s: s['s'], async_save=True, max_pending_saves=2)
+    cpman = cpman_f()
+    x = torch.zeros(3)
+    for i, s in enumerate([3, 5, 1]):
+        x += 1
+        cpman.save(dict(x=x), dict(i=i, s=s))
+        x += 10  # the saved state should not be affected
+    assert len(cpman.save_latencies) == 3
+    cpman.flush()
+    assert set(cpman.saved) == {'2', '3'}
+    assert [p.name for p in cpman.experiment_dir.iterdir() if p.name.startswith('.')] == []
+    state, summary = cpman.load_last()
+    assert torch.all(state['x'] == 23) and summary['s'] == 1
+
+    def fail(*args, **kwargs):
+        raise OSError("Writing failed.")
+
+    with monkeypatch.context() as m:
+        m.setattr(Checkpoint, 'save', fail)
+        cpman.save(dict(x=x), dict(i=3, s=0))
+        with pytest.raises(OSError):
+            cpman.flush()
+    assert [p.name for p in cpman.experiment_dir.iterdir() if p.name.startswith('.')] == []
+    cpman.close()
+    assert cpman_f(mode='resume').saved == ['2', '3']
@@ -30,3 +30,20 @@ class TestData:
         imtn_cc = numpy.center_crop(imtn, (40, 10))
         assert np.all(image.to_numpy(imtp_cc) == imtn_cc)
         assert imtp_cc == image.to_pil(imtn_cc)
+
+    def test_batch_transforms(self):
+        y = torch.arange(2 * 8 * 10).view(2, 8, 10)
+        x = y[:, None].expand(2, 3, 8, 10).float()
+
+        x_c, y_c = image.random_crop_batch((x, y), (4, 5))
+        assert x_c.shape == (2, 3, 4, 5) and torch.equal(x_c[:, 1].long(), y_c)
+        x_f, y_f = image.random_hflip_batch((x, y), p=1)
+        assert torch.equal(x_f, x.flip(-1)) and torch.equal(y_f, y.flip(-1))
+
+        x_s, y_s = image.random_scale_crop_batch((x, y), (8, 10), max_scale=1, min_scale=1,
+                                                 is_segmentation=(False, True))
+        assert torch.allclose(x_s, x, atol=1e-4) and torch.equal(y_s, y)
+        x_s, y_s = image.random_scale_crop_batch((x, y), (6, 6), max_scale=2, overflow='half',
+                                                 is_segmentation=(False, True), hflip_p=0.5)
+        assert x_s.shape == (2, 3, 6, 6) and y_s.shape == (2, 6, 6) and y_s.dtype == y.dtype
+        assert set(y_s.unique().tolist()) <= set(y.unique().tolist()) | {-1}
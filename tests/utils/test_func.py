@@ -2,6 +2,7 @@ from dataclasses import dataclass
 
 import pytest
 from functools import partial, wraps
+from inspect import signature
 from vidlu.utils.func import (Empty, default_args, params, func_to_class, class_to_func)
 
 
@@ -35,6 +36,39 @@ class TestHardPartial:
 
         assert len(default_args(foo)) == 0
 
+    def test_partial_argument_validation(self, monkeypatch):
+        import inspect
+        from vidlu.utils.func import partial as vpartial
+
+        def foo(a, b=1):
+            return a + b
+
+        p = vpartial(foo, b=2)
+        assert p(1) == 3
+        signature_calls = []
+        monkeypatch.setattr(inspect, 'signature',
+                            lambda *a, **k: signature_calls.append(a) or signature(*a, **k))
+        assert p(1, b=3) == 4 and vpartial(foo)(a=1) == 2
+        assert len(signature_calls) == 0  # cached
+        monkeypatch.undo()
+        with pytest.raises(RuntimeError, match="Unexpected arguments {'c'} for foo"):
+            p(1, c=3)
+        with pytest.raises(RuntimeError, match="Unexpected arguments {'c'} for foo"):
+            vpartial(foo, c=3)(1)
+        assert vpartial(lambda a, **kwargs: kwargs, b=2)(1, c=3) == dict(b=2, c=3)
+
+    def test_functree_validation_after_call(self):
+        from vidlu.utils.func import FuncTree
+
+        def foo(a, b=1):
+            return a + b
+
+        t1, t2 = FuncTree(foo, b=2), FuncTree(foo, b=2)
+        assert t1(1) == 3 and t1 == t2
+        t1['c'] = 5
+        with pytest.raises(RuntimeError, match="Unexpected arguments {'c'} for foo"):
+            t1(1)
+
     def test_hard_partial(self):
         from vidlu.utils.func import frozen_partial
 
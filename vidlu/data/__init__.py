@@ -1,6 +1,7 @@
 from .misc import pickle_sizeof, default_collate
-from .record import Record
+from .record import Record, FrozenRecord
 from .dataset import Dataset
 from .parted_dataset import PartedDataset
 from .datasets import DatasetFactory
-from .data_loader import DataLoader, ZipDataLoader, BatchTuple
+from .data_loader import (DataLoader, ZipDataLoader, BatchTuple, InRAMDataLoader,
+                          in_ram_data_loader)
@@ -1,14 +1,158 @@
-from functools import partialmethod
-from .misc import default_collate
+from .misc import default_collate, SharedBufferCollate
 from warnings import warn
 import typing as T
 
+import numpy as np
+import torch
 import torch.utils.data as tud
 
+from .record import Record
+from .dataset import MapDataset, InfoCacheDataset, _get_index_map, _get_examples
+
+
+class _BatchFetcher:
+    """Wraps a dataset so that indexing with a list of indices returns a list
+    of examples obtained with `get_examples`."""
+    __slots__ = ('dataset',)
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __getitem__(self, indices):
+        return _get_examples(self.dataset, indices)
+
+    def __len__(self):
+        return len(self.dataset)
+
 
 class DataLoader(tud.DataLoader):
-    """DataLoader class with support for `Record`-typed examples."""
-    __init__ = partialmethod(tud.DataLoader.__init__, collate_fn=default_collate)
+    """DataLoader class with support for `Record`-typed examples.
+
+    Args:
+        batch_buffers (bool or int): If not `False`, worker processes collate
+            `Record` batches into reusable shared-memory buffers (see
+            `SharedBufferCollate`). An integer sets the number of buffers per
+            worker, and `True` means `prefetch_factor + 2`, which keeps the
+            current and the previous batch intact. Has no effect if
+            `num_workers == 0`.
+        fetch_batches (bool): If `True`, the examples of each batch are
+            obtained with a single `Dataset.get_examples` call instead of one
+            indexing operation per example. The batch sampler is created from
+            `batch_size`, `shuffle`, `sampler`, `drop_last` and `generator` as
+            in `torch.utils.data.DataLoader`, or given as `batch_sampler`.
+            Arguments other than `dataset` must be keyword arguments.
+        *args, **kwargs: Arguments for `torch.utils.data.DataLoader`.
+    """
+
+    def __init__(self, dataset, *args, collate_fn=default_collate,
+                 batch_buffers: T.Union[bool, int] = False, fetch_batches=False, **kwargs):
+        if fetch_batches:
+            if len(args) > 0:
+                raise TypeError("Only keyword arguments are supported with fetch_batches=True.")
+            kwargs['sampler'] = _get_batch_sampler(dataset, **kwargs)
+            for k in ['batch_sampler', 'shuffle', 'drop_last']:
+                kwargs.pop(k, None)
+            dataset, kwargs['batch_size'] = _BatchFetcher(dataset), None
+        super().__init__(dataset, *args, collate_fn=collate_fn, **kwargs)
+        if batch_buffers is not False and self.num_workers > 0:
+            buffer_count = self.prefetch_factor + 2 if batch_buffers is True else batch_buffers
+            if buffer_count <= self.prefetch_factor:
+                raise ValueError(f"{batch_buffers=} should be greater than"
+                                 + f" {self.prefetch_factor=}.")
+            self.collate_fn = SharedBufferCollate(buffer_count, collate_fn)
+
+
+def _get_batch_sampler(dataset, batch_size=1, shuffle=False, sampler=None, batch_sampler=None,
+                       drop_last=False, generator=None, **_):
+    if batch_sampler is not None:
+        return batch_sampler
+    if sampler is None:
+        sampler = (tud.RandomSampler(dataset, generator=generator) if shuffle else
+                   tud.SequentialSampler(dataset))
+    return tud.BatchSampler(sampler, batch_size, drop_last)
+
+
+def _get_in_ram_pipeline(dataset):
+    """Returns the arrays of the in-RAM dataset that `dataset` is derived from,
+    index mappings (from outer to inner) and batch transforms (from inner to
+    outer), or `None` if some wrapper cannot be applied to whole batches."""
+    index_maps, batch_transforms = [], []
+    ds = dataset
+    while True:
+        if type(ds) is MapDataset:
+            if (batched := getattr(ds.func, 'batched', None)) is None:
+                return None
+            batch_transforms.append(batched)
+        elif (index_map := _get_index_map(ds)) is not None:
+            index_maps.append(index_map)
+        elif isinstance(ds, InfoCacheDataset):
+            pass
+        elif ds.info.get('in_ram', False) and hasattr(ds, 'get_arrays'):
+            return ds.get_arrays(), index_maps, batch_transforms[::-1]
+        else:
+            return None
+        ds = ds.data
+
+
+class InRAMDataLoader:
+    """A data loader for datasets derived from in-RAM datasets with array
+    fields, such as `Cifar10` or `MNIST`.
+
+    Batches are produced in the main process by indexing the arrays with
+    arrays of indices and converting them to tensors. The dataset can be
+    wrapped in `SubDataset`, `SubrangeDataset`, `RepeatDataset` and
+    `MapDataset` with functions that have a `batched` attribute, e.g.
+    `FieldsMap` with `vidlu.transforms.input_preparation.prepare_input_image`.
+    The batched functions are applied to whole batches.
+
+    `in_ram_data_loader` creates a `DataLoader` instead if the dataset is not
+    supported.
+    """
+    __slots__ = ('dataset', 'batch_size', 'shuffle', 'drop_last', 'generator', '_arrays',
+                 '_index_maps', '_batch_transforms')
+
+    def __init__(self, dataset, batch_size=1, shuffle=False, drop_last=False, generator=None):
+        if (pipeline := _get_in_ram_pipeline(dataset)) is None:
+            raise ValueError(f"{dataset.identifier} is not derived from an in-RAM dataset only"
+                             + " through supported wrappers.")
+        self._arrays, self._index_maps, self._batch_transforms = pipeline
+        self.dataset = dataset
+        self.batch_size, self.shuffle, self.drop_last = batch_size, shuffle, drop_last
+        self.generator = generator
+
+    def __len__(self):
+        n, bs = len(self.dataset), self.batch_size
+        return n // bs if self.drop_last else (n + bs - 1) // bs
+
+    def __iter__(self):
+        n = len(self.dataset)
+        order = (torch.randperm(n, generator=self.generator).numpy() if self.shuffle else
+                 np.arange(n))
+        for i in range(len(self)):
+            yield self._get_batch(order[i * self.batch_size:(i + 1) * self.batch_size])
+
+    def _get_batch(self, indices):
+        for index_map in self._index_maps:
+            indices = index_map(indices)
+        batch = Record({k: torch.from_numpy(a[indices]) for k, a in self._arrays.items()})
+        for transform in self._batch_transforms:
+            batch = transform(batch)
+        return batch
+
+
+def in_ram_data_loader(dataset, *args, data_loader_f=DataLoader, **kwargs):
+    """Creates an `InRAMDataLoader` if `dataset` supports it, and
+    `data_loader_f(dataset, *args, **kwargs)` otherwise.
+
+    Arguments that `InRAMDataLoader` does not support (e.g. `num_workers`) are
+    ignored when it is used. If `sampler` or `batch_sampler` is provided,
+    `data_loader_f` is always used.
+    """
+    in_ram_params = ('batch_size', 'shuffle', 'drop_last', 'generator')
+    if (len(args) > 0 or kwargs.get('sampler') is not None
+            or kwargs.get('batch_sampler') is not None or _get_in_ram_pipeline(dataset) is None):
+        return data_loader_f(dataset, *args, **kwargs)
+    return InRAMDataLoader(dataset, **{k: v for k, v in kwargs.items() if k in in_ram_params})
 
 
 class BatchTuple(tuple):
@@ -4,34 +4,43 @@ Dataset with transformations that create new dataset objects.
 Dataset objects should be considered immutable.
 """
 
+import copy
+import hashlib
+import inspect
 import itertools
+import functools
 import logging
+import mmap
 import os
 import pickle
+import types
 import typing as T
+import zlib
 from collections import abc
-from pathlib import Path
+from pathlib import Path, PurePath
 import shutil
 import warnings
 import multiprocessing
+import threading
 
 import numpy as np
+import torch
 from torch.utils.data.dataset import ConcatDataset
-from tqdm import tqdm, trange
+from tqdm import tqdm
 
-from vidlu.utils.misc import slice_len, query_user
+from vidlu.utils.misc import slice_len, query_user, to_shared_array
 from vidlu.utils.collections import NameDict
-from vidlu.utils.path import to_valid_path
+from vidlu.utils.path import to_valid_path, create_file_atomic
 
 from .record import Record
-from .misc import default_collate, pickle_sizeof
+from .misc import default_collate, pickle_sizeof, get_codec
 
 
 # Helpers ######################################################################
 
 def _compress_indices(indices, max):
     for dtype in [np.uint8, np.uint16, np.uint32, np.uint64]:
-        if max <= dtype(-1):
+        if max <= np.iinfo(dtype).max:
             return np.array(indices, dtype=dtype)
     return indices
 
@@ -40,6 +49,96 @@ def _subset_hash(indices):
     return hash(tuple(indices)) % 16 ** 5
 
 
+class _ChunkPredicateGroups:
+    # not local for picklability, used only in Dataset.filter_split_indices
+    def __init__(self, dataset, predicates):
+        self.dataset = dataset
+        self.predicates = predicates
+
+    def __call__(self, indices):
+        groups = np.full(len(indices), len(self.predicates), dtype=np.int32)
+        for k, i in enumerate(indices):
+            d = self.dataset[int(i)]
+            for j, p in enumerate(self.predicates):
+                if p(d):
+                    groups[k] = j
+                    break
+        return groups
+
+
+class _ChunkExamples:
+    # not local for picklability, used only in _iter_examples
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __call__(self, indices):
+        return _get_examples(self.dataset, indices)
+
+
+def _iter_examples(dataset, indices, num_workers=0, chunk_size=64, desc=None):
+    """Yields examples with the given indices in order.
+
+    With `num_workers > 0`, chunks of examples are loaded in data loader worker
+    processes, where lazy record fields are evaluated when examples are sent
+    to the main process.
+    """
+    from torch.utils.data import DataLoader
+
+    chunks = [indices[i:i + chunk_size] for i in range(0, len(indices), chunk_size)]
+    loader = DataLoader(chunks, batch_size=None, num_workers=num_workers,
+                        collate_fn=_ChunkExamples(dataset))
+    with tqdm(total=len(indices), desc=desc) as pbar:
+        for chunk in loader:
+            yield from chunk
+            pbar.update(len(chunk))
+
+
+class _ChunkCaching:
+    # not local for picklability, used only in _populate_cache
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __call__(self, indices):
+        for i in indices:
+            self.dataset._cache_example(int(i))
+        return len(indices)
+
+
+def _populate_cache(dataset, indices, num_workers=None, chunk_size=64, background=False):
+    """Caches examples of a read-through cache dataset in data loader worker
+    processes.
+
+    Args:
+        dataset: A dataset with a `_cache_example(idx)` method that computes
+            and stores the example with index `idx` if it is not cached yet.
+        indices: Indices of examples to be cached.
+        num_workers (int, optional): The number of worker processes. The
+            default is the number of CPUs.
+        chunk_size (int): The number of examples processed by a worker at once.
+        background (bool): If True, caching runs in a daemon thread, which is
+            returned, and the dataset can be used in the meantime. Examples
+            that are not cached yet are then loaded from the source dataset.
+    """
+    from torch.utils.data import DataLoader
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    chunks = [indices[i:i + chunk_size] for i in range(0, len(indices), chunk_size)]
+    loader = DataLoader(chunks, batch_size=None, num_workers=num_workers,
+                        collate_fn=_ChunkCaching(dataset))
+
+    def run():
+        for _ in tqdm(loader, total=len(chunks), disable=background,
+                      desc=f"Caching {dataset.data.identifier}"):
+            pass
+
+    if not background:
+        return run()
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
 def _split_on_common_prefix(strings):
     i = -1
     for i, (c, *others) in enumerate(zip(*strings)):
@@ -146,6 +245,17 @@ class Dataset(abc.Sequence):
     def get_example(self, idx):  # This can be overridden
         return self.data[idx]
 
+    def get_examples(self, indices):  # This can be overridden
+        """Returns a list of examples with the given indices.
+
+        The indices must be non-negative and smaller than the length of the
+        dataset. This can be overridden by datasets that can load multiple
+        examples more efficiently than one by one.
+        """
+        if type(self).get_example is Dataset.get_example:  # examples of `data` are not modified
+            return _get_examples(self.data, indices)
+        return [self.get_example(int(i)) for i in indices]
+
     def approx_example_size(self, sample_count=4):
         return pickle_sizeof([r for r in self.permute()[:sample_count]]) // sample_count
 
@@ -163,13 +273,23 @@ class Dataset(abc.Sequence):
         """
         return SampleDataset(self, length=length, replace=replace, seed=seed, **kwargs)
 
-    def cache(self, max_cache_size=np.inf, directory=None, chunk_size=100, **kwargs):
-        """Caches the dataset in RAM (partially or completely)."""
+    def cache(self, max_cache_size=np.inf, directory=None, chunk_size=100, *, max_bytes=None,
+              policy='lru', num_workers=0, **kwargs):
+        """Caches the dataset in RAM (partially or completely).
+
+        If `max_bytes` is provided, examples are cached when they are first
+        accessed in a shared-memory arena of the given size that is used by
+        all data loader workers (see `SharedRAMCacheDataset`). Otherwise, the
+        cache is filled on construction by `num_workers` worker processes.
+        """
+        if max_bytes is not None:
+            return SharedRAMCacheDataset(self, max_bytes, policy=policy, **kwargs)
         if directory is not None:
-            return HDDAndRAMCacheDataset(self, directory, chunk_size, **kwargs)
-        return CacheDataset(self, max_cache_size, **kwargs)
+            return HDDAndRAMCacheDataset(self, directory, chunk_size, num_workers=num_workers,
+                                         **kwargs)
+        return CacheDataset(self, max_cache_size, num_workers=num_workers, **kwargs)
 
-    def cache_hdd(self, directory, separate_fields=True, **kwargs):
+    def cache_hdd(self, directory, separate_fields=True, sharded=False, **kwargs):
         """Caches the dataset on the hard disk.
 
         It can be useful to automatically
@@ -180,8 +300,18 @@ class Dataset(abc.Sequence):
             directory: The directory in which cached datasets are to be stored.
             separate_fields: If True, record fileds are saved in separate files,
                 e.g. labels are stored separately from input examples.
-            **kwargs: additional arguments for the Dataset initializer.
+            sharded: If True, examples are packed into a few large shard files
+                and fixed-shape array fields are memory-mapped (see
+                `HDDShardedCacheDataset`). `separate_fields` is ignored then.
+                The sharded cache is built on construction (in parallel with
+                `num_workers=...`). Otherwise examples are cached when they are
+                first accessed, and `populate` can fill the cache in parallel.
+            **kwargs: additional arguments for the Dataset initializer or the
+                cache, e.g. `codec=dict(x='png', y='png')` for compression of
+                fields in a non-sharded cache (see `HDDCacheDataset`).
         """
+        if sharded:
+            return HDDShardedCacheDataset(self, directory, **kwargs)
         return HDDCacheDataset(self, directory, separate_fields, **kwargs)
 
     def info_cache_hdd(self, name_to_func, directory, **kwargs):
@@ -218,42 +348,98 @@ class Dataset(abc.Sequence):
         """ Collates examples of a batch dataset or a zip dataset. """
         return CollateDataset(self, collate_func, func_name=func_name, **kwargs)
 
-    def filter(self, predicate, *, func_name=None, progress_bar=None, **kwargs):
+    def filter(self, predicate, *, func_name=None, progress_bar=None, num_workers=0,
+               cache_dir=None, **kwargs):
         """
         Creates a dataset containing only the elements for which `func` evaluates
         to True.
+
+        See `filter_split_indices` for the description of `num_workers` and
+        `cache_dir`.
         """
-        indices = np.array(list(self.filter_indices(predicate, progress_bar=progress_bar)))
+        indices = self.filter_indices(predicate, progress_bar=progress_bar,
+                                      num_workers=num_workers, cache_dir=cache_dir,
+                                      func_name=func_name)
         func_name = func_name or f'{_subset_hash(indices):x}'
         return SubDataset(self, indices, modifiers=f'filter({func_name})', **kwargs)
 
-    def filter_indices(self, predicate, progress_bar=None):
+    def filter_indices(self, predicate, progress_bar=None, **kwargs):
         """
         Returns the indices of elements matching the predicate.
+
+        See `filter_split_indices` for the description of `kwargs`.
         """
-        if progress_bar:
-            return (i for i, d in enumerate(progress_bar(self)) if predicate(d))
-        return (i for i, d in enumerate(self) if predicate(d))
+        return self.filter_split_indices([predicate], progress_bar=progress_bar, **kwargs)[0]
 
-    def filter_split_indices(self, predicates, progress_bar=None):
+    def filter_split_indices(self, predicates, progress_bar=None, *, num_workers=0,
+                             chunk_size=256, cache_dir=None, func_name=None):
         """
         Splits the dataset indices into disjoint subsets matching predicates.
+
+        Each index is put into the subset of the first predicate that it
+        matches or, if it matches none of them, into the last subset.
+
+        Examples are evaluated in data loader worker processes in chunks of
+        consecutive indices. Only the indices are sent back, so lazy fields of
+        records that the predicates do not access are not evaluated.
+
+        Args:
+            predicates: A sequence of functions that accept an example and
+                return a boolean.
+            progress_bar (optional): A function that wraps an iterable, e.g.
+                `tqdm`. It is applied to chunk results.
+            num_workers (int): The number of worker processes. If it is 0,
+                the predicates are evaluated in the main process.
+            chunk_size (int): The number of examples processed by a worker at
+                once.
+            cache_dir (optional): A directory in which the result is stored
+                under the dataset identifier and `func_name` and from which it
+                is loaded in later calls.
+            func_name (str, optional): A name that identifies the predicates.
+                It is required if `cache_dir` is provided.
+
+        Returns:
+            A list of `len(predicates) + 1` arrays of indices.
         """
-        progress_bar = progress_bar or (lambda x: x)
-        indiceses = [[] for _ in range(len(predicates) + 1)]
-        for i, d in enumerate(progress_bar(self)):
-            for j, p in enumerate(predicates):
-                if p(d):
-                    indiceses[j].append(i)
-                    break
-                indiceses[-1].append(i)
+        from torch.utils.data import DataLoader
+
+        if cache_dir is not None:
+            if func_name is None:
+                raise ValueError("func_name is required for caching filtering results.")
+            cache_path = to_valid_path(Path(cache_dir) / self.identifier
+                                       / f"filter({func_name}).npz")
+            try:
+                with np.load(cache_path) as arrays:
+                    if len(arrays.files) == len(predicates) + 1:
+                        return [arrays[f'arr_{i}'] for i in range(len(arrays.files))]
+            except FileNotFoundError:
+                pass
+
+        chunks = [np.arange(i, min(i + chunk_size, len(self))) for i in
+                  range(0, len(self), chunk_size)]
+        chunk_groups = DataLoader(chunks, batch_size=None, num_workers=num_workers,
+                                  collate_fn=_ChunkPredicateGroups(self, predicates))
+        groups = np.concatenate([np.zeros(0, dtype=np.int32)]
+                                + list((progress_bar or (lambda x: x))(chunk_groups)))
+        indiceses = [np.flatnonzero(groups == j) for j in range(len(predicates) + 1)]
+
+        if cache_dir is not None:
+            os.makedirs(cache_path.parent, exist_ok=True)
+            create_file_atomic(cache_path, lambda file: np.savez(file, *indiceses))
         return indiceses
 
-    def filter_split(self, predicates, *, func_names=None, **kwargs):
+    def filter_split(self, predicates, *, func_names=None, num_workers=0, cache_dir=None,
+                     **kwargs):
         """
         Splits the dataset indices into disjoint subsets matching predicates.
+
+        See `filter_split_indices` for the description of `num_workers` and
+        `cache_dir`. If `cache_dir` is provided, `func_names` is required.
         """
-        indiceses = self.filter_split_indices(predicates)
+        cache_name = func_names if func_names is None or isinstance(func_names, str) else \
+            ','.join(func_names)
+        indiceses = self.filter_split_indices(predicates, num_workers=num_workers,
+                                              cache_dir=cache_dir, func_name=cache_name)
         func_names = func_names or [f'{_subset_hash(indices):x}' for indices in indiceses]
         if isinstance(func_names, str):
             func_names = [f"{func_names}_{i}" for i in range(len(predicates) + 1)]
@@ -317,6 +503,17 @@ class Dataset(abc.Sequence):
     def zip(self, *other, **kwargs):
         return ZipDataset([self] + list(other), **kwargs)
 
+    def fuse(self):
+        """Creates an equivalent dataset with shorter chains of wrappers.
+
+        A chain of index-remapping wrappers (`SubDataset`, `SubrangeDataset`,
+        `RepeatDataset`) and `MapDataset` wrappers is collapsed into a
+        `MapDataset` with a composed function over a `SubDataset` with a
+        composed array of indices. The identifier and modifiers of the dataset
+        are preserved.
+        """
+        return _fuse(self)
+
     def clear_hdd_cache(self):
         import inspect
         if hasattr(self, 'cache_dir'):
@@ -363,6 +560,20 @@ class FieldsMap:
         else:
             return type(r)(**{k: f(r[k]) for k, f in self.field_to_func.items()})
 
+    @property
+    def batched(self):
+        """A `FieldsMap` that applies the `batched` versions of the functions
+        to batches, or `None` if some function does not have one."""
+        if any(getattr(f, 'batched', None) is None for f in self.field_to_func.values()):
+            return None
+        return FieldsMap({k: f.batched for k, f in self.field_to_func.items()}, mode=self.mode)
+
+
+def _get_examples(data, indices):
+    if isinstance(data, Dataset):
+        return data.get_examples(indices)
+    return [data[int(i)] for i in indices]
+
 
 # Dataset wrappers and proxies
 
@@ -377,6 +588,9 @@ class MapDataset(Dataset):
     def get_example(self, idx):
         return self.func(self.data[idx])
 
+    def get_examples(self, indices):
+        return list(map(self.func, _get_examples(self.data, indices)))
+
 
 class EnumeratedDataset(Dataset):
     __slots__ = ("offset",)
@@ -402,6 +616,9 @@ class ZipDataset(Dataset):
     def get_example(self, idx):
         return tuple(d[idx] for d in self.data)
 
+    def get_examples(self, indices):
+        return list(zip(*[_get_examples(d, indices) for d in self.data]))
+
     def __len__(self):
         return len(self.data[0])
 
@@ -431,114 +648,547 @@ class CollateDataset(Dataset):
 class CacheDataset(Dataset):
     __slots__ = ("_cache_all", "_cached_data")
 
-    def __init__(self, dataset, max_cache_size=np.inf, **kwargs):
+    def __init__(self, dataset, max_cache_size=np.inf, num_workers=0, **kwargs):
         cache_size = min(len(dataset), max_cache_size)
         self._cache_all = cache_size == len(dataset)
         modifier = "cache" if self._cache_all else f"(0..{cache_size - 1})"
         super().__init__(modifiers=modifier, data=dataset, **kwargs)
         if self._cache_all:
             self._print("Caching whole dataset...")
-            self._cached_data = [x for x in tqdm(dataset)]
         else:
             self._print(
                 f"Caching {cache_size}/{len(dataset)} of the dataset in RAM...")
-            self._cached_data = [dataset[i] for i in trange(cache_size, desc="CacheDataset")]
+        self._cached_data = list(_iter_examples(dataset, np.arange(cache_size), num_workers,
+                                                desc="CacheDataset"))
 
     def get_example(self, idx):
         cache_hit = self._cache_all or idx < len(self._cached_data)
         return (self._cached_data if cache_hit else self.data)[idx]
 
+    def get_examples(self, indices):
+        cached_count = len(self._cached_data)
+        if self._cache_all:
+            return [self._cached_data[i] for i in indices]
+        missed = iter(_get_examples(self.data, [i for i in indices if i >= cached_count]))
+        return [self._cached_data[i] if i < cached_count else next(missed) for i in indices]
+
+
+class SharedRAMCacheDataset(Dataset):
+    """Caches examples in RAM when they are first accessed, within a byte
+    budget, in a shared-memory arena that is used by all processes forked
+    after its creation, e.g. by data loader workers.
+
+    Examples are pickled into pages of the arena, which is allocated lazily by
+    the operating system, so unused parts of the budget do not take memory.
+    If there are not enough free pages for a new example, cached examples are
+    evicted in the order of least recent access (`policy='lru'`) or of least
+    frequent access (`policy='lfu'`) until at least 1/32 of the arena is free.
+    With `policy='lfu'`, a new example is only admitted into a full cache if
+    it has been accessed more often than the least frequently accessed cached
+    example. This keeps a stable subset cached when the whole dataset is read
+    in each epoch and does not fit, where LRU gives few hits. Accesses and
+    metadata updates are synchronized with a lock. The hit rate and memory
+    usage are returned by `cache_stats`.
+
+    The arena cannot be pickled, so data loaders must use the "fork" start
+    method (the default on Linux).
+
+    Args:
+        dataset: The dataset to be cached.
+        max_bytes (int): The size of the arena.
+        policy (str): "lru" or "lfu".
+        page_size (int): The arena allocation unit in bytes.
+        **kwargs: additional arguments for the Dataset initializer.
+    """
+    __slots__ = ("max_bytes", "policy", "page_size", "_arena", "_pages", "_lock", "_first_page",
+                 "_sizes", "_keys", "_next_page", "_free_pages", "_state")
+    _CLOCK, _HITS, _MISSES, _EVICTIONS, _FREE = range(5)
+
+    def __init__(self, dataset, max_bytes, policy='lru', page_size=4096, **kwargs):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unknown cache policy {policy!r}. Use 'lru' or 'lfu'.")
+        super().__init__(modifiers="cache", data=dataset, **kwargs)
+        self.max_bytes, self.policy, self.page_size = int(max_bytes), policy, page_size
+        page_count = max(1, self.max_bytes // page_size)
+        self._arena = mmap.mmap(-1, page_count * page_size)  # anonymous and shared
+        self._pages = np.frombuffer(self._arena, dtype=np.uint8).reshape(page_count, page_size)
+        self._lock = multiprocessing.Lock()
+        self._first_page = to_shared_array(np.full(len(dataset), -1, dtype=np.int64))
+        self._sizes = to_shared_array(np.zeros(len(dataset), dtype=np.int64))
+        self._keys = to_shared_array(np.zeros(len(dataset), dtype=np.int64))
+        self._next_page = to_shared_array(np.full(page_count, -1, dtype=np.int64))
+        self._free_pages = to_shared_array(np.arange(page_count - 1, -1, -1, dtype=np.int64))
+        self._state = to_shared_array(np.array([0, 0, 0, 0, page_count], dtype=np.int64))
+
+    def _get_pages(self, page):
+        pages = []
+        while page >= 0:
+            pages.append(page)
+            page = self._next_page[page]
+        return pages
+
+    def _free(self, idx):
+        pages = self._get_pages(self._first_page[idx])
+        free = self._state[self._FREE]
+        self._free_pages[free:free + len(pages)] = pages
+        self._state[self._FREE] += len(pages)
+        self._first_page[idx] = -1
+        self._state[self._EVICTIONS] += 1
+
+    def _evict(self, page_count):
+        cached = np.flatnonzero(self._first_page >= 0)
+        for idx in cached[np.argsort(self._keys[cached], kind='stable')]:
+            self._free(idx)
+            if self._state[self._FREE] >= page_count:
+                break
+
+    def _store(self, idx, data, access_count=None):
+        # If `access_count` is `None`, the example is stored only if there are enough free pages.
+        ps = self.page_size
+        page_count = -(-len(data) // ps)
+        if page_count > len(self._pages):
+            return  # the example does not fit
+        with self._lock:
+            if self._first_page[idx] >= 0:  # stored by another process in the meantime
+                return
+            if self._state[self._FREE] < page_count:
+                if access_count is None or self.policy == 'lfu' \
+                        and access_count <= self._keys[self._first_page >= 0].min():
+                    return  # not admitted
+                self._evict(page_count + len(self._pages) // 32)
+            free = self._state[self._FREE] = self._state[self._FREE] - page_count
+            pages = self._free_pages[free:free + page_count][::-1].copy()
+            self._next_page[pages[:-1]], self._next_page[pages[-1]] = pages[1:], -1
+            full_size = (page_count - 1) * ps
+            data = np.frombuffer(data, dtype=np.uint8)
+            self._pages[pages[:-1]] = data[:full_size].reshape(-1, ps)
+            self._pages[pages[-1], :len(data) - full_size] = data[full_size:]
+            self._sizes[idx] = len(data)
+            self._first_page[idx] = pages[0]
+
+    def get_example(self, idx):
+        with self._lock:
+            access_count = self._keys[idx]  # only meaningful for LFU
+            if self.policy == 'lru':
+                self._state[self._CLOCK] += 1
+                self._keys[idx] = self._state[self._CLOCK]
+            else:
+                self._keys[idx] += 1
+            page = self._first_page[idx]
+            if page >= 0:
+                self._state[self._HITS] += 1
+                data = self._pages[self._get_pages(page)].reshape(-1)[:self._sizes[idx]]
+            else:
+                self._state[self._MISSES] += 1
+        if page >= 0:
+            return pickle.loads(data)
+        example = self.data[idx]
+        self._store(idx, pickle.dumps(example, protocol=4), access_count)  # 5 would give views
+        return example
+
+    def _cache_example(self, idx):
+        if self._first_page[idx] < 0 and self._state[self._FREE] > 0:
+            self._store(idx, pickle.dumps(self.data[idx], protocol=4))
+
+    def populate(self, num_workers=None, chunk_size=64, background=False):
+        """Caches examples that are not cached yet while there is free space in
+        data loader worker processes, possibly in the background while the
+        dataset is used (see `_populate_cache`). Nothing is evicted."""
+        return _populate_cache(self, np.flatnonzero(self._first_page < 0),
+                               num_workers=num_workers, chunk_size=chunk_size,
+                               background=background)
+
+    def cache_stats(self):
+        """Returns a dictionary with the numbers of cache hits, misses and
+        evictions, the hit rate, the number of cached examples and the numbers
+        of used and available bytes."""
+        with self._lock:
+            clock, hits, misses, evictions, free = self._state.tolist()
+            cached_count = int(np.count_nonzero(self._first_page >= 0))
+        accesses = hits + misses
+        return dict(hits=hits, misses=misses, evictions=evictions,
+                    hit_rate=hits / accesses if accesses else 0.,
+                    cached_count=cached_count,
+                    used_bytes=(len(self._pages) - free) * self.page_size,
+                    max_bytes=len(self._pages) * self.page_size)
+
 
 class HDDAndRAMCacheDataset(Dataset):
-    # Caches the whole dataset both on HDD and RAM
-    __slots__ = ("cache_dir",)
+    """Caches the whole dataset both on HDD and RAM.
+
+    Examples are pickled in chunks of `chunk_size` examples into a single
+    file. While the cache is being built, chunks are appended to a partial
+    file, so that an interrupted build continues after the last stored chunk.
+    Examples are loaded by `num_workers` worker processes. If `codec` is
+    provided (see `vidlu.data.misc.get_codec`), examples are encoded with it
+    in the file, whose name then includes the codec.
+    """
+    __slots__ = ("cache_dir", "codec")
 
-    def __init__(self, dataset, cache_dir, chunk_size=100, **kwargs):
+    def __init__(self, dataset, cache_dir, chunk_size=100, num_workers=0, codec=None, **kwargs):
+        super().__init__(modifiers="cache_hdd_ram", info=dataset.info, data=dataset, **kwargs)
         self.cache_dir = cache_dir
+        self.codec = None if codec is None else get_codec(codec)
         os.makedirs(cache_dir, exist_ok=True)
-        cache_path = f"{cache_dir}/{self.identifier}.p"
+        cache_path = f"{cache_dir}/{self.identifier}.p" if codec is None else \
+            str(to_valid_path(f"{cache_dir}/{self.identifier}.{self.codec}.p"))
         data = None
         if os.path.exists(cache_path):
             try:
                 self._print("Loading dataset cache from HDD...")
-                with open(cache_path, 'rb') as f:
-                    n = (len(dataset) - 1) // chunk_size + 1  # ceil
-                    chunks = [pickle.load(f)
-                              for _ in trange(n, desc="Loading dataset cache from HDD")]
-                    data = list(itertools.chain(*chunks))
+                data = self._load_chunks(cache_path, len(dataset), codec=self.codec)[0]
+                if len(data) != len(dataset):
+                    raise EOFError(f"The cache contains {len(data)} instead of {len(dataset)}"
+                                   + " examples.")
             except Exception as e:
+                data = None
                 self._print(e)
                 self._print("Removing invalid HDD-cached dataset...")
                 os.remove(cache_path)
         if data is None:
-            self._print(f"Caching whole dataset in RAM...")
-            data = [x for x in tqdm(dataset, desc="Caching whole dataset in RAM")]
+            data = self._build(dataset, cache_path, chunk_size, num_workers)
+        self.data = data
 
-            self._print("Saving dataset cache to HDD...")
+    @staticmethod
+    def _load_chunks(path, max_length, strict=True, codec=None):
+        data, pos = [], 0
+        with open(path, 'rb') as f, tqdm(total=max_length, desc="Loading dataset cache") as pbar:
+            while len(data) < max_length:
+                try:
+                    chunk = pickle.load(f)
+                except Exception:
+                    if strict:
+                        raise
+                    break  # the last chunk of a partial cache can be incomplete
+                data.extend(chunk if codec is None else map(codec.decode, chunk))
+                pbar.update(len(chunk))
+                pos = f.tell()
+        return data, pos
+
+    def _build(self, dataset, cache_path, chunk_size, num_workers):
+        partial_path = cache_path + '.partial'
+        data, pos = [], 0
+        if os.path.exists(partial_path):
+            data, pos = self._load_chunks(partial_path, len(dataset), strict=False,
+                                          codec=self.codec)
+            self._print(f"Resuming caching after {len(data)} cached examples...")
+        else:
+            self._print(f"Caching whole dataset in RAM and on HDD...")
+        with open(partial_path, 'r+b' if os.path.exists(partial_path) else 'wb') as f:
+            f.truncate(pos)
+            f.seek(pos)
+            chunk = []
+            # examples pickled in chunks because of memory constraints
+            for x in _iter_examples(dataset, np.arange(len(data), len(dataset)), num_workers,
+                                    chunk_size=min(chunk_size, 64),
+                                    desc="Caching whole dataset in RAM and on HDD"):
+                data.append(x)
+                chunk.append(x)
+                if len(chunk) == chunk_size or len(data) == len(dataset):
+                    pickle.dump(chunk if self.codec is None else
+                                list(map(self.codec.encode, chunk)), f, protocol=4)
+                    f.flush()
+                    chunk = []
+        os.replace(partial_path, cache_path)
+        return data
+
+
+@functools.lru_cache(maxsize=None)
+def _get_source(code_or_class):
+    try:
+        return inspect.getsource(code_or_class)
+    except (OSError, TypeError):  # e.g. defined in an interactive session or built-in
+        return None
+
+
+def _update_code_fingerprint(h, code):
+    source = _get_source(code)
+    if source is not None:
+        h.update(source.encode())
+    else:
+        h.update(code.co_code)
+        for c in code.co_consts:
+            if isinstance(c, types.CodeType):
+                _update_code_fingerprint(h, c)
+            else:
+                h.update(repr(c).encode())
+
+
+def _update_fingerprint(h, obj, depth, visited):
+    """Adds the content of `obj` to the hash object `h`.
+
+    Functions are represented by their qualified names, source code (or
+    bytecode if the source is not available), default arguments and closure
+    variables, and other objects by their types and attributes. Deeper than
+    `depth` levels of nesting, only types are hashed. Nesting of datasets
+    does not count, so that whole pipelines are covered.
+    """
+    t = type(obj)
+    h.update(f"<{t.__module__}.{t.__qualname__}>".encode())
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes, np.generic)):
+        h.update(repr(obj).encode())
+        return
+    if isinstance(obj, PurePath):  # attributes are computed lazily
+        h.update(str(obj).encode())
+        return
+    if isinstance(obj, (types.ModuleType, types.BuiltinFunctionType, np.ufunc)):
+        h.update(getattr(obj, '__qualname__', obj.__name__).encode())
+        return
+    if isinstance(obj, torch.Tensor) and not obj.is_cuda:
+        obj = obj.detach().numpy()
+    if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+        h.update(f"{obj.dtype.str}{obj.shape}".encode())
+        h.update(np.ascontiguousarray(obj).data)
+        return
+    if depth <= 0 or id(obj) in visited:
+        return
+    visited = visited | {id(obj)}
+    update = lambda x: _update_fingerprint(h, x, depth - 1, visited)
+    if isinstance(obj, Dataset):
+        update = lambda x: _update_fingerprint(h, x, depth, visited)  # datasets are not counted
+        h.update(f"{obj.identifier}[{len(obj)}]".encode())
+        update(_get_source(t))
+        subclasses = itertools.takewhile(lambda c: c is not Dataset, t.__mro__)
+        for k in sorted(set(itertools.chain(*(getattr(c, '__slots__', ()) for c in subclasses),
+                                            getattr(obj, '__dict__', ())))):
+            # functions, e.g. of maps, determine the behaviour of wrappers
+            v = getattr(obj, k, None)
+            if callable(v) and not isinstance(v, (Dataset, type)):
+                update(k)
+                update(v)
+        data = obj.data.datasets if isinstance(obj.data, ConcatDataset) else obj.data
+        if isinstance(data, Dataset):
+            update(data)
+        elif isinstance(data, (list, tuple)) and all(isinstance(d, Dataset) for d in data):
+            h.update(f"<{type(data).__module__}.{type(data).__qualname__}>".encode())
+            for d in data:
+                update(d)
+    elif isinstance(obj, type):
+        h.update(f"{obj.__module__}.{obj.__qualname__}".encode())
+        update(_get_source(obj))
+    elif isinstance(obj, types.FunctionType):
+        h.update(f"{obj.__module__}.{obj.__qualname__}".encode())
+        _update_code_fingerprint(h, obj.__code__)
+        update(obj.__defaults__)
+        update(obj.__kwdefaults__)
+        for cell in obj.__closure__ or ():
+            try:
+                update(cell.cell_contents)
+            except ValueError:  # empty cell
+                pass
+    elif isinstance(obj, types.MethodType):
+        update(obj.__func__)
+        update(obj.__self__)
+    elif isinstance(obj, functools.partial):
+        update(obj.func)
+        update(obj.args)
+        update(obj.keywords)
+    elif isinstance(obj, (list, tuple)):
+        for x in obj:
+            update(x)
+    elif isinstance(obj, (set, frozenset)):
+        for x in sorted(_get_fingerprint(x, depth - 1) for x in obj):
+            h.update(x.encode())
+    elif isinstance(obj, abc.Mapping):
+        for k, v in obj.items():
+            update(k)
+            update(v)
+    else:
+        update(_get_source(t))
+        slots = itertools.chain(*(getattr(c, '__slots__', ()) for c in t.__mro__))
+        attrs = {k: getattr(obj, k) for k in slots if hasattr(obj, k)}
+        attrs.update(getattr(obj, '__dict__', {}))
+        update(attrs)
 
-            def to_chunks(data):
-                chunk = []
-                for x in data:
-                    chunk.append(x)
-                    if len(chunk) >= chunk_size:
-                        yield chunk
-                        chunk = []
-                yield chunk
 
-            with open(cache_path, 'wb') as f:
-                # examples pickled in chunks because of memory constraints
-                for x in tqdm(to_chunks(data), desc="Saving dataset cache to HDD"):
-                    pickle.dump(x, f, protocol=4)
-        super().__init__(modifiers="cache_hdd_ram", info=dataset.info, data=data, **kwargs)
+def _get_fingerprint(obj, depth=8):
+    """Returns a hexadecimal digest that changes when the code or arguments
+    that determine `obj` change. For a dataset, it covers the whole
+    pipeline: identifiers (with modifier arguments), lengths and classes of
+    all datasets and the functions of wrappers, e.g. maps."""
+    h = hashlib.sha1()
+    _update_fingerprint(h, obj, depth, frozenset())
+    return h.hexdigest()
 
 
 class HDDCacheDataset(Dataset):
-    # Caches the whole dataset on HDD
-    __slots__ = ('cache_dir', 'separate_fields', 'keys')
+    """Caches examples on the hard disk when they are first accessed.
+
+    Examples (or their fields if `separate_fields` is True) are stored in
+    pickle files in a directory named by the identifier. The directory has a
+    manifest with the fingerprint of the pipeline of the source dataset (see
+    `_get_fingerprint`), which is compared on construction, so that a stale
+    cache is detected and deleted without computing examples. Stored entries
+    are appended to a log together with their sizes and CRC-32 checksums,
+    which are checked when entries are loaded and give the size of the cache
+    (`cached_size`) without listing the directory.
+
+    Args:
+        dataset: The source dataset.
+        cache_dir: The directory in which cache directories are created.
+        separate_fields: If True, record fields are stored in separate files.
+        codec: The codec of stored values, e.g. "zlib" or a mapping from
+            fields to codecs like `dict(x='png', y='png')` (see
+            `vidlu.data.misc.get_codec`). The default is pickle without
+            compression.
+        consistency_check_sample_count: The number of examples that are
+            compared with examples of the source dataset on construction. This
+            can detect changes not covered by the fingerprint, e.g. of data
+            files.
+    """
+    __slots__ = ('cache_dir', 'separate_fields', 'codec', 'keys', 'fingerprint', '_entries',
+                 '_entries_offset')
+    _manifest_version = 1
 
-    def __init__(self, dataset, cache_dir, separate_fields=True, consistency_check_sample_count=4,
-                 **kwargs):
+    def __init__(self, dataset, cache_dir, separate_fields=True, consistency_check_sample_count=0,
+                 codec=None, **kwargs):
         modifier = 'cache_hdd' + ('_s' if separate_fields else '')
         super().__init__(modifiers=modifier, data=dataset, **kwargs)
         self.cache_dir = to_valid_path(Path(cache_dir) / self.identifier)
         self.separate_fields = separate_fields
+        self.codec = get_codec(codec)
+        self.keys = None
+        self.fingerprint = _get_fingerprint(dataset)
+        self._entries, self._entries_offset = dict(), 0
         if len(dataset) == 0:
             warnings.warn(f"The dataset {dataset} is empty.")
             return
-        if separate_fields:
-            if not isinstance(dataset[0], Record):
-                raise ValueError(
-                    f"If `separate_fields == True`, the element type must be `Record`.")
-            self.keys = list(self.data[0].keys())
-        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = self._load_manifest()
+        if manifest is not None:
+            self.keys = manifest['keys']
+        else:
+            if separate_fields:
+                if not isinstance(dataset[0], Record):
+                    raise ValueError(
+                        f"If `separate_fields == True`, the element type must be `Record`.")
+                self.keys = list(self.data[0].keys())
+            self._create_manifest()
         for i in range(consistency_check_sample_count):
             ii = i * len(dataset) // consistency_check_sample_count
             if pickle.dumps(dataset[ii]) != pickle.dumps(self[ii]):
                 warnings.warn(f"Cache of the dataset {self.identifier} inconsistent." +
                               " Deleting old and creating new cache.")
                 self.delete_cache()
-                os.makedirs(self.cache_dir, exist_ok=False)
+                self._create_manifest()
                 break
 
+    def _get_manifest_header(self):
+        return dict(version=self._manifest_version, fingerprint=self.fingerprint,
+                    length=len(self.data), separate_fields=self.separate_fields,
+                    codec=str(self.codec))
+
+    def _load_manifest(self):
+        """Returns the manifest if it matches the source dataset. Otherwise,
+        the cache is deleted."""
+        if not self.cache_dir.exists():
+            return None
+        try:
+            with open(self.cache_dir / 'manifest.p', 'rb') as file:
+                manifest = pickle.load(file)
+            if all(manifest.get(k) == v for k, v in self._get_manifest_header().items()):
+                return manifest
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass  # missing or corrupt
+        warnings.warn(f"Cache of the dataset {self.identifier} is stale or has no manifest."
+                      + " Deleting old and creating new cache.")
+        self.delete_cache()
+        return None
+
+    def _create_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = dict(self._get_manifest_header(), keys=self.keys)
+        create_file_atomic(self.cache_dir / 'manifest.p',
+                           lambda file: pickle.dump(manifest, file, protocol=4))
+
+    def _read_entries(self):
+        """Reads entries that have been appended to the log since the last
+        call, possibly by other processes."""
+        try:
+            with open(self.cache_dir / 'entries.txt', 'rb') as file:
+                file.seek(self._entries_offset)
+                data = file.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b'\n') + 1  # the last line can be incomplete
+        for line in data[:end].decode().splitlines():
+            name, size, checksum = line.split()
+            self._entries[name] = (int(size), int(checksum, 16))
+        self._entries_offset += end
+
+    def cached_size(self):
+        """Returns the total size of the stored entries in bytes."""
+        self._read_entries()
+        return sum(size for size, _ in self._entries.values())
+
     def _get_cache_path(self, idx, field=None):
         path = f"{self.cache_dir}/{idx}"
         return f"{path}_{field}.p" if field else path + '.p'
 
+    def _get_codec(self, field):
+        return self.codec if field is None else self.codec.for_field(field)
+
+    def _load(self, cache_path, field=None):
+        """Returns the value of an entry or raises `KeyError` if it is missing
+        or its size or checksum does not match the log."""
+        try:
+            with open(cache_path, 'rb') as cache_file:
+                data = cache_file.read()
+        except FileNotFoundError:
+            raise KeyError(cache_path)
+        name, entry = os.path.basename(cache_path), (len(data), zlib.crc32(data))
+        if self._entries.get(name) != entry:
+            self._read_entries()
+            if self._entries.get(name) != entry:
+                raise KeyError(cache_path)
+        return self._get_codec(field).decode(data)
+
     def _get_example_or_field(self, idx, field=None):
         cache_path = self._get_cache_path(idx, field)
-        if os.path.exists(cache_path):
-            try:
-                with open(cache_path, 'rb') as cache_file:
-                    return pickle.load(cache_file)
-            except (PermissionError, TypeError, EOFError):
-                os.remove(cache_path)
+        try:
+            return self._load(cache_path, field)
+        except (KeyError, PermissionError, TypeError, EOFError, pickle.UnpicklingError):
+            pass  # missing or corrupt, replaced below
         example = self.data[idx]
         if field is not None:
             example = example[field]
-        with open(cache_path, 'wb') as cache_file:
-            pickle.dump(example, cache_file, protocol=4)
+        self._store(cache_path, example, field)
         return example
 
+    def _store(self, cache_path, value, field=None):
+        # atomic, so that readers and concurrent writers never see incomplete files
+        data = self._get_codec(field).encode(value)
+        create_file_atomic(cache_path, lambda file: file.write(data))
+        # appending a short line with a single write is atomic, so lines are not interleaved
+        with open(self.cache_dir / 'entries.txt', 'ab') as file:
+            file.write(f"{os.path.basename(cache_path)} {len(data)} {zlib.crc32(data):08x}\n"
+                       .encode())
+
+    def _cache_example(self, idx):
+        self._read_entries()
+        paths = {k: self._get_cache_path(idx, k)
+                 for k in (self.keys if self.separate_fields else [None])}
+        paths = {k: path for k, path in paths.items()
+                 if os.path.basename(path) not in self._entries}
+        if len(paths) > 0:
+            example = self.data[idx]
+            for k, path in paths.items():
+                self._store(path, example if k is None else example[k], k)
+
+    def _get_uncached_indices(self):
+        self._read_entries()
+        names = [f"_{k}.p" for k in self.keys] if self.separate_fields else [".p"]
+        return np.array([i for i in range(len(self))
+                         if any(f"{i}{name}" not in self._entries for name in names)],
+                        dtype=np.int64)
+
+    def populate(self, num_workers=None, chunk_size=64, background=False):
+        """Caches all examples that are not cached yet in data loader worker
+        processes, possibly in the background while the dataset is used (see
+        `_populate_cache`). An interrupted run can be continued by calling this
+        again."""
+        return _populate_cache(self, self._get_uncached_indices(), num_workers=num_workers,
+                               chunk_size=chunk_size, background=background)
+
     def get_example(self, idx):
         if self.separate_fields:  # TODO: improve for small non-lazy fields
             return Record({f"{k}_": (lambda k_: lambda: self._get_example_or_field(idx, k_))(k)
@@ -547,6 +1197,248 @@ class HDDCacheDataset(Dataset):
 
     def delete_cache(self):
         shutil.rmtree(self.cache_dir)
+        self._entries, self._entries_offset = dict(), 0
+
+
+_ArraySpec = T.NamedTuple('_ArraySpec', [('kind', str), ('dtype', str), ('shape', tuple),
+                                          ('fortran', bool)])
+
+
+def _get_array_spec(value):
+    if isinstance(value, torch.Tensor):
+        if value.requires_grad or value.is_cuda:
+            return None
+        kind, value = 'torch', value.numpy()
+    elif type(value) is np.ndarray:
+        kind = 'numpy'
+    else:
+        return None
+    if value.dtype.hasobject:
+        return None
+    fortran = value.flags.f_contiguous and not value.flags.c_contiguous
+    return _ArraySpec(kind, value.dtype.str, value.shape, fortran)
+
+
+def _examples_equal(a, b):
+    # pickle.dumps does not produce the same output for equal tensors
+    if isinstance(a, torch.Tensor):
+        a = a.detach().cpu().numpy()
+        b = b.detach().cpu().numpy() if isinstance(b, torch.Tensor) else None
+    if isinstance(a, np.ndarray):
+        return (isinstance(b, np.ndarray) and a.dtype == b.dtype
+                and np.array_equal(a, b, equal_nan=a.dtype.kind in 'fc'))
+    if isinstance(a, (Record, dict)):
+        return (type(a) is type(b) and list(a.keys()) == list(b.keys())
+                and all(_examples_equal(a[k], b[k]) for k in a.keys()))
+    if isinstance(a, (list, tuple)):
+        return (type(a) is type(b) and len(a) == len(b)
+                and all(_examples_equal(x, y) for x, y in zip(a, b)))
+    return pickle.dumps(a) == pickle.dumps(b)
+
+
+def _array_to_value(spec, array):
+    array = np.array(array, order='F' if spec.fortran else 'C')
+    return torch.from_numpy(array) if spec.kind == 'torch' else array
+
+
+@functools.lru_cache(maxsize=256)
+def _open_memmap(path):
+    # Memory maps are opened once per process and shared by all dataset objects referring to the
+    # same files. Forked DataLoader workers inherit them.
+    return np.load(path, mmap_mode='r') if path.endswith('.npy') \
+        else np.memmap(path, dtype=np.uint8, mode='r')
+
+
+class HDDShardedCacheDataset(Dataset):
+    """Caches the whole dataset on HDD in a small number of large files.
+
+    Fields that are fixed-shape arrays (`np.ndarray` or `torch.Tensor` with the
+    shape and dtype of the field in the first example) are stored in one
+    memory-mapped `.npy` file per field. Other fields, and array fields of
+    examples that do not match, are pickled into shard files with `shard_size`
+    consecutive examples each, and located through an offset index. Reading an
+    example requires no opening of files, unlike with `HDDCacheDataset`, which
+    stores every example (or field) in a separate file.
+
+    The cache is built completely on construction if it does not exist.
+    Examples are loaded by `num_workers` worker processes and written in index
+    order. Each shard is completed atomically, so that an interrupted build
+    continues from the first incomplete shard.
+    """
+    __slots__ = ('cache_dir', 'shard_size', '_keys', '_array_specs', '_array_paths')
+
+    def __init__(self, dataset, cache_dir, shard_size=4096, consistency_check_sample_count=4,
+                 num_workers=0, **kwargs):
+        super().__init__(modifiers='cache_hdd_sharded', data=dataset, **kwargs)
+        self.cache_dir = to_valid_path(Path(cache_dir) / self.identifier)
+        self.shard_size = shard_size
+        if len(dataset) == 0:
+            warnings.warn(f"The dataset {dataset} is empty.")
+            return
+        meta = self._load_meta(self._meta_path())
+        resume = True
+        if meta is not None:
+            self._set_meta(meta)
+            if not self._is_consistent(consistency_check_sample_count):
+                warnings.warn(f"Cache of the dataset {self.identifier} inconsistent." +
+                              " Deleting old and creating new cache.")
+                meta, resume = None, False
+        if meta is None:
+            self._set_meta(self._build(num_workers, resume=resume))
+
+    def _meta_path(self):
+        return self.cache_dir / 'meta.p'
+
+    def _build_meta_path(self):  # exists while the cache is being built
+        return self.cache_dir / 'build_meta.p'
+
+    def _index_path(self):
+        return f'{self.cache_dir}/index.npy'
+
+    def _shard_index_path(self, shard_idx):  # exists while the cache is being built
+        return f'{self.cache_dir}/index_{shard_idx}.npy'
+
+    def _array_path(self, field):
+        return f'{self.cache_dir}/{field}.npy'
+
+    def _shard_path(self, shard_idx):
+        return f'{self.cache_dir}/shard_{shard_idx}.bin'
+
+    def _load_meta(self, path):
+        if not path.exists():
+            return None
+        try:
+            with path.open('rb') as file:
+                meta = pickle.load(file)
+        except (PermissionError, TypeError, EOFError, pickle.UnpicklingError):
+            return None
+        return meta if meta['length'] == len(self.data) else None
+
+    def _set_meta(self, meta):
+        self.shard_size = meta['shard_size']
+        self._keys, self._array_specs = meta['keys'], meta['array_specs']
+        self._array_paths = {k: self._array_path(k) for k in self._array_specs}
+
+    def _is_consistent(self, sample_count):
+        return all(_examples_equal(self.data[ii], self[ii])
+                   for ii in (i * len(self.data) // sample_count for i in range(sample_count)))
+
+    def _start_build(self):
+        dataset = self.data
+        if self.cache_dir.exists():
+            self.delete_cache()
+        os.makedirs(self.cache_dir)
+
+        first = dataset[0]
+        keys = list(first.keys()) if isinstance(first, Record) else [None]
+        specs = {k: _get_array_spec(first[k] if k is not None else first) for k in keys}
+        specs = {k: spec for k, spec in specs.items() if spec is not None}
+        for k, spec in specs.items():
+            np.lib.format.open_memmap(self._array_path(k), mode='w+', dtype=spec.dtype,
+                                      shape=(len(dataset), *spec.shape))
+        meta = dict(length=len(dataset), keys=keys, array_specs=specs, shard_size=self.shard_size)
+        create_file_atomic(self._build_meta_path(),
+                           lambda file: pickle.dump(meta, file, protocol=4))
+        return meta
+
+    def _build(self, num_workers=0, resume=True):
+        dataset = self.data
+        n = len(dataset)
+        meta = self._load_meta(self._build_meta_path()) if resume else None
+        if meta is None:
+            meta = self._start_build()
+        shard_size, keys, specs = meta['shard_size'], meta['keys'], meta['array_specs']
+        shard_count = (n - 1) // shard_size + 1
+        arrays = {k: np.load(self._array_path(k), mmap_mode='r+') for k in specs}
+
+        todo = [s for s in range(shard_count) if not os.path.exists(self._shard_index_path(s))]
+        if len(todo) < shard_count:
+            self._print(f"Resuming caching with {shard_count - len(todo)}/{shard_count} shards"
+                        + " cached...")
+        indices = np.array([i for s in todo for i in range(s * shard_size,
+                                                            min((s + 1) * shard_size, n))],
+                           dtype=np.int64)
+        examples = _iter_examples(dataset, indices, num_workers=num_workers,
+                                  chunk_size=min(shard_size, 64),
+                                  desc=f"Caching {self.data.identifier} in shards")
+        for s in todo:
+            start, stop = s * shard_size, min((s + 1) * shard_size, n)
+            shard_index = np.zeros((stop - start, len(keys), 2), dtype=np.uint64)
+
+            def write_shard(shard_file):
+                pos = 0
+                for i in range(start, stop):
+                    example = next(examples)
+                    for j, k in enumerate(keys):
+                        value = example if k is None else example[k]
+                        if k in specs and _get_array_spec(value) == specs[k]:
+                            arrays[k][i] = value.numpy() if specs[k].kind == 'torch' else value
+                        else:
+                            data = pickle.dumps(value, protocol=4)
+                            shard_file.write(data)
+                            shard_index[i - start, j] = pos, pos + len(data)
+                            pos += len(data)
+
+            create_file_atomic(self._shard_path(s), write_shard)
+            for array in arrays.values():
+                array.flush()
+            # the shard index is written last and marks the shard as complete
+            create_file_atomic(self._shard_index_path(s),
+                               lambda file: np.save(file, shard_index))
+        examples.close()
+        del arrays
+
+        index = np.concatenate([np.load(self._shard_index_path(s)) for s in range(shard_count)])
+        np.save(self._index_path(), index)
+        create_file_atomic(self._meta_path(), lambda file: pickle.dump(meta, file, protocol=4))
+        for s in range(shard_count):
+            os.remove(self._shard_index_path(s))
+        os.remove(self._build_meta_path())
+        return meta
+
+    def _get_field(self, idx, field_idx):
+        field = self._keys[field_idx]
+        start, stop = map(int, _open_memmap(self._index_path())[idx, field_idx])
+        if stop > start:
+            shard = _open_memmap(self._shard_path(idx // self.shard_size))
+            return pickle.loads(shard[start:stop])
+        return _array_to_value(self._array_specs[field], _open_memmap(self._array_paths[field])[idx])
+
+    def get_example(self, idx):
+        if self._keys == [None]:
+            return self._get_field(idx, 0)
+        return Record({f"{k}_": (lambda j: lambda: self._get_field(idx, j))(j)
+                       for j, k in enumerate(self._keys)})
+
+    def get_examples(self, indices):
+        """Reads all fields of the examples with sorted reads from the memory
+        maps."""
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind='stable')
+        sorted_indices = indices[order]
+        index = _open_memmap(self._index_path())[sorted_indices]
+        columns = []
+        for j, k in enumerate(self._keys):
+            array = (_open_memmap(self._array_paths[k])[sorted_indices] if k in self._array_specs
+                     else None)
+            column = []
+            for i, (idx, (start, stop)) in enumerate(zip(sorted_indices, index[:, j].tolist())):
+                if stop > start:
+                    shard = _open_memmap(self._shard_path(idx // self.shard_size))
+                    column.append(pickle.loads(shard[start:stop]))
+                else:
+                    column.append(_array_to_value(self._array_specs[k], array[i]))
+            columns.append(column)
+        examples = (columns[0] if self._keys == [None] else
+                    [Record(zip(self._keys, values)) for values in zip(*columns)])
+        result = [None] * len(indices)
+        for i, example in zip(order.tolist(), examples):
+            result[i] = example
+        return result
+
+    def delete_cache(self):
+        _open_memmap.cache_clear()
+        shutil.rmtree(self.cache_dir)
 
 
 class InfoCacheDataset(Dataset):  # TODO
@@ -592,6 +1484,10 @@ class InfoCacheDataset(Dataset):  # TODO
 
 
 class HDDInfoCacheDataset(InfoCacheDataset):  # TODO
+    """An `InfoCacheDataset` that stores the computed values on the hard disk
+    together with the fingerprint of the source dataset and the functions (see
+    `_get_fingerprint`). Stored values are recomputed if it does not match."""
+
     def __init__(self, dataset, name_to_func, cache_dir, **kwargs):
         super().__init__(dataset, name_to_func, **kwargs)
         self.cache_dir = Path(cache_dir)
@@ -599,22 +1495,26 @@ class HDDInfoCacheDataset(InfoCacheDataset):  # TODO
         self.cache_file.parent.mkdir(parents=True, exist_ok=True)
 
     def _get_info_cache(self):
+        fingerprint = _get_fingerprint((self.data, self.name_to_func))
         if self.cache_file.exists():
             try:  # load
                 with self.cache_file.open('rb') as file:
-                    return pickle.load(file)
-            except (PermissionError, TypeError):
+                    stored = pickle.load(file)
+                if isinstance(stored, tuple) and stored[0] == fingerprint:
+                    return stored[1]
+            except (PermissionError, TypeError, EOFError, pickle.UnpicklingError):
+                pass  # corrupt, replaced below
+            self._logger.info(f"{type(self).__name__}: the stored {self.names_str} for"
+                              + f" {self.data.identifier} are stale")
+        info_cache = super()._get_info_cache()
+        try:  # store
+            create_file_atomic(self.cache_file, lambda file: pickle.dump(
+                (fingerprint, info_cache), file, protocol=4))
+        except (PermissionError, TypeError):
+            if self.cache_file.exists():
                 self.cache_file.unlink()
-                raise
-        else:
-            info_cache = super()._get_info_cache()
-            try:  # store
-                with self.cache_file.open('wb') as file:
-                    pickle.dump(info_cache, file)
-            except (PermissionError, TypeError):
-                self.cache_file.unlink()
-                raise
-            return info_cache
+            raise
+        return info_cache
 
 
 class SubDataset(Dataset):
@@ -636,7 +1536,10 @@ class SubDataset(Dataset):
         super().__init__(data=dataset, **kwargs)
 
     def get_example(self, idx):
-        return self.data[self._get_index(idx)]
+        return self.data[int(self._get_index(idx))]  # int avoids overflows of compressed indices
+
+    def get_examples(self, indices):
+        return _get_examples(self.data, _get_index_map(self)(np.asarray(indices, dtype=np.int64)))
 
     def __len__(self):
         return self._len
@@ -655,6 +1558,9 @@ class SubrangeDataset(Dataset):
     def get_example(self, idx):
         return self.data[self.start + self.step * idx]
 
+    def get_examples(self, indices):
+        return _get_examples(self.data, _get_index_map(self)(np.asarray(indices, dtype=np.int64)))
+
     def __len__(self):
         return self._len
 
@@ -669,6 +1575,9 @@ class RepeatDataset(Dataset):
     def get_example(self, idx):
         return self.data[idx % len(self.data)]
 
+    def get_examples(self, indices):
+        return _get_examples(self.data, _get_index_map(self)(np.asarray(indices, dtype=np.int64)))
+
     def __len__(self):
         return len(self.data) * self.number_of_repeats
 
@@ -740,3 +1649,88 @@ class BatchDataset(Dataset):
 
     def __len__(self):
         return self._length
+
+
+# Wrapper chain fusion
+
+class _Composition:
+    """A picklable composition of functions that are applied from left to
+    right."""
+    __slots__ = ("funcs",)
+
+    def __init__(self, *funcs):
+        self.funcs = funcs
+
+    def __call__(self, x):
+        for f in self.funcs:
+            x = f(x)
+        return x
+
+    @property
+    def batched(self):
+        funcs = [getattr(f, 'batched', None) for f in self.funcs]
+        return None if any(f is None for f in funcs) else _Composition(*funcs)
+
+
+def _compose_maps(f, g):
+    """Returns a function equivalent to applying `f` and then `g`."""
+    if type(f) is type(g) is FieldsMap and f.mode == g.mode == 'override':
+        field_to_func = dict(f.field_to_func)
+        for k, g_k in g.field_to_func.items():
+            field_to_func[k] = _Composition(field_to_func[k], g_k) if k in field_to_func else g_k
+        return FieldsMap(field_to_func)
+    return _Composition(*(f.funcs if type(f) is _Composition else [f]),
+                        *(g.funcs if type(g) is _Composition else [g]))
+
+
+def _get_index_map(dataset):
+    """Returns a function that maps (arrays of) indices of an index-remapping
+    wrapper to indices of the wrapped dataset, or `None` for other datasets."""
+    if type(dataset) is SubDataset:  # compressed indices are converted to avoid overflows
+        return lambda i, get_index=dataset._get_index: np.asarray(get_index(i), dtype=np.int64)
+    elif type(dataset) is SubrangeDataset:
+        return lambda i, start=dataset.start, step=dataset.step: start + step * i
+    elif type(dataset) is RepeatDataset:
+        return lambda i, n=len(dataset.data): i % n
+    return None
+
+
+def _with_data(dataset, data):
+    if data is dataset.data:
+        return dataset
+    result = copy.copy(dataset)
+    result.data = data
+    return result
+
+
+def _fuse(dataset):
+    # Maps are applied to single examples and do not depend on indices, so they can be moved
+    # above index-remapping wrappers. A chain of such wrappers becomes a `MapDataset` over a
+    # `SubDataset`.
+    chain, inner = [], dataset
+    while type(inner) is MapDataset or _get_index_map(inner) is not None:
+        chain.append(inner)
+        inner = inner.data
+    if len(chain) == 0:
+        return dataset
+    if len(chain) == 1:
+        return _with_data(dataset, _fuse(inner))
+    inner = _fuse(inner)
+    kwargs = dict(name=dataset.name, subset=dataset.subset, info=dataset.info)
+    index_wrappers = [ds for ds in chain if type(ds) is not MapDataset]
+    if len(index_wrappers) > 0:
+        indices = np.arange(len(dataset))
+        for ds in index_wrappers:
+            indices = _get_index_map(ds)(indices)
+        modifiers = [m for ds in reversed(index_wrappers)
+                     for m in ds.modifiers[len(ds.data.modifiers):]]
+        inner = SubDataset(inner, indices, modifiers=modifiers, **kwargs)
+    maps = [ds for ds in chain if type(ds) is MapDataset]
+    if len(maps) == 0:
+        return inner
+    func = maps[-1].func
+    for ds in reversed(maps[:-1]):
+        func = _compose_maps(func, ds.func)
+    result = MapDataset(inner, func, **kwargs)
+    result.modifiers = list(dataset.modifiers)
+    return result
@@ -6,6 +6,7 @@ from pathlib import Path
 import os
 import shutil
 import warnings
+import functools
 from vidlu.utils.func import partial
 
 import PIL.Image as pimg
@@ -21,6 +22,7 @@ from vidlu.transforms import numpy as numpy_transforms
 from vidlu.utils.misc import extract_zip
 
 from ._cityscapes_labels import labels as cslabels
+from .manifest import load_or_create_manifest, walk_files
 
 # Constants
 
@@ -77,45 +79,99 @@ def load_image(path, downsampling):
     return img
 
 
+def pack_rgb(colors):
+    """Packs RGB colors (the last array dimension) into unsigned integers."""
+    colors = np.asarray(colors)
+    return ((colors[..., 0].astype(np.uint32) << 16) | (colors[..., 1].astype(np.uint32) << 8)
+            | colors[..., 2])
+
+
+class LabelTranslator:
+    """Translates segmentation labels with a single lookup in a dense table.
+
+    Tables are computed lazily once for each input element type. For integer
+    labels, a table covers all values of the input type (e.g. 256 entries
+    for `uint8`). For color-coded labels (keys are RGB tuples), colors are
+    packed into integers and the table has 2 ** 24 entries.
+
+    Args:
+        id_to_label (Mapping): A mapping from integer IDs or RGB tuples to
+            labels.
+        dtype: Output element type.
+        default (int, optional): The label of IDs not in `id_to_label`. If
+            `None`, integer IDs are not changed and unknown colors are
+            translated to -1.
+        colors (bool, optional): Whether labels are color-coded. By default,
+            it is inferred from the keys of `id_to_label`.
+    """
+
+    def __init__(self, id_to_label, dtype=np.int8, default=None, colors=None):
+        self.id_to_label = dict(id_to_label)
+        self.colors = any(isinstance(k, tuple) for k in self.id_to_label) if colors is None \
+            else colors
+        self.dtype = np.dtype(dtype)
+        self.default = -1 if default is None and self.colors else default
+        self._tables = dict()
+
+    def _get_table(self, size):
+        if (table := self._tables.get(size)) is None:
+            table = (np.arange(size) if self.default is None else np.full(size, self.default))
+            ids = np.array([pack_rgb(k) if self.colors else k for k in self.id_to_label],
+                           dtype=np.int64)
+            labels = np.array(list(self.id_to_label.values()), dtype=np.int64)
+            valid = (ids >= 0) & (ids < size)
+            table[ids[valid]] = labels[valid]
+            self._tables[size] = table = table.astype(self.dtype)
+        return table
+
+    def __call__(self, lab):
+        lab = np.asarray(lab)
+        if self.colors:
+            return self._get_table(2 ** 24)[pack_rgb(lab)]
+        if lab.dtype.kind == 'u' and lab.dtype.itemsize <= 2:
+            return self._get_table(2 ** (8 * lab.dtype.itemsize))[lab]
+        if lab.size > 0 and lab.min() < 0:
+            raise ValueError("Negative label IDs are not supported.")
+        size = max(int(lab.max(initial=0)), max(self.id_to_label, default=0)) + 1
+        return self._get_table(1 << (size - 1).bit_length())[lab]
+
+
+@functools.lru_cache(maxsize=16)
+def _get_label_translator(id_to_label_items, dtype):
+    return LabelTranslator(dict(id_to_label_items), dtype=dtype)
+
+
 def load_segmentation_with_downsampling(path, downsampling, id_to_label=None,
                                         dtype=np.int8):
     """ Loads and optionally translates segmentation labels.
 
+    Labels are translated after downsampling (nearest neighbor), which gives
+    the same result as translating before downsampling.
+
     Args:
         path: (path-like) label file path.
         downsampling: (int) an integer larger than 1.
-        id_to_label: (dict, optional) a dictionary for translating labels. Keys
-            can be tuples (if colors are translated to integers) or integers.
-        dtype: output element type.
+        id_to_label: (dict or LabelTranslator, optional) a dictionary or a
+            `LabelTranslator` for translating labels. Keys can be tuples (if
+            colors are translated to integers) or integers.
+        dtype: output element type. It is ignored if `id_to_label` is a
+            `LabelTranslator`.
 
     Returns:
         A 2D array.
     """
-    if id_to_label is None:
-        id_to_label = dict()
     if not isinstance(downsampling, int):
         raise ValueError("`downsampling` must be an `int`.")
+    translate = id_to_label if isinstance(id_to_label, LabelTranslator) else \
+        _get_label_translator(tuple((id_to_label or dict()).items()), np.dtype(dtype))
 
     lab = _load_image(path, force_rgb=False)
     if downsampling > 1:
         lab = tvtf.resize(lab, np.flip(lab.size) // downsampling, pimg.NEAREST)
 
-    if len(lab.getbands()) != 1:  # for rgb labels
-        lab = np.array(lab)
-        scalarizer = np.array([256 ** 2, 256, 1])
-        u, inv = np.unique(lab.reshape(-1, 3).dot(scalarizer), return_inverse=True)
-        id_to_label = {np.array(k).dot(scalarizer): v for k, v in id_to_label.items()}
-        return np.array([id_to_label.get(k, -1)
-                         for k in u], dtype=dtype)[inv].reshape(lab.shape[:2])
-    elif len(id_to_label) > 140:  # faster for great numbers of distinct labels
-        lab = np.array(lab)
-        u, inv = np.unique(lab, return_inverse=True)
-        return np.array([id_to_label.get(k, k) for k in u], dtype=dtype)[inv].reshape(lab.shape)
-    else:  # faster for small numbers of distinct labels
-        lab = np.array(lab, dtype=dtype)
-        for id_, lb in id_to_label.items():
-            lab[lab == id_] = lb
-        return lab
+    if len(lab.getbands()) != 1 and not translate.colors:  # e.g. empty `id_to_label`
+        translate = LabelTranslator(translate.id_to_label, dtype=translate.dtype, colors=True)
+    return translate(np.array(lab))
 
 
 # Artificial datasets ##############################################################################
@@ -254,7 +310,8 @@ class MNIST(Dataset):
         y_path = data_dir / self._files['y_test' if subset == 'test' else 'y_train']
         x, y = self.load_array(x_path, is_x=True), self.load_array(y_path, is_x=False)
         self.x, self.y = map(to_shared_array, [x, y])
-        super().__init__(subset=subset, info=dict(class_count=10, problem='classification'))
+        super().__init__(subset=subset,
+                         info=dict(class_count=10, problem='classification', in_ram=True))
 
     def download(self, data_dir):
         url_base = 'http://yann.lecun.com/exdb/mnist/'
@@ -278,6 +335,12 @@ class MNIST(Dataset):
     def get_example(self, idx):
         return _make_record(x=self.x[idx], y=self.y[idx])
 
+    def get_arrays(self):
+        return dict(x=self.x, y=self.y)
+
+    def get_examples(self, indices):
+        return [_make_record(x=x, y=y) for x, y in zip(self.x[indices], self.y[indices])]
+
     def __len__(self):
         return len(self.y)
 
@@ -345,6 +408,12 @@ class Cifar10(Dataset):
     def get_example(self, idx):
         return _make_record(x=self.x[idx], y=self.y[idx])
 
+    def get_arrays(self):
+        return dict(x=self.x, y=self.y)
+
+    def get_examples(self, indices):
+        return [_make_record(x=x, y=y) for x, y in zip(self.x[indices], self.y[indices])]
+
     def __len__(self):
         return len(self.x)
 
@@ -360,14 +429,22 @@ class Cifar100(Dataset):
 
         h, w, ch = 32, 32, 3
         train_x = data['data'].reshape((-1, ch, h, w)).transpose(0, 2, 3, 1)
-        self.x, self.y = train_x, data['fine_labels']
+        y = np.array(data['fine_labels'], dtype=np.int8)
+        self.x, self.y = map(to_shared_array, [train_x, y])
 
         super().__init__(subset=subset, info=dict(class_count=100, problem='classification',
-                                                  coarse_labels=data['coarse_labels']))
+                                                  coarse_labels=data['coarse_labels'],
+                                                  in_ram=True))
 
     def get_example(self, idx):
         return _make_record(x=self.x[idx], y=self.y[idx])
 
+    def get_arrays(self):
+        return dict(x=self.x, y=self.y)
+
+    def get_examples(self, indices):
+        return [_make_record(x=x, y=y) for x, y in zip(self.x[indices], self.y[indices])]
+
     def __len__(self):
         return len(self.x)
 
@@ -449,12 +526,19 @@ class INaturalist2018(Dataset):
 
         self._downsampling = downsampling
 
-        with open(f"{data_dir}/{subset}2018.json") as fs:
-            info = json.loads(fs.read())
-        self._file_names = [x['file_name'] for x in info['images']]
-        if 'annotations' in info.keys():
-            self._labels = [x['category_id'] for x in info['annotations']]
-        else:
+        annotations_path = data_dir / f"{subset}2018.json"
+
+        def read_annotations():
+            with open(annotations_path) as fs:
+                info = json.loads(fs.read())
+            file_names = [x['file_name'] for x in info['images']]
+            labels = ([x['category_id'] for x in info['annotations']]
+                      if 'annotations' in info.keys() else None)
+            return (file_names, labels), [annotations_path]
+
+        self._file_names, self._labels = load_or_create_manifest(
+            f"INaturalist2018-{subset}", data_dir, read_annotations)
+        if self._labels is None:
             self._labels = np.full(shape=len(self._file_names), fill_value=-1)
 
         info = dict(class_count=8142, problem='classification')
@@ -477,48 +561,89 @@ class INaturalist2018(Dataset):
         return len(self._labels)
 
 
+@functools.lru_cache(maxsize=4)
+def _open_tiny_images(path, pid):
+    # `pid` makes every process (e.g. a data loader worker) open its own memory map
+    return np.memmap(path, dtype=np.uint8, mode='r').reshape(-1, 3, 32, 32)
+
+
 class TinyImages(Dataset):
-    # Taken (and slightly modified) from
+    """The 80 Million Tiny Images dataset.
+
+    Images are served as zero-copy HWC views of a memory map of
+    `tiny_images.bin` that is opened once in each process. `get_images` reads
+    multiple images with a single slicing or indexing operation.
+
+    If `exclude_cifar` is `True`, the dataset is shorter by the number of
+    CIFAR images, and indices of CIFAR images are mapped to the indices of
+    non-CIFAR images after the end of the dataset.
+    """
+    # Taken (and modified) from
     # https://github.com/hendrycks/outlier-exposure/blob/master/utils/tinyimages_80mn_loader.py
     subsets = []
     default_dir = 'tiny-images'
+    _size = 79302017
 
     def __init__(self, data_dir, exclude_cifar=False, cifar_indexes_file=None):
-        def load_image(idx):
-            with open(f'{data_dir}/tiny_images.bin', "rb") as data_file:
-                data_file.seek(idx * 3072)
-                data = data_file.read(3072)
-                return np.fromstring(data, dtype='uint8').reshape((32, 32, 3), order="F")
-
-        self.load_image = load_image
-
+        self.data_file = f'{data_dir}/tiny_images.bin'
         self.exclude_cifar = exclude_cifar
-
+        self._len = self._size
         if exclude_cifar:
-            from bisect import bisect_left
-            self.cifar_idxs = []
             with open(cifar_indexes_file, 'r') as idxs:
-                for idx in idxs:
-                    # indices in file take the 80mn database to start at 1, hence "- 1"
-                    self.cifar_idxs.append(int(idx) - 1)
-            self.cifar_idxs = tuple(sorted(self.cifar_idxs))
-
-            def binary_search(x, hi=len(self.cifar_idxs)):
-                pos = bisect_left(self.cifar_idxs, x, 0, hi)  # find insertion position
-                return True if pos != hi and self.cifar_idxs[pos] == x else False
-
-            self.in_cifar = binary_search
+                # indices in file take the 80mn database to start at 1, hence "- 1"
+                cifar_idxs = np.unique(np.array([int(idx) - 1 for idx in idxs], dtype=np.int64))
+            self._len = self._size - len(cifar_idxs)
+            # CIFAR images in [0, len) are replaced with non-CIFAR images in [len, size)
+            self._remapped = cifar_idxs[cifar_idxs < self._len]
+            tail = np.setdiff1d(np.arange(self._len, self._size), cifar_idxs)
+            self._replacements = tail[:len(self._remapped)]
+            self._remap = dict(zip(self._remapped.tolist(), self._replacements.tolist()))
         super().__init__(info=dict(
             id='tinyimages', problem='classification'))  # TODO: class_count
 
+    @property
+    def _images(self):
+        return _open_tiny_images(self.data_file, os.getpid())
+
+    def load_image(self, idx):
+        return self._images[idx].transpose(2, 1, 0)  # column-major 32x32x3 -> HWC view
+
+    def get_images(self, indices):
+        """Returns an array of images with shape (N, 32, 32, 3).
+
+        A slice or a range with step 1 is read as a zero-copy view. Other
+        indices are read with a single indexing operation, which is fastest
+        for sorted indices.
+        """
+        if isinstance(indices, (slice, range)):
+            start, stop, step = (indices.indices(len(self)) if isinstance(indices, slice) else
+                                 (indices.start, indices.stop, indices.step))
+            if step == 1 and not (self.exclude_cifar and np.any(
+                    (self._remapped >= start) & (self._remapped < stop))):
+                return self._images[start:stop].transpose(0, 3, 2, 1)
+            indices = np.arange(start, stop, step)
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.exclude_cifar and len(self._remapped) > 0:
+            pos = np.searchsorted(self._remapped, indices).clip(max=len(self._remapped) - 1)
+            is_remapped = self._remapped[pos] == indices
+            indices = np.where(is_remapped, self._replacements[pos], indices)
+        return self._images[indices].transpose(0, 3, 2, 1)
+
     def get_example(self, idx):
         if self.exclude_cifar:
-            while self.in_cifar(idx):
-                idx = np.random.randint(79302017)
+            idx = self._remap.get(idx, idx)
         return _make_record(x_=lambda: self.load_image(idx), y=-1)
 
+    def get_examples(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        order = np.argsort(indices, kind='stable')
+        result = [None] * len(indices)
+        for i, image in zip(order.tolist(), self.get_images(indices[order])):
+            result[i] = Record(x=image, y=-1)
+        return result
+
     def __len__(self):
-        return 79302017
+        return self._len
 
 
 def _read_classification_dataset(data_dir, class_name_to_idx, extensions=None, is_valid_file=None):
@@ -527,8 +652,16 @@ def _read_classification_dataset(data_dir, class_name_to_idx, extensions=None, i
     if not ((extensions is None) ^ (is_valid_file is None)):
         raise ValueError(
             "Both extensions and is_valid_file cannot be None or not None at the same time")
-    if extensions is not None:
-        is_valid_file = lambda x: x.lower().endswith(extensions)
+    if extensions is not None:  # the file list depends only on the directory tree
+        def scan():
+            files, scanned_dirs = walk_files(data_dir, sorted(class_name_to_idx.keys()),
+                                             extensions)
+            return files, [data_dir, *scanned_dirs]
+
+        files = load_or_create_manifest(f"ClassificationFolder-{'|'.join(extensions)}",
+                                        data_dir, scan)
+        prefix = os.path.join(data_dir, '')
+        return [(prefix + f, class_name_to_idx[f[:f.index('/')]]) for f in files]
     for target in sorted(class_name_to_idx.keys()):
         d = data_dir / target
         if not d.is_dir():
@@ -537,7 +670,7 @@ def _read_classification_dataset(data_dir, class_name_to_idx, extensions=None, i
             for fname in sorted(fnames):
                 path = Path(root, fname)
                 if is_valid_file(path):
-                    item = (path, class_name_to_idx[target])
+                    item = (str(path), class_name_to_idx[target])
                     path_to_class.append(item)
 
     return path_to_class
@@ -771,6 +904,7 @@ class CamVid(Dataset):
     color_to_label = {color: i for i, class_name_color in enumerate(class_groups_colors.values())
                       for _, color in class_name_color.items()}
     color_to_label[(0, 0, 0)] = -1
+    label_translator = LabelTranslator(color_to_label)
 
     def download(self, data_dir):
         datasets_dir = Path(data_dir).parent
@@ -808,7 +942,7 @@ class CamVid(Dataset):
         ds = self._downsampling
         return _make_record(
             x_=lambda: load_image(ip, ds),
-            y_=lambda: load_segmentation_with_downsampling(lp, ds, self.color_to_label))
+            y_=lambda: load_segmentation_with_downsampling(lp, ds, self.label_translator))
 
     def __len__(self):
         return len(self._img_lab_list)
@@ -848,7 +982,7 @@ class CamVidSequences(Dataset):  # TODO
         ds = self._downsampling
         return _make_record(
             x_=lambda: load_image(ip, ds),
-            y_=lambda: load_segmentation_with_downsampling(lp, ds, self.color_to_label))
+            y_=lambda: load_segmentation_with_downsampling(lp, ds, self.label_translator))
 
     def __len__(self):
         return len(self._img_lab_list)
@@ -884,11 +1018,18 @@ class Cityscapes(Dataset):
             self._id_to_label[19] = -1
         else:
             raise RuntimeError(f"Invalid directory structure in {data_dir}.")
+        self._label_translator = LabelTranslator(self._id_to_label)
 
         self._images_dir = data_dir / images_dir / subset
         self._labels_dir = data_dir / labels_dir / subset
-        self._images = list(sorted([
-            x.relative_to(self._images_dir) for x in self._images_dir.glob('*/*')]))
+
+        def scan():
+            images = [str(x) for x in sorted(
+                x.relative_to(self._images_dir) for x in self._images_dir.glob('*/*'))]
+            return images, [self._images_dir,
+                            *(x for x in self._images_dir.iterdir() if x.is_dir())]
+
+        self._images = load_or_create_manifest(f"Cityscapes-{images_dir}-{subset}", data_dir, scan)
         self._labels = [str(x)[:-len(img_suffix)] + lab_suffix for x in self._images]
 
         _check_size(self._images, self._labels, size=self.subset_to_size[subset])
@@ -902,7 +1043,8 @@ class Cityscapes(Dataset):
         d = self.downsampling
         return _make_record(
             x_=lambda: load_image(im_path, d),
-            y_=lambda: load_segmentation_with_downsampling(lab_path, d, self._id_to_label))
+            y_=lambda: load_segmentation_with_downsampling(lab_path, d,
+                                                           self._label_translator))
 
     def __len__(self):
         return len(self._images)
@@ -925,7 +1067,7 @@ class WildDash(Dataset):
 
         self._IMG_SUFFIX = "0.png"
         self._LAB_SUFFIX = "0_labelIds.png"
-        self._id_to_label = [(l.id, l.trainId) for l in cslabels]
+        self._label_translator = LabelTranslator({l.id: l.trainId for l in cslabels})
 
         self._images_dir = Path(f'{data_dir}/wd_{subset}_01')
         self._image_names = sorted([
@@ -951,9 +1093,7 @@ class WildDash(Dataset):
                 lab = pimg.open(f"{path_prefix}{self._LAB_SUFFIX}")
                 if self._downsampling > 1:
                     lab = tvtf.resize(lab, self._shape, pimg.NEAREST)
-                lab = np.array(lab, dtype=np.int8)
-            for id_, lb in self._id_to_label:
-                lab[lab == id_] = lb
+                lab = self._label_translator(np.array(lab))
             return lab
 
         return _make_record(
@@ -0,0 +1,105 @@
+"""Persistent caching of file lists and parsed annotations of datasets.
+
+Scanning directory trees and parsing large annotation files can take minutes on
+slow or network file systems. A manifest stores the result together with the
+modification times and sizes of the directories and files it was derived from,
+so that later runs can load it instead as long as none of them has changed.
+
+Manifests are stored in `$VIDLU_MANIFEST_DIR` or `~/.cache/vidlu/manifests`.
+Setting `VIDLU_MANIFEST_DIR` to an empty string disables them.
+"""
+
+import hashlib
+import os
+import pickle
+import typing as T
+import warnings
+from pathlib import Path
+
+from vidlu.utils.path import create_file_atomic
+
+_FORMAT_VERSION = 1
+
+
+def get_manifest_dir() -> T.Optional[Path]:
+    manifest_dir = os.environ.get('VIDLU_MANIFEST_DIR', '~/.cache/vidlu/manifests')
+    return Path(manifest_dir).expanduser() if manifest_dir else None
+
+
+def _get_stamps(paths):
+    stamps = []
+    for p in paths:
+        st = os.stat(p)
+        stamps.append((st.st_mtime_ns, st.st_size))
+    return stamps
+
+
+def _get_manifest_path(manifest_dir, name, root):
+    key = hashlib.sha1(f"{name}\0{Path(root).absolute()}".encode()).hexdigest()[:20]
+    return Path(manifest_dir) / f"{name}-{key}.pkl"
+
+
+def load_or_create_manifest(name: str, root, create: T.Callable[[], T.Tuple[T.Any, T.Sequence]],
+                            manifest_dir=None):
+    """Returns a value derived from files in the directory `root`, loading it
+    from a manifest if it is valid.
+
+    A manifest is valid if the modification times and sizes of all of its
+    dependencies are unchanged. The modification time of a directory changes
+    when an entry is added to it, removed from it or renamed, so the
+    dependencies of a file list should include all scanned directories.
+
+    Args:
+        name: A name that identifies the kind of value and the arguments that
+            it depends on, e.g. "Cityscapes-images-train".
+        root: The root directory of the dataset. Manifests are keyed by its
+            absolute path and `name`.
+        create: A function that returns the value and a list of paths of the
+            files and directories that it depends on. The value must be
+            picklable.
+        manifest_dir: The directory with manifests. The default is given by
+            `get_manifest_dir()`. If it is `None`, `create` is always called.
+    """
+    manifest_dir = get_manifest_dir() if manifest_dir is None else manifest_dir
+    if manifest_dir is None:
+        return create()[0]
+    path = _get_manifest_path(manifest_dir, name, root)
+    try:
+        with open(path, 'rb') as file:
+            version, dependencies, stamps, value = pickle.load(file)
+        if version == _FORMAT_VERSION and _get_stamps(dependencies) == stamps:
+            return value
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass  # missing, outdated or corrupt
+
+    value, dependencies = create()
+    dependencies = [str(p) for p in dependencies]
+    manifest = (_FORMAT_VERSION, dependencies, _get_stamps(dependencies), value)
+    try:
+        os.makedirs(manifest_dir, exist_ok=True)
+        create_file_atomic(path, lambda file: pickle.dump(manifest, file, protocol=4))
+    except OSError as e:
+        warnings.warn(f"Could not store the manifest {path}: {e}")
+    return value
+
+
+def walk_files(root, dirs=None, extensions=None):
+    """Returns sorted relative paths (as strings with "/" separators) of all
+    files in `root` (or `root/dir` for each `dir` in `dirs`) and their
+    subdirectories, and the list of all scanned directories.
+
+    Args:
+        root: The root directory.
+        dirs: Subdirectories of `root` to be scanned.
+        extensions: A tuple of lower-case file name suffixes of files to be
+            included, or `None` to include all files.
+    """
+    root = Path(root)
+    files, scanned_dirs = [], []
+    for d in (['.'] if dirs is None else dirs):
+        for dir_path, _, file_names in sorted(os.walk(root / d)):
+            scanned_dirs.append(dir_path)
+            rel_dir = Path(dir_path).relative_to(root).as_posix()
+            files.extend(f"{rel_dir}/{f}" if rel_dir != '.' else f for f in sorted(file_names)
+                         if extensions is None or f.lower().endswith(extensions))
+    return files, scanned_dirs
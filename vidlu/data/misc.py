@@ -1,10 +1,16 @@
+import bz2
+import io
+import lzma
 import pickle
+import zlib
 from collections.abc import Mapping, Sequence
 
 import numpy as np
+import torch
+import torch.utils.data as tud
 from torch.utils.data.dataloader import default_collate as torch_collate
 
-from .record import Record
+from .record import Record, FrozenRecord
 
 
 # Serialization ####################################################################################
@@ -22,6 +28,162 @@ def pickle_sizeof(obj):
     return len(pickle.dumps(obj))
 
 
+class Codec:
+    """Converts values to bytes and back.
+
+    `str(codec)` identifies the codec and its arguments, e.g. in cache
+    manifests. `for_field(key)` returns the codec for the field `key` of
+    records.
+    """
+    name = 'pickle'
+
+    def encode(self, value) -> bytes:
+        return pickle.dumps(value, protocol=4)
+
+    def decode(self, data: bytes):
+        return pickle.loads(data)
+
+    def for_field(self, key):
+        return self
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self})"
+
+
+class CompressedPickleCodec(Codec):
+    """Pickles values and compresses them with `zlib`, `lzma` or `bz2`.
+
+    Args:
+        name: "zlib", "lzma" or "bz2".
+        level (int, optional): The compression level ("preset" for `lzma`).
+            The default is the default of the module.
+    """
+    _modules = dict(zlib=zlib, lzma=lzma, bz2=bz2)
+
+    def __init__(self, name='zlib', level=None):
+        if name not in self._modules:
+            raise ValueError(f"Unknown compression {name!r}, not in {list(self._modules)}.")
+        self.name, self.level = name, level
+
+    def encode(self, value):
+        data = super().encode(value)
+        module = self._modules[self.name]
+        if self.level is None:
+            return module.compress(data)
+        return module.compress(data, preset=self.level) if module is lzma else \
+            module.compress(data, self.level)
+
+    def decode(self, data):
+        return super().decode(self._modules[self.name].decompress(data))
+
+    def __str__(self):
+        return self.name if self.level is None else f"{self.name}:{self.level}"
+
+
+class PNGCodec(Codec):
+    """Encodes integer arrays (NumPy arrays or CPU tensors) with 1 or 2 bytes
+    per element and shape (H, W) or (H, W, C) with 1, 3 or 4 channels as
+    lossless PNG images with OpenCV, e.g. images and label maps. Other values
+    are encoded with `fallback`.
+
+    Args:
+        level (int): The PNG compression level from 0 to 9.
+        fallback (Codec): The codec for other values.
+    """
+    name = 'png'
+
+    def __init__(self, level=3, fallback=CompressedPickleCodec('zlib')):
+        self.level, self.fallback = level, fallback
+
+    def encode(self, value):
+        import cv2
+
+        array = value.numpy() if isinstance(value, torch.Tensor) and not value.is_cuda \
+                                 and not value.requires_grad else value
+        if not (isinstance(array, np.ndarray) and array.dtype.kind in 'uib'
+                and array.dtype.itemsize <= 2 and array.size > 0
+                and (array.ndim == 2 or array.ndim == 3 and array.shape[2] in (1, 3, 4))):
+            return b'F' + self.fallback.encode(value)
+        header = (type(value) is not np.ndarray, array.dtype.str, array.shape)
+        image = np.ascontiguousarray(array).view(np.uint8 if array.dtype.itemsize == 1 else
+                                                 np.uint16)
+        ok, png = cv2.imencode('.png', image, [cv2.IMWRITE_PNG_COMPRESSION, self.level])
+        if not ok:
+            raise RuntimeError(f"PNG encoding of an array with shape {array.shape} failed.")
+        return b'I' + pickle.dumps(header, protocol=4) + png.tobytes()
+
+    def decode(self, data):
+        import cv2
+
+        if data[:1] == b'F':
+            return self.fallback.decode(data[1:])
+        file = io.BytesIO(data)
+        file.seek(1)
+        is_tensor, dtype, shape = pickle.load(file)
+        image = cv2.imdecode(np.frombuffer(data, np.uint8, offset=file.tell()),
+                             cv2.IMREAD_UNCHANGED)
+        array = image.view(dtype).reshape(shape)
+        return torch.from_numpy(array) if is_tensor else array
+
+    def __str__(self):
+        return f"png:{self.level}"
+
+
+class FieldsCodec(Codec):
+    """Encodes fields of records (or other mappings) with different codecs.
+
+    Args:
+        field_to_codec: A mapping from field names to codecs or codec names
+            (see `get_codec`).
+        default: The codec for other fields.
+    """
+
+    def __init__(self, field_to_codec, default=Codec()):
+        self.field_to_codec = {k: get_codec(c) for k, c in field_to_codec.items()}
+        self.default = get_codec(default)
+
+    def encode(self, value):
+        if not isinstance(value, Mapping):
+            return super().encode((None, self.default.encode(value)))
+        return super().encode(
+            (type(value), [(k, self.for_field(k).encode(v)) for k, v in value.items()]))
+
+    def decode(self, data):
+        type_, fields = super().decode(data)
+        if type_ is None:
+            return self.default.decode(fields)
+        return type_([(k, self.for_field(k).decode(v)) for k, v in fields])
+
+    def for_field(self, key):
+        return self.field_to_codec.get(key, self.default)
+
+    def __str__(self):
+        return ','.join([f"{k}={c}" for k, c in self.field_to_codec.items()] + [str(self.default)])
+
+
+def get_codec(codec) -> Codec:
+    """Returns a codec given by a `Codec` object, `None` (pickle), a mapping
+    from fields to codecs (see `FieldsCodec`) or a name with an optional level,
+    e.g. "pickle", "zlib", "lzma:6", "bz2" or "png:9".
+    """
+    if isinstance(codec, Codec):
+        return codec
+    if codec is None:
+        return Codec()
+    if isinstance(codec, Mapping):
+        return FieldsCodec(codec)
+    name, _, level = codec.partition(':')
+    level = int(level) if level else None
+    if name == 'pickle':
+        return Codec()
+    if name == 'png':
+        return PNGCodec() if level is None else PNGCodec(level)
+    return CompressedPickleCodec(name, level)
+
+
 # Collate ##########################################################################################
 
 def numpy_collate(batch):
@@ -46,8 +208,92 @@ def numpy_collate(batch):
 
 def default_collate(batch, array_type='torch'):
     """A function Like `torch.utils.data.dataloader.default_collate`, but also
-    supports the `vidlu.data.Record` type as a container."""
+    supports the `vidlu.data.Record` type as a container.
+
+    A batch of `vidlu.data.FrozenRecord` instances with the same keys is
+    collated field by field, without building a dictionary for each example.
+    """
     collate = torch_collate if array_type == 'torch' else numpy_collate
-    if type(batch[0]) is Record:
+    elem = batch[0]
+    if type(elem) is FrozenRecord and all(getattr(d, '_index', None) is elem._index
+                                          for d in batch):
+        keys = tuple(elem.keys())
+        return FrozenRecord._from_values(keys, [collate(field) for field in zip(*batch)])
+    if isinstance(elem, Record):
         return Record(collate(tuple(dict(d.items()) for d in batch)))
     return collate(batch)
+
+
+class SharedBufferCollate:
+    """A collate function for `vidlu.data.Record` examples that writes batches
+    into a ring of reusable shared-memory buffers in each worker process.
+
+    The shape and dtype of each field are learned from the first batch. Fields
+    of later batches that are tensors or arrays with these shapes and dtypes
+    are stacked directly into the next buffer of the ring, so that no shared
+    memory has to be allocated for them and the main process receives handles
+    to memory that it has already mapped. Other fields (and all fields of
+    examples that are not records or of batches collated in the main process)
+    are collated with `collate_fn`.
+
+    Buffers are overwritten when they are reused. With `DataLoader` and
+    `buffer_count >= prefetch_factor + 1`, a batch stays intact until
+    `buffer_count - prefetch_factor` further batches have been fetched within
+    the same epoch. Fields that need to be kept longer should be cloned.
+
+    Args:
+        buffer_count (int): The number of buffers per worker process.
+        collate_fn: The collate function used for the first batch and fields
+            that do not fit the buffers.
+    """
+
+    def __init__(self, buffer_count, collate_fn=default_collate):
+        self.buffer_count = buffer_count
+        self.collate_fn = collate_fn
+        self._layout = None  # {key: (array_type, shape, dtype)} or `None` for variable fields
+        self._buffers = None
+        self._next_buffer = 0
+
+    def __getstate__(self):  # buffers are not shared between worker processes
+        return dict(self.__dict__, _layout=None, _buffers=None, _next_buffer=0)
+
+    def __call__(self, batch):
+        elem = batch[0]
+        if not isinstance(elem, Record) or tud.get_worker_info() is None:
+            return self.collate_fn(batch)
+        if self._layout is None:
+            self._layout = {k: _get_field_layout(v) for k, v in elem.items()}
+            self._buffers = [dict() for _ in range(self.buffer_count)]
+            return self.collate_fn(batch)
+        buffers = self._buffers[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % self.buffer_count
+        fields = dict()
+        for k in elem.keys():
+            values = [d[k] for d in batch]
+            layout = self._layout.get(k)
+            if layout is None or not all(_get_field_layout(v) == layout for v in values):
+                fields[k] = self.collate_fn(values)
+                continue
+            if (buffer := buffers.get(k)) is None or len(buffer) < len(values):
+                array_type, shape, dtype = layout
+                if array_type == 'numpy':
+                    dtype = torch.from_numpy(np.empty(0, dtype=dtype)).dtype
+                buffer = buffers[k] = torch.empty((len(values), *shape),
+                                                  dtype=dtype).share_memory_()
+            out = buffer[:len(values)]
+            if layout[0] == 'numpy':
+                np.stack(values, out=out.numpy())
+            else:
+                torch.stack(values, out=out)
+            fields[k] = out
+        if type(elem) is FrozenRecord:
+            return FrozenRecord._from_values(tuple(fields.keys()), fields.values())
+        return Record(fields)
+
+
+def _get_field_layout(value):
+    if type(value) is torch.Tensor and not value.requires_grad:
+        return 'torch', value.shape, value.dtype
+    elif type(value) is np.ndarray and value.dtype.kind in 'biufc':
+        return 'numpy', value.shape, value.dtype
+    return None
@@ -49,7 +49,7 @@ def _generate_parts(part_to_ds: T.Mapping[str, Dataset],
 
 class PartedDataset(Mapping):
     def __init__(self, part_to_ds, part_to_split=None):
-        part_to_split = part_to_split or {}
+        self.part_to_split = part_to_split = part_to_split or {}
         non_top_level_parts = set(s for subsets, ratio in part_to_split.values() for s in subsets)
         self.top_level_parts = [k for k in part_to_split.keys() if k not in non_top_level_parts]
         self.part_to_ds = _generate_parts(part_to_ds, part_to_split)
@@ -70,7 +70,7 @@ class PartedDataset(Mapping):
         yield from self.keys()
 
     def with_transform(self, transform):
-        return PartedDataset(valmap(transform, self.part_to_ds))
+        return PartedDataset(valmap(transform, self.part_to_ds), self.part_to_split)
 
     def keys(self):
         return self.part_to_ds.keys()
@@ -83,6 +83,14 @@ class PartedDataset(Mapping):
         for k in self.top_level_parts:
             yield k, self[k]
 
+    def leaf_items(self):
+        """Yields the parts that are not split into other parts. They are
+        disjoint if the parted dataset is created from disjoint subsets."""
+        for k in self.keys():
+            if k not in self.part_to_split \
+                    or not all(s in self.part_to_ds for s in self.part_to_split[k][0]):
+                yield k, self[k]
+
 
 """
 class CachingGetter:
@@ -1,19 +1,36 @@
 from collections.abc import Sequence, KeysView, ValuesView, ItemsView
-from functools import reduce
+from functools import reduce, lru_cache
+import inspect
+from types import FunctionType
 
 import vidlu.utils.func as vuf
 
 
 # Record
 
+def _param_count(func):
+    if type(func) is FunctionType and not hasattr(func, '__wrapped__'):
+        # fast path for lambdas, which are usually created for each example
+        code = func.__code__
+        return (code.co_argcount + code.co_kwonlyargcount
+                + bool(code.co_flags & inspect.CO_VARARGS)
+                + bool(code.co_flags & inspect.CO_VARKEYWORDS))
+    return vuf.param_count(func)
+
+
 class _LazyField:
-    __slots__ = "get"
+    __slots__ = ("get", "takes_record")
 
     def __init__(self, get):
-        if vuf.param_count(get) not in [0, 1]:
+        param_count = _param_count(get)  # inspected once, when the field is created
+        if param_count not in [0, 1]:
             raise ValueError("get should be a callable with either 0 (simple lazy evaluation) or 1"
                              + " parameter (in case of referring back to the 'Record' object).")
         self.get = get
+        self.takes_record = param_count == 1
+
+    def __call__(self, record):
+        return self.get(record) if self.takes_record else self.get()
 
 
 class Record(Sequence):  # Sized, Iterable len, iter
@@ -45,7 +62,7 @@ class Record(Sequence):  # Sized, Iterable len, iter
         Record(d=2, b=<unevaluated>)
     """
 
-    __slots__ = "_dict"
+    __slots__ = ("_dict", "_key_tuple")
 
     def __init__(self, *args, **kwargs):
         if len(args) > 1:
@@ -61,6 +78,7 @@ class Record(Sequence):  # Sized, Iterable len, iter
         if not all(type(k) is str for k in dict_.keys()):
             raise ValueError("Record keys must be strings.")
         self._dict = dict_
+        self._key_tuple = None  # for positional indexing, created on first use
 
     def __getattr__(self, key):  # TODO: add __dir__
         return self[key]
@@ -70,17 +88,22 @@ class Record(Sequence):  # Sized, Iterable len, iter
         :param key: int or str or List[str]
         :return:
         """
-        if isinstance(key, Sequence) and not isinstance(key, str):
-            return Record(dict([(k, self[k]) if self.is_evaluated(k) else (k + "_", lambda: self[k])
-                                for k in key]))
-        else:
+        if type(key) is not str:
             if isinstance(key, int):
-                key = tuple(self.keys())[key]
-            val = self._dict[key]
-            if isinstance(val, _LazyField):
-                val = self._dict[key] = val.get() if vuf.param_count(val.get) == 0 \
-                    else val.get(self)
-            return val
+                key = self._get_key_tuple()[key]
+            elif isinstance(key, Sequence):
+                return Record(dict([(k, self[k]) if self.is_evaluated(k)
+                                    else (k + "_", lambda: self[k]) for k in key]))
+        val = self._dict[key]
+        if type(val) is _LazyField:
+            val = self._dict[key] = val(self)
+        return val
+
+    def _get_key_tuple(self):
+        # Keys do not change after construction, so the tuple can be reused.
+        if self._key_tuple is None:
+            self._key_tuple = tuple(self._dict.keys())
+        return self._key_tuple
 
     def __contains__(self, item):
         """ This might not be a good design. Bothe keys and values are compared. """
@@ -100,6 +123,7 @@ class Record(Sequence):  # Sized, Iterable len, iter
 
     def __setstate__(self, state):
         self._dict = state
+        self._key_tuple = None
 
     def __str__(self):
         fields = ", ".join([f"{k}={self[k]}" if self.is_evaluated(k) else f"{k}=<unevaluated>"
@@ -114,7 +138,7 @@ class Record(Sequence):  # Sized, Iterable len, iter
             _ = self[k]
 
     def is_evaluated(self, key):
-        return not isinstance(self._dict[key], _LazyField)
+        return type(self._dict[key]) is not _LazyField
 
     def join(self, other: 'Record', *others, overwrite=False):
         if len(others) > 0:
@@ -133,3 +157,90 @@ class Record(Sequence):  # Sized, Iterable len, iter
     def items(self) -> ItemsView:
         self.evaluate()
         return self._dict.items()
+
+    def _evaluated_dict(self):
+        self.evaluate()
+        return self._dict
+
+    def freeze(self) -> 'FrozenRecord':
+        """Evaluates all fields and returns a `FrozenRecord` with the same
+        items."""
+        return FrozenRecord(self)
+
+
+@lru_cache(maxsize=1024)
+def _get_key_index(keys: tuple):
+    return {k: i for i, k in enumerate(keys)}
+
+
+class FrozenRecord(Record):
+    r"""
+    A compact `Record` with all fields evaluated.
+
+    Values are stored in a tuple and the key index is shared between all frozen
+    records with the same keys. This makes field access and construction
+    cheaper and it enables `vidlu.data.default_collate` to collate a batch
+    field-wise without building a dictionary for each example.
+    Example:
+        >>> r = Record(a_=lambda: 2+3, b=7).freeze()
+        Record(a=5, b=7)
+        >>> r.a == r['a'] == r[0]
+        True
+    """
+
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, *args, **kwargs):
+        if len(args) == 1 and len(kwargs) == 0 and type(args[0]) is FrozenRecord:
+            self._index, self._values = args[0]._index, args[0]._values
+            return
+        dict_ = Record(*args, **kwargs)._evaluated_dict()
+        self._index = _get_key_index(tuple(dict_.keys()))
+        self._values = tuple(dict_.values())
+
+    @classmethod
+    def _from_values(cls, keys: tuple, values):
+        obj = cls.__new__(cls)
+        obj._index, obj._values = _get_key_index(keys), tuple(values)
+        return obj
+
+    @property
+    def _dict(self):
+        return dict(zip(self._index, self._values))
+
+    def __getitem__(self, key):
+        if type(key) is str:
+            return self._values[self._index[key]]
+        elif isinstance(key, int):
+            return self._values[key]
+        return FrozenRecord({k: self[k] for k in key})
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getstate__(self):
+        return tuple(self._index), self._values
+
+    def __setstate__(self, state):
+        keys, self._values = state
+        self._index = _get_key_index(keys)
+
+    def evaluate(self):
+        pass
+
+    def is_evaluated(self, key):
+        if key not in self._index:
+            raise KeyError(key)
+        return True
+
+    def keys(self) -> KeysView:
+        return self._index.keys()
+
+    def values(self) -> ValuesView:
+        return self._dict.values()
+
+    def items(self) -> ItemsView:
+        return self._dict.items()
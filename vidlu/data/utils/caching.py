@@ -1,27 +1,163 @@
+import os
+import logging
+import pickle
 import shutil
+import time
+import typing as T
 from argparse import Namespace
 from vidlu.utils.func import partial
 from pathlib import Path
 import warnings
 
 import numpy as np
+from torch.utils.data.dataset import ConcatDataset
 from tqdm import tqdm
 
-from vidlu.data import DatasetFactory
-from vidlu.utils import path
+from vidlu.data import DatasetFactory, Dataset, PartedDataset, Record
+from vidlu.data.dataset import MapDataset, _get_index_map, _with_data
+from vidlu.data.misc import get_codec
+from vidlu.utils.misc import Stopwatch
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
 
 # Standardization ##################################################################################
 
-def compute_pixel_mean_std(dataset, scale01=False, progress_bar=False):
-    pbar = tqdm if progress_bar else lambda x: x
-    mvn = np.array([(x.mean((0, 1)), x.var((0, 1)), np.prod(x.shape[:2]))
-                    for x in pbar(dataset.map(lambda r: np.array(r.x)))])
-    means, vars_, ns = [mvn[:, i] for i in range(3)]  # means, variances, pixel counts
-    ws = ns / ns.sum()  # image weights (pixels in image / pixels in all images)
-    mean = ws.dot(means)  # mean pixel
-    var = vars_.mean(0) + ws.dot(means ** 2) - mean ** 2  # pixel variance
-    std = np.sqrt(var)  # pixel standard deviation
+class PixelStatistics:
+    """Mergeable per-channel pixel statistics: count, mean, sum of squared
+    deviations from the mean (`m2`) and, optionally, histograms.
+
+    Statistics of disjoint sets of images can be merged exactly with `merge`
+    (the parallel variance algorithm by Chan et al.).
+
+    Args:
+        histogram_bins (int, optional): The number of histogram bins. If
+            `None`, histograms are not computed.
+        histogram_range (tuple): The range of pixel values covered by the
+            histogram bins.
+    """
+
+    def __init__(self, histogram_bins=None, histogram_range=(0, 256)):
+        self.histogram_bins = histogram_bins
+        self.histogram_range = histogram_range
+        self.n = 0
+        self.mean = self.m2 = self.histogram = None
+        self.channel_shape = None
+
+    def update(self, image):
+        """Adds the pixels of an image with shape (H, W) or (H, W, C)."""
+        x = np.asarray(image)
+        if self.channel_shape is None:
+            self.channel_shape = x.shape[2:]
+        x = x.reshape(-1, int(np.prod(x.shape[2:]))).astype(np.float64, copy=False)
+        other = PixelStatistics(self.histogram_bins, self.histogram_range)
+        other.channel_shape = self.channel_shape
+        other.n, other.mean = len(x), x.mean(0)
+        other.m2 = ((x - other.mean) ** 2).sum(0)
+        if self.histogram_bins is not None:
+            other.histogram = np.stack(
+                [np.histogram(c, bins=self.histogram_bins, range=self.histogram_range)[0]
+                 for c in x.T])
+        return self.merge(other)
+
+    def merge(self, other):
+        """Merges statistics of another set of images into this object."""
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.n / n)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.n * other.n / n)
+        self.n = n
+        if self.histogram is not None:
+            self.histogram = self.histogram + other.histogram
+        return self
+
+    @property
+    def var(self):
+        return (self.m2 / self.n).reshape(self.channel_shape)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+class _ChunkPixelStatistics:  # not local for picklability
+    def __init__(self, dataset, histogram_bins, histogram_range):
+        self.dataset = dataset
+        self.histogram_bins = histogram_bins
+        self.histogram_range = histogram_range
+
+    def __call__(self, indices):
+        stats = PixelStatistics(self.histogram_bins, self.histogram_range)
+        for i in indices:
+            stats.update(self.dataset[int(i)].x)
+        return stats
+
+
+def compute_pixel_statistics(dataset, histogram_bins=None, histogram_range=(0, 256),
+                             sample_count=None, seed=53, num_workers=None, chunk_size=64,
+                             progress_bar=False):
+    """Computes per-channel pixel statistics of images in `dataset`.
+
+    The dataset is split into chunks of consecutive indices whose statistics
+    are computed in data loader worker processes and merged exactly.
+
+    Args:
+        dataset: A dataset with examples with images in the `x` field.
+        histogram_bins (int, optional): The number of histogram bins. If
+            `None`, histograms are not computed.
+        histogram_range (tuple): The range of pixel values covered by the
+            histogram bins.
+        sample_count (int, optional): If provided, only a random subset of
+            `sample_count` examples (chosen with the random seed `seed`) is
+            used, which gives approximate statistics.
+        seed (int): The random seed for choosing the subset.
+        num_workers (int, optional): The number of worker processes. The
+            default is the number of CPUs.
+        chunk_size (int): The number of examples processed by a worker at once.
+        progress_bar (bool): Whether to show a progress bar.
+
+    Returns:
+        A `PixelStatistics` object.
+    """
+    from torch.utils.data import DataLoader
+
+    if sample_count is not None and sample_count < len(dataset):
+        indices = np.sort(np.random.RandomState(seed).choice(len(dataset), size=sample_count,
+                                                             replace=False))
+    else:
+        indices = np.arange(len(dataset))
+    chunks = [indices[i:i + chunk_size] for i in range(0, len(indices), chunk_size)]
+    if num_workers is None:
+        num_workers = min(os.cpu_count() or 1, len(chunks))
+    chunk_stats = DataLoader(chunks, batch_size=None, num_workers=num_workers,
+                             collate_fn=_ChunkPixelStatistics(dataset, histogram_bins,
+                                                              histogram_range))
+    stats = PixelStatistics(histogram_bins, histogram_range)
+    with tqdm(total=len(indices), disable=not progress_bar) as pbar:
+        for chunk, cs in zip(chunks, chunk_stats):
+            stats.merge(cs)
+            pbar.update(len(chunk))
+    return stats
+
+
+def compute_pixel_mean_std(dataset, scale01=False, progress_bar=False, **kwargs):
+    """Computes the per-channel pixel mean and standard deviation.
+
+    Args:
+        dataset: A dataset with examples with images in the `x` field.
+        scale01 (bool): Whether to divide the results by 255.
+        progress_bar (bool): Whether to show a progress bar.
+        **kwargs: Additional arguments for `compute_pixel_statistics`, e.g.
+            `num_workers` or `sample_count`.
+    """
+    stats = compute_pixel_statistics(dataset, progress_bar=progress_bar, **kwargs)
+    mean, std = stats.mean.reshape(stats.channel_shape), stats.std
     return (mean / 255, std / 255) if scale01 else (mean, std)
 
 
@@ -33,12 +169,22 @@ def _get_standardization(_, ds_with_info):
 
 
 # not local for picklability, used only in add_image_statistics_to_info_lazily
-def _compute_pixel_mean_std_d(ds):
-    mean, std = compute_pixel_mean_std(ds, scale01=True, progress_bar=True)
+def _compute_pixel_mean_std_d(ds, **kwargs):
+    mean, std = compute_pixel_mean_std(ds, scale01=True, progress_bar=True, **kwargs)
     return Namespace(mean=mean, std=std)
 
 
-def add_image_statistics_to_info_lazily(parted_dataset, cache_dir):
+def add_image_statistics_to_info_lazily(parted_dataset, cache_dir, **kwargs):
+    """Adds lazily computed pixel standardization statistics of the "trainval"
+    part to `info.cache` of all dataset parts and caches them in `cache_dir`.
+
+    Args:
+        parted_dataset: A parted dataset.
+        cache_dir: The directory of the info cache.
+        **kwargs: Additional arguments for `compute_pixel_statistics`, e.g.
+            `num_workers` or `sample_count` and `seed` for approximate
+            statistics.
+    """
     try:
         stats_ds = parted_dataset.trainval
     except KeyError:
@@ -46,7 +192,8 @@ def add_image_statistics_to_info_lazily(parted_dataset, cache_dir):
         warnings.warn('The parted dataset object has no "trainval" part.'
                       + f' "{part_name}" is used instead.')
     ds_with_info = stats_ds.info_cache_hdd(
-        dict(standardization=_compute_pixel_mean_std_d), Path(cache_dir) / 'dataset_statistics')
+        dict(standardization=partial(_compute_pixel_mean_std_d, **kwargs)),
+        Path(cache_dir) / 'dataset_statistics')
 
     def cache_transform(ds):
         return ds.info_cache(
@@ -57,15 +204,72 @@ def add_image_statistics_to_info_lazily(parted_dataset, cache_dir):
 
 # Caching ##########################################################################################
 
-def cache_data_lazily(parted_dataset, cache_dir, min_free_space=20 * 2 ** 30):
-    elem_size = next(parted_dataset.items())[1].approx_example_size()
+def benchmark_codecs(dataset, codecs=('pickle', 'zlib', 'lzma', 'bz2', 'png'), sample_count=8,
+                     seed=53):
+    """Measures compression ratios and encoding and decoding throughput of
+    codecs (see `vidlu.data.misc.get_codec`) on a random sample of examples.
+
+    For records, each field is measured separately, so that a codec can be
+    chosen for each field. Codecs of fields are used for mappings from fields
+    to codecs.
+
+    Returns:
+        A list of dictionaries with the keys "field" (`None` for examples that
+        are not records), "codec", "ratio" (the size of pickled values divided
+        by the size of encoded values), "encode_speed" and "decode_speed" (in
+        bytes of pickled values per second).
+    """
+    indices = np.random.RandomState(seed).choice(
+        len(dataset), size=min(sample_count, len(dataset)), replace=False)
+    examples = [dataset[int(i)] for i in indices]
+    if isinstance(examples[0], Record):
+        columns = {k: [r[k] for r in examples] for k in examples[0].keys()}
+    else:
+        columns = {None: examples}
+    results = []
+    for field, values in columns.items():
+        raw_size = sum(len(pickle.dumps(v, protocol=4)) for v in values)
+        for codec in map(get_codec, codecs):
+            codec = codec if field is None else codec.for_field(field)
+            with Stopwatch(time.perf_counter) as sw_encode:
+                encoded = [codec.encode(v) for v in values]
+            with Stopwatch(time.perf_counter) as sw_decode:
+                for e in encoded:
+                    codec.decode(e)
+            results.append(dict(field=field, codec=str(codec),
+                                ratio=raw_size / sum(map(len, encoded)),
+                                encode_speed=raw_size / sw_encode.time,
+                                decode_speed=raw_size / sw_decode.time))
+    return results
+
+
+def cache_data_lazily(parted_dataset, cache_dir, min_free_space=20 * 2 ** 30, codec=None):
+    """Caches all parts of `parted_dataset` on disk (see `HDDCacheDataset`)
+    if there is enough free space for them.
+
+    Args:
+        parted_dataset: A parted dataset.
+        cache_dir: The directory with the "datasets" subdirectory for caches.
+        min_free_space (int): The number of bytes that must remain free.
+        codec (optional): The codec of cached values, e.g.
+            `dict(x='png', y='png')` (see `vidlu.data.misc.get_codec`). The
+            size of the data is estimated from encoded examples.
+    """
+    sample_ds = next(parted_dataset.items())[1]
+    if codec is None:
+        elem_size = sample_ds.approx_example_size()
+    else:
+        codec = get_codec(codec)
+        elem_size = int(np.mean([len(codec.encode(r)) for r in sample_ds.permute()[:4]]))
     size = elem_size * sum(len(ds) for _, ds in parted_dataset.top_level_items())
     free_space = shutil.disk_usage(cache_dir).free
     space_left = free_space - size
 
     def transform(ds):
-        ds_cached = ds.cache_hdd(f"{cache_dir}/datasets")
-        has_been_cached = path.get_size(ds_cached.cache_dir) > size * 0.1
+        if ds.info.get('in_ram', False):  # caching would only slow down loading
+            return ds
+        ds_cached = ds.cache_hdd(f"{cache_dir}/datasets", codec=codec)
+        has_been_cached = ds_cached.cached_size() > size * 0.1
         if has_been_cached or space_left >= min_free_space:
             ds = ds_cached
         else:
@@ -81,15 +285,277 @@ def cache_data_lazily(parted_dataset, cache_dir, min_free_space=20 * 2 ** 30):
     return parted_dataset.with_transform(transform)
 
 
+# Cache placement planning #########################################################################
+
+class StageStats(T.NamedTuple):
+    dataset: T.Any
+    example_count: int  # the number of distinct examples read in an epoch
+    time: float  # seconds per example, including the time of inner stages
+    size: int  # bytes per pickled example
+    load_time: float  # seconds for unpickling an example
+
+
+class CacheOption(T.NamedTuple):
+    medium: T.Optional[str]  # 'ram', 'hdd' or None
+    stage: T.Optional[int]
+    epoch_time: float  # the expected time per epoch in seconds
+    cached_fraction: float
+    cache_size: int  # bytes
+
+
+def _get_stage_chain(dataset):
+    """Returns the datasets along the chain of single-dataset wrappers (maps
+    and index-remapping wrappers), starting with the innermost one."""
+    chain = [dataset]
+    while type(chain[-1]) is MapDataset or _get_index_map(chain[-1]) is not None:
+        chain.append(chain[-1].data)
+    return chain[::-1]
+
+
+def _get_stage_name(chain, k):
+    return chain[k].name if k == 0 else \
+        '.'.join(chain[k].modifiers[len(chain[k - 1].modifiers):]) or type(chain[k]).__name__
+
+
+def _measure_examples(dataset, indices):
+    times, sizes, load_times = [], [], []
+    for i in indices:
+        with Stopwatch(time.perf_counter) as sw:
+            example = dataset[int(i)]
+            if isinstance(example, Record):  # lazy fields are computed when they are cached
+                example.evaluate()
+        data = pickle.dumps(example, protocol=4)
+        with Stopwatch(time.perf_counter) as sw_load:
+            pickle.loads(data)
+        times.append(sw.time)
+        sizes.append(len(data))
+        load_times.append(sw_load.time)
+    return np.mean(times), int(np.mean(sizes)), np.mean(load_times)
+
+
+def measure_stages(dataset, sample_count=8, seed=53):
+    """Measures the cost and output size of each stage of the chain of
+    single-dataset wrappers (maps and index-remapping wrappers) of `dataset`.
+
+    The same random sample of examples of `dataset` is read from each stage.
+    The base dataset is read twice: the first time gives the time of reading
+    from storage, and the second time, with warm file system caches, is
+    subtracted from times of outer stages so that they include the first.
+
+    Returns:
+        A list of `StageStats`, starting with the innermost dataset.
+    """
+    chain = _get_stage_chain(dataset)
+    rng = np.random.RandomState(seed)
+    sample = rng.choice(len(dataset), size=min(sample_count, len(dataset)), replace=False)
+    all_indices = np.arange(len(dataset))
+    stage_indices = [None] * len(chain)
+    for k in reversed(range(len(chain))):
+        stage_indices[k] = (sample, all_indices)
+        index_map = _get_index_map(chain[k])
+        if index_map is not None:
+            sample, all_indices = index_map(sample), index_map(all_indices)
+    stats = []
+    cold_time = _measure_examples(chain[0], stage_indices[0][0])[0]
+    for k, (ds, (sample, all_indices)) in enumerate(zip(chain, stage_indices)):
+        t, size, load_time = _measure_examples(ds, sample)
+        if k == 0:
+            warm_time = t
+        t = max(t - warm_time + cold_time, stats[-1].time if k > 0 else 0)  # noise
+        stats.append(StageStats(ds, len(np.unique(all_indices)), t, size, load_time))
+    return stats
+
+
+class CachePlan:
+    """The result of `plan_cache_placement`.
+
+    Attributes:
+        dataset: The planned dataset.
+        stages: A list of `StageStats` of the chain of wrappers.
+        options: `CacheOption` objects sorted by expected time per epoch, the
+            first of which is the chosen one.
+    """
+
+    def __init__(self, dataset, stages, options, epochs, ram_budget, cache_dir):
+        self.dataset = dataset
+        self.stages = stages
+        self.options = options
+        self.epochs = epochs
+        self.ram_budget = ram_budget
+        self.cache_dir = cache_dir
+
+    @property
+    def choice(self):
+        return self.options[0]
+
+    def apply(self):
+        """Returns the dataset with the chosen cache inserted after the chosen
+        stage, with the same outer wrappers."""
+        medium, k = self.choice.medium, self.choice.stage
+        if medium is None:
+            return self.dataset
+        chain = _get_stage_chain(self.dataset)
+        if medium == 'ram':
+            policy = 'lru' if self.choice.cached_fraction == 1 else 'lfu'
+            ds = chain[k].cache(max_bytes=self.ram_budget, policy=policy)
+        else:
+            ds = chain[k].cache_hdd(self.cache_dir,
+                                    separate_fields=isinstance(chain[k][0], Record))
+        for wrapper in chain[k + 1:]:
+            ds = _with_data(wrapper, ds)
+        return ds
+
+    def _describe(self, option):
+        if option.medium is None:
+            return "no cache"
+        where = "in RAM" if option.medium == 'ram' else "on disk"
+        chain = [s.dataset for s in self.stages]
+        partially = f" ({option.cached_fraction:.0%})" if option.cached_fraction < 1 else ""
+        return f"{where}{partially} after {option.stage}:{_get_stage_name(chain, option.stage)}"
+
+    def report(self, option_count=5):
+        """Returns a short textual explanation of the decision."""
+        chain = [s.dataset for s in self.stages]
+        lines = [f"Cache placement for {self.dataset.identifier}"
+                 + f" ({len(self.dataset)} examples per epoch, {self.epochs} epochs):",
+                 f"{'stage':>24} {'ms/example':>10} {'KiB/example':>11} {'examples':>9}"]
+        for k, s in enumerate(self.stages):
+            lines.append(f"{str(k) + ':' + _get_stage_name(chain, k):>24} {s.time * 1e3:10.2f}"
+                         + f" {s.size / 2 ** 10:11.1f} {s.example_count:9}")
+        lines.append("Expected time per epoch:")
+        for o in self.options[:option_count]:
+            lines.append(f"{o.epoch_time:10.3g} s  {self._describe(o)}"
+                         + (f" ({o.cache_size / 2 ** 30:.3f} GiB)" if o.medium else ""))
+        none = next(o for o in self.options if o.medium is None)
+        lines.append(f"Chosen: {self._describe(self.choice)}"
+                     + (f", {none.epoch_time / self.choice.epoch_time:.1f}x faster than no cache."
+                        if self.choice.medium and self.choice.epoch_time > 0 else "."))
+        return '\n'.join(lines)
+
+
+def plan_cache_placement(dataset, ram_budget=0, disk_budget=0, cache_dir=None, epochs=10,
+                         sample_count=8, disk_speed=200 * 2 ** 20, seed=53):
+    """Chooses where to insert a RAM or HDD cache into the chain of wrappers
+    of `dataset` so that the expected time per epoch is minimal.
+
+    Costs and output sizes of stages are measured on a sample of examples (see
+    `measure_stages`). An epoch reads each example of `dataset` once and the
+    cache is filled in the first epoch, so for a cache after stage `k` the
+    expected time per epoch is the average over `epochs` epochs of
+    `N * t_top` (plus writing to disk) in the first epoch and
+    `N * (read_k + t_top - t_k)` in later ones, where `N` is the length of
+    `dataset` and `t` are cumulative times per example. Reading from RAM takes
+    the unpickling time and reading from disk additionally `size / disk_speed`.
+    A RAM cache (`SharedRAMCacheDataset`) can hold a part of the examples
+    within `ram_budget`, and an HDD cache must fit in `disk_budget`.
+
+    Stages must be deterministic, so the dataset should be planned before
+    random augmentation is added and before `fuse` is called.
+
+    Args:
+        dataset: The dataset.
+        ram_budget (int): The RAM budget in bytes.
+        disk_budget (int): The disk budget in bytes.
+        cache_dir: The directory for HDD caches. If `None`, HDD caching is not
+            considered.
+        epochs (int): The expected number of epochs.
+        sample_count (int): The number of examples read from each stage.
+        disk_speed (float): The assumed disk read and write speed in bytes per
+            second.
+        seed (int): The random seed for choosing the sample.
+
+    Returns:
+        A `CachePlan`, whose `apply` method returns the cached dataset and
+        whose `report` method returns an explanation of the decision.
+    """
+    stages = measure_stages(dataset, sample_count=sample_count, seed=seed)
+    n, t_top = len(dataset), stages[-1].time
+    options = [CacheOption(None, None, n * t_top, 0., 0)]
+    page_size = 4096  # the default page size of SharedRAMCacheDataset
+    for k, s in enumerate(stages):
+        ram_size = s.example_count * (-(-s.size // page_size) * page_size)
+        fraction = min(1., ram_budget * (1 - 1 / 32) / ram_size) if ram_size > 0 else 1.
+        if fraction > 0:
+            later = n * (fraction * s.load_time + (1 - fraction) * s.time + t_top - s.time)
+            options.append(CacheOption('ram', k, (n * t_top + (epochs - 1) * later) / epochs,
+                                       fraction, min(ram_size, ram_budget)))
+        hdd_size = s.example_count * s.size
+        if cache_dir is not None and hdd_size <= disk_budget:
+            first = n * t_top + hdd_size / disk_speed
+            later = n * (s.load_time + s.size / disk_speed + t_top - s.time)
+            options.append(CacheOption('hdd', k, (first + (epochs - 1) * later) / epochs, 1.,
+                                       hdd_size))
+    options.sort(key=lambda o: o.epoch_time)
+    return CachePlan(dataset, stages, options, epochs, ram_budget, cache_dir)
+
+
+def cache_data_planned(parted_dataset, cache_dir, ram_budget, disk_budget=None,
+                       min_free_space=20 * 2 ** 30, **kwargs):
+    """Inserts caches chosen by `plan_cache_placement` into the leaf parts of
+    `parted_dataset` and logs the reports.
+
+    Leaf parts (see `PartedDataset.leaf_items`) get shares of the budgets
+    proportional to their lengths. Other parts, e.g. "trainval", are
+    concatenations of their cached subparts so that overlapping parts do not
+    get separate caches and the budgets are not exceeded.
+
+    Args:
+        parted_dataset: A parted dataset.
+        cache_dir: The directory with the "datasets" subdirectory for HDD
+            caches.
+        ram_budget (int): The total RAM budget in bytes.
+        disk_budget (int, optional): The total disk budget in bytes. The
+            default is the free space in `cache_dir` minus `min_free_space`.
+        **kwargs: Additional arguments for `plan_cache_placement`.
+    """
+    if disk_budget is None:
+        disk_budget = max(0, shutil.disk_usage(cache_dir).free - min_free_space)
+    leaves = dict(parted_dataset.leaf_items())
+    total_length = sum(len(ds) for ds in leaves.values()) or 1
+
+    part_to_ds = dict()
+    for name, ds in leaves.items():
+        share = len(ds) / total_length
+        plan = plan_cache_placement(ds, int(ram_budget * share), int(disk_budget * share),
+                                    cache_dir=f"{cache_dir}/datasets", **kwargs)
+        logger.info(plan.report())
+        part_to_ds[name] = plan.apply()
+
+    def get_part(name):
+        if name not in part_to_ds:
+            ds = parted_dataset[name]
+            subparts = [get_part(s) for s in parted_dataset.part_to_split[name][0]]
+            part_to_ds[name] = Dataset(name=ds.name, subset=ds.subset, modifiers=ds.modifiers,
+                                       info=ds.info, data=ConcatDataset(subparts))
+        return part_to_ds[name]
+
+    for name in parted_dataset.keys():
+        get_part(name)
+    return PartedDataset(part_to_ds, parted_dataset.part_to_split)
+
+
 class CachingDatasetFactory(DatasetFactory):
-    def __init__(self, datasets_dir_or_factory, cache_dir, parted_ds_transforms=()):
+    """A dataset factory that caches the datasets.
+
+    By default, whole datasets are cached on disk, encoded with `codec`, if
+    there is enough space (see `cache_data_lazily`). If `ram_budget` is
+    provided, caches are placed by `cache_data_planned`.
+    """
+
+    def __init__(self, datasets_dir_or_factory, cache_dir, parted_ds_transforms=(),
+                 ram_budget=None, disk_budget=None, codec=None):
         ddof = datasets_dir_or_factory
         super().__init__(ddof.datasets_dirs if isinstance(ddof, DatasetFactory) else ddof)
         self.cache_dir = cache_dir
         self.parted_ds_transforms = parted_ds_transforms
+        self.ram_budget = ram_budget
+        self.disk_budget = disk_budget
+        self.codec = codec
 
     def __call__(self, ds_name, **kwargs):
         pds = super().__call__(ds_name, **kwargs)
         for transform in self.parted_ds_transforms:
             pds = transform(pds)
-        return cache_data_lazily(pds, self.cache_dir)
+        if self.ram_budget is not None:
+            return cache_data_planned(pds, self.cache_dir, self.ram_budget, self.disk_budget)
+        return cache_data_lazily(pds, self.cache_dir, codec=self.codec)
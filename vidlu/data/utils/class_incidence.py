@@ -1,10 +1,14 @@
+import os
+import pickle
 from collections import defaultdict
+from pathlib import Path
 
 import numpy as np
 import cv2
 from tqdm import tqdm
 
 from vidlu.utils.loadsave import NumpyLoadSave, PickleLoadSave
+from vidlu.utils.path import create_file_atomic
 
 class_info_to_fmgr = dict(incidence=NumpyLoadSave,
                           instances=PickleLoadSave,
@@ -12,32 +16,104 @@ class_info_to_fmgr = dict(incidence=NumpyLoadSave,
 
 
 def get_class_segment_boxes(y, classes):
-    image_instances = {c: [] for c in classes}
+    image_instances = dict()
     for c in classes:
         mask = np.uint8(y == c)
-        num, masks = cv2.connectedComponents(mask)
-        for j in range(1, num):
-            component = masks == j
-            cols = np.where(np.any(component, axis=0))[0]  # W
-            rows = np.where(np.any(component, axis=1))[0]  # H
-            cols_min, cols_max = cols.min().item(), cols.max().item()
-            rows_min, rows_max = rows.min().item(), rows.max().item()
-            image_instances[c] += [[cols_min, cols_max, rows_min, rows_max]]
-    return {c: np.array(v, dtype=np.uint16) for c, v in image_instances.items()}
-
-
-def segmentation_class_info(ds):
+        # Grana's algorithm computes statistics much faster than the default one
+        num, _, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(
+            mask, 8, cv2.CV_32S, cv2.CCL_GRANA)
+        left, top = stats[1:num, cv2.CC_STAT_LEFT], stats[1:num, cv2.CC_STAT_TOP]
+        right = left + stats[1:num, cv2.CC_STAT_WIDTH] - 1
+        bottom = top + stats[1:num, cv2.CC_STAT_HEIGHT] - 1
+        image_instances[c] = np.stack([left, right, top, bottom], axis=1).astype(np.uint16)
+    return image_instances
+
+
+def get_class_counts(y, class_count):
+    """Returns pixel counts of classes `0..class_count-1` and the ignore class
+    -1 (the last element)."""
+    y = y.ravel()
+    if y.dtype.kind == 'i':
+        y = np.where(y < 0, class_count, y)  # bincount does not accept negative values
+    counts = np.bincount(y, minlength=class_count + 1)
+    if len(counts) > class_count + 1:
+        raise ValueError(f"Labels contain a value greater than {class_count - 1}.")
+    return counts
+
+
+class _ChunkClassInfo:
+    # not local for picklability, used only in segmentation_class_info
+    def __init__(self, dataset, class_count):
+        self.dataset = dataset
+        self.class_count = class_count
+
+    def __call__(self, indices):
+        C = self.class_count
+        dist = np.zeros((len(indices), C + 1), dtype=np.uint64)
+        instances = []
+        for j, i in enumerate(indices):
+            y = np.asarray(self.dataset[int(i)]['y']).squeeze()
+            dist[j] = get_class_counts(y, C)
+            classes = [c if c < C else -1 for c in np.flatnonzero(dist[j]).tolist()]
+            instances.append(get_class_segment_boxes(y, classes))
+        return dist, instances
+
+
+def segmentation_class_info(ds, num_workers=None, chunk_size=64, partial_dir=None,
+                            progress_bar=True):
+    """Computes per-image class pixel counts (`dist`), their sum
+    (`incidence`) and per-image bounding boxes of connected segments of each
+    present class (`instances`) of a segmentation dataset.
+
+    Labels equal to -1 (ignored pixels) are counted in the last column of
+    `dist`. The dataset is split into chunks of consecutive indices that are
+    processed in data loader worker processes.
+
+    Args:
+        ds: A dataset with label images in the `y` field and
+            `info.class_count`.
+        num_workers (int, optional): The number of worker processes. The
+            default is the number of CPUs.
+        chunk_size (int): The number of examples processed by a worker at once.
+        partial_dir (optional): A directory for results of processed chunks.
+            If provided, an interrupted computation continues from the
+            completed chunks. It should be specific to the dataset and can be
+            deleted after the results are saved with `save_class_info`.
+        progress_bar (bool): Whether to show a progress bar.
+    """
+    from torch.utils.data import DataLoader
+
     C = ds.info.class_count
-    class_dist = np.zeros((len(ds), C + 1), dtype=np.uint64)
-    instances = []
-    for i, example in enumerate(tqdm(ds, total=len(ds))):
-        y = example['y'].squeeze().numpy()
-        classes, counts = np.unique(y, return_counts=True)
-        class_dist[i, classes] += counts
-        instances.append(get_class_segment_boxes(y, classes))
-    incidence = class_dist.sum(0)
-    result = dict(incidence=incidence, instances=instances, dist=class_dist)
-    return result
+    starts = range(0, len(ds), chunk_size)
+    chunk_paths = [None] * len(starts)
+    results = [None] * len(starts)
+    if partial_dir is not None:
+        partial_dir = Path(partial_dir)
+        os.makedirs(partial_dir, exist_ok=True)
+        for k, start in enumerate(starts):
+            chunk_paths[k] = partial_dir / f"{start}-{min(start + chunk_size, len(ds))}.pkl"
+            if chunk_paths[k].exists():
+                with open(chunk_paths[k], 'rb') as f:
+                    results[k] = pickle.load(f)
+    todo = [k for k, r in enumerate(results) if r is None]
+    chunks = [np.arange(starts[k], min(starts[k] + chunk_size, len(ds))) for k in todo]
+    if num_workers is None:
+        num_workers = min(os.cpu_count() or 1, len(chunks))
+    chunk_infos = DataLoader(chunks, batch_size=None, num_workers=num_workers,
+                             collate_fn=_ChunkClassInfo(ds, C))
+    with tqdm(total=len(ds), initial=len(ds) - sum(map(len, chunks)),
+              disable=not progress_bar) as pbar:
+        for k, chunk, result in zip(todo, chunks, chunk_infos):
+            results[k] = result
+            if partial_dir is not None:
+                create_file_atomic(chunk_paths[k],
+                                   lambda f: pickle.dump(result, f, protocol=4))
+            pbar.update(len(chunk))
+
+    class_dist = (np.concatenate([d for d, _ in results]) if len(results) > 0 else
+                  np.zeros((0, C + 1), dtype=np.uint64))
+    instances = [inst for _, chunk_instances in results for inst in chunk_instances]
+    return dict(incidence=class_dist.sum(0), instances=instances, dist=class_dist)
 
 
 def save_class_info(class_info, subset, suffix, ds_root):
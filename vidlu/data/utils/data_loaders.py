@@ -1,13 +1,11 @@
 import typing as T
 from numbers import Real
 
-import numpy as np
-import torch.utils.data as tud
-
 from vidlu.data.data_loader import ZipDataLoader, DataLoader
 from vidlu.data.dataset import Dataset
 from vidlu.data.record import Record
 import vidlu.data.utils.samplers as samplers
+from vidlu.utils.func import partial
 from vidlu.utils.misc import broadcast
 
 
@@ -68,35 +66,38 @@ def simple_or_multi_data_loader(*datasets,
         multi_data_loader_f(*datasets, data_loader_f=data_loader_f, **kwargs)
 
 
+def _add_ds_index(r, ds_index):
+    return Record(r, ds_index=ds_index)
+
+
 def mixed_data_loader(*datasets: T.Sequence[Dataset],
                       data_loader_f: TDataLoaderF,
-                      dataset_weights: T.Sequence[int] = None,
+                      dataset_weights: T.Sequence[float] = None,
                       example_weights: T.Sequence[T.Sequence[float]] = None,
+                      replacement: bool = False,
                       **kwargs):
-    N = sum(len(ds) for ds in datasets)
-    if dataset_weights is None:
-        dataset_weights = [len(ds) / N for ds in datasets]  # proportional to dataset size
-    else:
-        if len(dataset_weights) != len(datasets):
-            raise RuntimeError(
-                "The number of dataset weights does not match the number of datasets.")
-        dataset_weights = np.array(dataset_weights) / sum(dataset_weights)
-    if example_weights is not None and any(
-            len(ew) != len(ds) for ew, ds in zip(example_weights, datasets)):
-        raise RuntimeError(
-            "Lengths of vectors of example weights do not match lengths of datasets.")
-
-    datasets = [ds.map(lambda r: Record(r, ds_index=i)) for i, ds in enumerate(datasets)]
+    """Creates a data loader that samples examples from the union of datasets
+    according to dataset weights and, optionally, example weights.
+
+    Examples get a `ds_index` field with the index of their dataset.
+
+    Args:
+        datasets: A sequence of datasets.
+        data_loader_f: A data loader factory that accepts a `sampler`.
+        dataset_weights (optional): Probabilities (not necessarily normalized)
+            of sampling from each dataset. The default is proportional to
+            dataset sizes.
+        example_weights (optional): For each dataset, a vector of weights (not
+            necessarily normalized) of its examples.
+        replacement (bool): Whether to sample with replacement. If `False`,
+            each example is sampled once per epoch and the weights determine
+            the order.
+        **kwargs: Data loader (factory) arguments.
+    """
+    sampler = samplers.MixtureSampler([len(ds) for ds in datasets], dataset_weights,
+                                      example_weights, replacement=replacement)
+    datasets = [ds.map(partial(_add_ds_index, ds_index=i)) for i, ds in enumerate(datasets)]
     ds_all = datasets[0].join(*datasets[1:])
-    if example_weights is not None:
-        example_weights = list(map(np.array, example_weights))
-        weights = sum(
-            [list(wd / we.sum() * we) for wd, we in zip(dataset_weights, example_weights)], [])
-    else:
-        weights = sum([[wd / len(ds)] * len(ds) for ds, wd in zip(datasets, dataset_weights)], [])
-    sampler = tud.WeightedRandomSampler(weights=weights,
-                                        num_samples=sum(len(ds) for ds in datasets),
-                                        replacement=False)
     return data_loader_f(ds_all, sampler=sampler, **kwargs)
 
 
@@ -121,10 +122,8 @@ def morsic_semisup_data_loader(
     if callable(labeled_multiplier):
         labeled_multiplier = labeled_multiplier(nl, nu)
     ds_all = ds_l.join(ds_u)
-    indices_l = list(range(nl)) * labeled_multiplier
-    indices_u = list(range(nl, nl + nu))
-    indices = indices_l * labeled_multiplier + indices_u
-    sampler = tud.SubsetRandomSampler(indices=indices)
+    sampler = samplers.MultisetSampler([labeled_multiplier, 1],
+                                       ranges=[(0, nl), (nl, nl + nu)])
     if kwargs.get("shuffle", False):
         raise ValueError("The shuffle argument should be False.")
     return data_loader_f(ds_all, sampler=sampler, shuffle=False, **kwargs)
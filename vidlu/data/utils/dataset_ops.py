@@ -5,17 +5,20 @@ from tqdm import tqdm, trange
 from vidlu.data import Dataset
 
 
-def rotating_labels(ds: Dataset) -> Dataset:
+def rotating_labels(ds: Dataset, num_workers=0, cache_dir=None) -> Dataset:
     """ Orders examples so that in each length C slice of the dataset all C
     classes are present.
 
     In each slice classes start from 1 to C
+
+    `num_workers` and `cache_dir` are passed to `Dataset.filter_split_indices`.
     """
     class_count = ds.info['class_count']
     # Divide examples in groups
     class_subset_indices = ds.filter_split_indices(
         [lambda d, i=i: bool(d.y == i) for i in range(class_count)],
-        progress_bar=partial(tqdm, desc='rotating_labels'))[:-1]
+        progress_bar=partial(tqdm, desc='rotating_labels'), num_workers=num_workers,
+        cache_dir=cache_dir, func_name=f'y==0..{class_count - 1}')[:-1]
     if any(len(csi) != len(ds) // class_count for csi in class_subset_indices):
         raise ValueError(f"The distribution of labels in the dataset should be uniform, "
                          f"not {[len(csi) for csi in class_subset_indices]}.")
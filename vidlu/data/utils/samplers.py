@@ -1,6 +1,230 @@
+"""Samplers that represent datasets, weights and index ranges compactly.
+
+The samplers keep per-dataset weights, ranges and multiplicities and at most
+one numpy array of per-example values instead of Python lists of indices or
+weights. They generate indices in numpy blocks. Drawing with replacement takes
+constant time per sample and permutations take linear time per epoch.
+"""
+
+import typing as T
+
+import numpy as np
+import torch
 import torch.utils.data as tud
 
 
+def _index_dtype(n):
+    return np.int32 if n <= np.iinfo(np.int32).max else np.int64
+
+
+class AliasTable:
+    """A table for sampling from a categorical distribution in constant time
+    per sample with the alias method (Vose's algorithm).
+
+    Construction takes `O(len(weights))` time in Python, so it is meant for
+    small numbers of categories, e.g. datasets.
+
+    Args:
+        weights: Non-negative weights of categories, not necessarily
+            normalized.
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or len(weights) == 0 or np.any(weights < 0) \
+                or not weights.sum() > 0:
+            raise ValueError("Weights must be a non-empty vector of non-negative numbers with a"
+                             + " positive sum.")
+        n = len(weights)
+        scaled = (weights * (n / weights.sum())).tolist()
+        self.prob = np.ones(n)
+        self.alias = np.arange(n, dtype=_index_dtype(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s], self.alias[s] = scaled[s], l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        # the remaining probabilities differ from 1 only due to rounding errors
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, rng: np.random.Generator, size):
+        i = rng.integers(0, len(self.prob), size=size, dtype=self.alias.dtype)
+        return np.where(rng.random(size) < self.prob[i], i, self.alias[i])
+
+
+class BlockSampler(tud.Sampler):
+    """A base class for samplers that generate indices in numpy arrays.
+
+    Subclasses implement `_sample_blocks`, which yields arrays of indices.
+    Random numbers are generated by a numpy generator seeded from
+    `generator` (or the global PyTorch generator) in each epoch, so that
+    sampling is controlled by `torch.manual_seed` like in PyTorch samplers.
+    """
+    block_size = 1 << 14
+
+    def __init__(self, generator: T.Optional[torch.Generator] = None):
+        self.generator = generator
+
+    def _get_rng(self):
+        seed = torch.empty((), dtype=torch.int64).random_(generator=self.generator).item()
+        return np.random.default_rng(seed)
+
+    def _sample_blocks(self, rng: np.random.Generator) -> T.Iterator[np.ndarray]:
+        raise NotImplementedError
+
+    def __iter__(self):
+        for block in self._sample_blocks(self._get_rng()):
+            yield from block.tolist()
+
+
+class MultisetSampler(BlockSampler):
+    """Yields all elements of a multiset of indices in random order in each
+    epoch.
+
+    The multiset contains each index from `ranges[i]` `multiplicities[i]`
+    times. If `ranges` is `None`, the multiset contains each index `i`
+    `multiplicities[i]` times.
+
+    Args:
+        multiplicities: Non-negative integer multiplicities.
+        ranges (optional): Pairs `(start, stop)` representing ranges of
+            indices, one for each element of `multiplicities`.
+        generator (optional): A random number generator.
+    """
+
+    def __init__(self, multiplicities: T.Sequence[int],
+                 ranges: T.Optional[T.Sequence[T.Tuple[int, int]]] = None,
+                 generator=None):
+        super().__init__(generator)
+        multiplicities = np.asarray(multiplicities, dtype=np.int64)
+        if ranges is None:
+            starts = np.arange(len(multiplicities), dtype=np.int64)
+            sizes = np.ones(len(multiplicities), dtype=np.int64)
+        else:
+            if len(ranges) != len(multiplicities):
+                raise ValueError("The number of ranges does not equal the number of"
+                                 + " multiplicities.")
+            starts, stops = np.array(ranges, dtype=np.int64).reshape(-1, 2).T
+            sizes = stops - starts
+        if np.any(multiplicities < 0) or np.any(sizes < 0):
+            raise ValueError("Multiplicities and range sizes must be non-negative.")
+        counts = sizes * multiplicities
+        self.ends = np.cumsum(counts)
+        self.offsets = self.ends - counts
+        self.starts, self.sizes = starts, sizes
+        self.singletons = ranges is None
+
+    def __len__(self):
+        return int(self.ends[-1]) if len(self.ends) > 0 else 0
+
+    def _sample_blocks(self, rng):
+        positions = np.arange(len(self), dtype=_index_dtype(len(self)))
+        rng.shuffle(positions)
+        for i in range(0, len(positions), self.block_size):
+            pos = positions[i:i + self.block_size]
+            k = np.searchsorted(self.ends, pos, side='right')
+            yield k if self.singletons else \
+                self.starts[k] + (pos - self.offsets[k]) % self.sizes[k]
+
+
+class MixtureSampler(BlockSampler):
+    """Samples indices of the concatenation of datasets according to
+    per-dataset weights and optional per-example weights within datasets.
+
+    With replacement, the dataset of each sample is drawn from an
+    `AliasTable` and the example within the dataset is drawn uniformly or, if
+    `example_weights` are given, by inverting the cumulative distribution
+    function. Without replacement, indices are ordered by keys
+    `log(u) / weight` with `u ~ U(0, 1)` (Efraimidis and Spirakis), which
+    gives the same distribution as sequential weighted sampling without
+    replacement.
+
+    Args:
+        sizes: Lengths of the datasets.
+        dataset_weights (optional): Probabilities (not necessarily normalized)
+            of sampling from each dataset. The default is proportional to
+            dataset sizes.
+        example_weights (optional): For each dataset, `None` or a vector of
+            weights (not necessarily normalized) of its examples.
+        num_samples (optional): The number of samples per epoch. The default
+            is the sum of `sizes`.
+        replacement (bool): Whether to sample with replacement. If `False`,
+            `num_samples` must not be greater than the sum of `sizes`.
+        generator (optional): A random number generator.
+    """
+
+    def __init__(self, sizes: T.Sequence[int], dataset_weights: T.Sequence[float] = None,
+                 example_weights: T.Sequence[T.Optional[T.Sequence[float]]] = None,
+                 num_samples: int = None, replacement: bool = True, generator=None):
+        super().__init__(generator)
+        self.sizes = np.array(sizes, dtype=np.int64)
+        self.offsets = np.cumsum(self.sizes) - self.sizes
+        total = int(self.sizes.sum())
+        if dataset_weights is None:
+            dataset_weights = self.sizes
+        elif len(dataset_weights) != len(sizes):
+            raise ValueError("The number of dataset weights does not match the number of"
+                             + " datasets.")
+        self.dataset_weights = np.array(dataset_weights, dtype=np.float64)
+        self.dataset_weights /= self.dataset_weights.sum()
+        if example_weights is None:
+            example_weights = [None] * len(sizes)
+        elif len(example_weights) != len(sizes) or any(
+                ew is not None and len(ew) != n for ew, n in zip(example_weights, sizes)):
+            raise ValueError("Lengths of vectors of example weights do not match lengths of"
+                             + " datasets.")
+        self.example_weights = [None if ew is None else np.asarray(ew, dtype=np.float64)
+                                for ew in example_weights]
+        self.num_samples = total if num_samples is None else num_samples
+        self.replacement = replacement
+        if not replacement and self.num_samples > total:
+            raise ValueError("num_samples must not be greater than the total number of"
+                             + " examples when sampling without replacement.")
+        if replacement:
+            self.alias_table = AliasTable(self.dataset_weights)
+            self.cdfs = [None if ew is None else np.cumsum(ew / ew.sum())
+                         for ew in self.example_weights]
+
+    def __len__(self):
+        return self.num_samples
+
+    def _sample_blocks(self, rng):
+        return (self._sample_with_replacement if self.replacement else
+                self._sample_without_replacement)(rng)
+
+    def _sample_with_replacement(self, rng):
+        for i in range(0, self.num_samples, self.block_size):
+            size = min(self.block_size, self.num_samples - i)
+            d = self.alias_table.sample(rng, size)
+            indices = np.empty(size, dtype=np.int64)
+            for j, cdf in enumerate(self.cdfs):
+                mask = d == j
+                n = int(np.count_nonzero(mask))
+                if cdf is None:
+                    indices[mask] = rng.integers(0, self.sizes[j], size=n)
+                else:  # cdf[-1] can be less than 1 due to rounding errors
+                    indices[mask] = np.minimum(np.searchsorted(cdf, rng.random(n) * cdf[-1],
+                                                               side='right'),
+                                               self.sizes[j] - 1)
+                indices[mask] += self.offsets[j]
+            yield indices
+
+    def _sample_without_replacement(self, rng):
+        keys = np.empty(int(self.sizes.sum()))
+        for j, (n, wd, ew) in enumerate(zip(self.sizes, self.dataset_weights,
+                                            self.example_weights)):
+            weights = wd / n if ew is None else wd * ew / ew.sum()
+            with np.errstate(divide='ignore'):  # zero weights give keys equal to -inf
+                keys[self.offsets[j]:self.offsets[j] + n] = np.log(rng.random(n)) / weights
+        order = np.argsort(-keys, kind='stable')[:self.num_samples]
+        for i in range(0, len(order), self.block_size):
+            yield order[i:i + self.block_size]
+
+
 def multiset_sampler(multiplicities, dataset=None):
     if dataset is not None:
         if multiplicities is None:
@@ -8,5 +232,4 @@ def multiset_sampler(multiplicities, dataset=None):
         if not len(dataset) == len(multiplicities):
             raise RuntimeError(f"The size of multiplicities ({len(multiplicities)} does not equal"
                                + f" the size of the dataset ({len(dataset)}).")
-    indices = [i for i, m in enumerate(multiplicities) for _ in range(m)]
-    return tud.SubsetRandomSampler(indices=indices)
+    return MultisetSampler(multiplicities)
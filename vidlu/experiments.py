@@ -57,6 +57,7 @@ def define_training_loop_actions(trainer: Trainer, cpman: CheckpointManager, dat
                                     perf=es_val.metrics[main_metrics[0]],
                                     log="\n".join(logger.lines),
                                     epoch=es.epoch))
+            logger.log(f"Checkpoint saving blocked training for {cpman.save_latencies[-1]:.3f} s")
 
     def report_metrics(es, is_validation=False):
         def eval_str(metrics):
@@ -131,7 +132,8 @@ def get_checkpoint_manager(training_args: TrainingExperimentFactoryArgs, checkpo
                               mode='restart' if a.restart else 'resume' if a.resume else 'new',
                               perf_func=lambda s: s.get('perf', 0),
                               log_func=lambda s: s.get('log', ""),
-                              name_suffix_func=lambda s: f"{s['epoch']}_{s['perf']:.3f}")
+                              name_suffix_func=lambda s: f"{s['epoch']}_{s['perf']:.3f}",
+                              async_save=True)
     return cpman
 
 
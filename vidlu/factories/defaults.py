@@ -74,6 +74,7 @@ def get_trainer_args(trainer_extension_fs, dataset):
 
 def get_metrics(trainer, problem):  # TODO: move to configs
     from vidlu import metrics
+    from vidlu.torch_utils import DeferredScalar
 
     common_names = ['mem', 'freq', 'loss', 'A', 'mIoU']
 
@@ -85,7 +86,7 @@ def get_metrics(trainer, problem):  # TODO: move to configs
         clf_metric_names = ('A', 'mIoU', 'IoU') if isinstance(problem, SemanticSegmentation) else ('A',)
         hard_prediction_name = "other_outputs.hard_prediction"
         ret.append(partial(metrics.AverageMultiMetric,
-                           filter=lambda k, v: isinstance(v, (int, float))
+                           filter=lambda k, v: isinstance(v, (int, float, DeferredScalar))
                                                and not (any(k.startswith(c) for c in common_names))))
         if any(isinstance(e, t.AdversarialTraining) for e in trainer.extensions):
             ret.append(partial(metrics.with_suffix(metrics.ClassificationMetrics, 'adv'),
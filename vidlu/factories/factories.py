@@ -136,7 +136,7 @@ def get_data_preparation(dataset):
 def prepare_data(data, datasets_dir, cache_dir):
     datasets = [ds for _, ds in data]
     preparers = [get_data_preparation(ds) for ds in datasets]
-    return tuple(prepare(ds) for prepare, ds in zip(preparers, datasets))
+    return tuple(prepare(ds).fuse() for prepare, ds in zip(preparers, datasets))
 
 
 def get_prepared_data(data_str: str, datasets_dir, cache_dir):
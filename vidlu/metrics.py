@@ -5,6 +5,7 @@ import torch
 from functools import wraps
 
 from vidlu.ops import one_hot
+from vidlu.torch_utils import DeferredScalar, to_number
 from vidlu.utils.num import KleinSum
 
 EPS = 1e-8
@@ -30,42 +31,84 @@ def _get_iter_output(iter_output, name):
     return iter_output
 
 
-def multiclass_confusion_matrix(true, pred, class_count, dtype=None, batch=False):
+def multiclass_confusion_matrix(true, pred, class_count, dtype=None, batch=False, ignore_index=-1,
+                                chunk_size=2 ** 22):
     """ Computes a multi-class confusion matrix.
 
+    The matrix is computed with `bincount` over `true * class_count + pred`,
+    which requires memory linear in the chunk size rather than in the number of
+    elements times `class_count` like the one-hot-based approach.
+
     Args:
         true (Tensor): a vector of integers representing true classes.
         pred (Tensor): a vector of integers representing predicted classes.
         class_count (int): number of classes.
         dtype (optional): confusion matrix data type.
+        batch (bool): whether the first dimension is the batch dimension.
+        ignore_index (int, optional): the label of elements that are to be
+            ignored.
+        chunk_size (int): the maximum number of elements processed at once.
 
     Returns:
         A confusion matrix with shape (class_count, class_count).
     """
-    return soft_pred_multiclass_confusion_matrix(true, one_hot(pred, class_count, dtype=torch.float64),
-                                                 batch=batch) \
-        .to(dtype or torch.int64)
-
-
-def soft_pred_multiclass_confusion_matrix(true, pred, dtype=None, batch=False):
+    C = class_count
+    if batch:
+        batch_size = len(true)
+        offsets = torch.arange(batch_size, device=true.device).mul_(C * C)
+        true, pred = true.reshape(batch_size, -1), pred.reshape(batch_size, -1)
+        index = (true.long() * C + pred).add_(offsets[:, None])
+        true, index = true.reshape(-1), index.reshape(-1)
+        shape = (batch_size, C, C)
+    else:
+        true, pred = true.reshape(-1), pred.reshape(-1)
+        index, shape = None, (C, C)
+    cm = torch.zeros(np.prod(shape), dtype=torch.int64, device=true.device)
+    for i in range(0, len(true), chunk_size):
+        t = true[i:i + chunk_size]
+        ind = index[i:i + chunk_size] if batch else t.long() * C + pred[i:i + chunk_size]
+        if ignore_index is not None:
+            ind = ind[t != ignore_index]
+        cm += torch.bincount(ind, minlength=len(cm))
+    return cm.view(shape).to(dtype or torch.int64)
+
+
+def soft_pred_multiclass_confusion_matrix(true, pred, dtype=None, batch=False, ignore_index=-1,
+                                          chunk_size=2 ** 20):
     """ Computes a soft multi-class confusion matrix from probabilities.
 
+    If `batch` is `False`, rows of the matrix are accumulated with
+    `index_add_`, in chunks of at most `chunk_size` elements.
+
     Args:
         true (Tensor): a vector of integers representing true classes.
         pred (Tensor): an array consisting of vectors representing predicted class
             probabilities.
         dtype (optional): confusion matrix data type.
+        batch (bool): whether the first dimension is the batch dimension.
+        ignore_index (int, optional): the label of elements that are to be
+            ignored.
+        chunk_size (int): the maximum number of elements processed at once.
 
     Returns:
         A soft confusion matrix with shape (class_count, class_count)
     """
     dtype = dtype or pred.dtype
     class_count = pred.shape[-1]
-    non_ignored = true != -1
     if batch:
+        non_ignored = true != ignore_index
         assert torch.all(non_ignored)
-    return all_soft_multiclass_confusion_matrix(one_hot(true[non_ignored], class_count, dtype=dtype),
-                                                pred[non_ignored].to(dtype), batch=batch)
+        return all_soft_multiclass_confusion_matrix(one_hot(true, class_count, dtype=dtype),
+                                                    pred.to(dtype), batch=batch)
+    true, pred = true.reshape(-1), pred.reshape(-1, class_count)
+    cm = pred.new_zeros((class_count, class_count), dtype=dtype)
+    for i in range(0, len(true), chunk_size):
+        t, p = true[i:i + chunk_size], pred[i:i + chunk_size]
+        if ignore_index is not None:
+            non_ignored = t != ignore_index
+            t, p = t[non_ignored], p[non_ignored]
+        cm = cm.index_add(0, t, p.to(dtype))
+    return cm
 
     # 3 - 4 times faster than
     # cm = torch.empty(list(true.shape[:int(batch)]) + [class_count] * 2,
@@ -179,13 +222,16 @@ def mIoU(cm, eps=1e-8):
 class ClassificationMetrics(AccumulatingMetric):
     def __init__(self, class_count, target_name="target",
                  hard_prediction_name="other_outputs.hard_prediction",
-                 metrics=('A', 'mP', 'mR', 'mIoU'), device=None):
+                 metrics=('A', 'mP', 'mR', 'mIoU'), device=None, ignore_index=-1,
+                 chunk_size=2 ** 22):
         self.class_count = class_count
         self.cm = torch.zeros([class_count] * 2, dtype=torch.int64, requires_grad=False,
                               device=device)
         self.target_name = target_name
         self.hard_prediction_name = hard_prediction_name
         self.metrics = metrics
+        self.ignore_index = ignore_index
+        self.chunk_size = chunk_size
 
     @torch.no_grad()
     def reset(self):
@@ -195,7 +241,9 @@ class ClassificationMetrics(AccumulatingMetric):
     def update(self, iter_output):
         true = _get_iter_output(iter_output, self.target_name).flatten()
         pred = _get_iter_output(iter_output, self.hard_prediction_name).flatten()
-        cm = multiclass_confusion_matrix(true, pred, self.class_count)
+        cm = multiclass_confusion_matrix(true, pred, self.class_count,
+                                         ignore_index=self.ignore_index,
+                                         chunk_size=self.chunk_size)
         if self.cm.device != cm.device:
             self.cm = self.cm.to(cm.device)
         self.cm += cm
@@ -214,25 +262,36 @@ class _MeanMetric(AccumulatingMetric, metaclass=ABCMeta):
 
     def reset(self):
         self._sum = KleinSum()
+        self._tensor_sum = None  # accumulated on the device of deferred values
         self._n = EPS
 
+    @torch.no_grad()
+    def _add(self, value):
+        if isinstance(value, DeferredScalar):
+            value = value.tensor.detach().to(torch.float64)
+            self._tensor_sum = value if self._tensor_sum is None else self._tensor_sum + value
+        else:
+            self._sum += value
+        self._n += 1
+
+    def _get_sum(self):
+        return self._sum.value + (0 if self._tensor_sum is None else self._tensor_sum.item())
+
 
 class AverageMetric(_MeanMetric):
     def update(self, iter_output):
-        self._sum += self.value_extractor(iter_output)
-        self._n += 1
+        self._add(self.value_extractor(iter_output))
 
     def compute(self):
-        return {self.name: self._sum.value / self._n}
+        return {self.name: self._get_sum() / self._n}
 
 
 class HarmonicMeanMetric(_MeanMetric):
     def update(self, iter_output):
-        self._sum += 1 / self.value_extractor(iter_output)
-        self._n += 1
+        self._add(1 / self.value_extractor(iter_output))
 
     def compute(self):
-        return {self.name: self._n / self._sum.value}
+        return {self.name: self._n / self._get_sum()}
 
 
 class _ExtremumMetric(AccumulatingMetric):
@@ -247,7 +306,7 @@ class _ExtremumMetric(AccumulatingMetric):
 
     @torch.no_grad()
     def update(self, iter_output):
-        val = self.extract_func(iter_output)
+        val = to_number(self.extract_func(iter_output))
         self._ext = self.extremum_func(self._ext or val, val)
 
     @torch.no_grad()
@@ -311,13 +370,17 @@ class MinMultiMetric(_MultiMetric):
 
 class SoftClassificationMetrics(AccumulatingMetric):
     def __init__(self, class_count, target_name="target", probs_name="other_outputs.probs",
-                 metrics=('A', 'mP', 'mR', 'mIoU')):
+                 metrics=('A', 'mP', 'mR', 'mIoU'), device=None, ignore_index=-1,
+                 chunk_size=2 ** 20):
         super().__init__()
         self.class_count = class_count
-        self.cm = torch.zeros([class_count] * 2, dtype=torch.float64, requires_grad=False)
+        self.cm = torch.zeros([class_count] * 2, dtype=torch.float64, requires_grad=False,
+                              device=device)
         self.target_name = target_name
         self.probs_name = probs_name
         self.metrics = metrics
+        self.ignore_index = ignore_index
+        self.chunk_size = chunk_size
 
     @torch.no_grad()
     def reset(self):
@@ -326,9 +389,14 @@ class SoftClassificationMetrics(AccumulatingMetric):
     @torch.no_grad()
     def update(self, iter_output):
         true = _get_iter_output(iter_output, self.target_name).flatten()
-        pred = _get_iter_output(iter_output, self.probs_name).permute(0, 2, 3, 1)
-        pred = pred.flatten().view(-1, pred.shape[-1])
-        self.cm += soft_pred_multiclass_confusion_matrix(true, pred, self.class_count)
+        pred = _get_iter_output(iter_output, self.probs_name)
+        pred = pred.movedim(1, -1).reshape(-1, pred.shape[1])
+        cm = soft_pred_multiclass_confusion_matrix(true, pred, dtype=torch.float64,
+                                                   ignore_index=self.ignore_index,
+                                                   chunk_size=self.chunk_size)
+        if self.cm.device != cm.device:
+            self.cm = self.cm.to(cm.device)
+        self.cm += cm
 
     compute = ClassificationMetrics.compute
 
@@ -1,6 +1,7 @@
 from abc import ABC
 from argparse import Namespace
 import collections
+import contextlib
 import functools
 from functools import reduce
 import typing as T
@@ -239,6 +240,65 @@ class InitializableMixin:
         return y
 
 
+# Output naming ####################################################################################
+
+_output_naming_modes = ('call_stack', 'precomputed', 'off')
+_output_naming_default = 'call_stack'
+
+
+def set_output_naming(mode: T.Literal['call_stack', 'precomputed', 'off'], module=None):
+    """Sets how module outputs are tagged with names of modules producing them.
+
+    With `'call_stack'`, the qualified name of the module is looked up by
+    inspecting the call stack on every call. With `'precomputed'`, names of the
+    submodules of `module` are computed from `named_modules` once and the names
+    of modules that are not in the table (e.g. the ones created during
+    building) are looked up from the call stack only on the first call. With
+    `'off'`, outputs are not tagged. Submodules that are created when `module`
+    or its submodules are built inherit the mode.
+
+    Args:
+        mode: The naming mode.
+        module: The root module whose submodules are to use the mode. If `None`,
+            the global default for modules without an assigned mode is set.
+    """
+    global _output_naming_default
+    if mode not in _output_naming_modes:
+        raise ValueError(f"Invalid output naming mode {mode}. It should be in"
+                         + f" {_output_naming_modes}.")
+    if module is None:
+        _output_naming_default = mode
+        return
+    for name, m in module.named_modules():
+        if isinstance(m, Module):
+            m._output_naming = mode
+            if mode == 'precomputed':
+                m._output_name = f'ROOT.{name}' if name else 'ROOT'
+
+
+@contextlib.contextmanager
+def output_naming(mode: T.Literal['call_stack', 'precomputed', 'off'], module=None):
+    """A context manager that temporarily sets the output naming mode.
+
+    See `set_output_naming` for more information."""
+    if module is None:
+        state = _output_naming_default
+        set_output_naming(mode)
+        try:
+            yield
+        finally:
+            set_output_naming(state)
+    else:
+        state = {m: (m._output_naming, m._output_name) for m in module.modules()
+                 if isinstance(m, Module)}
+        set_output_naming(mode, module)
+        try:
+            yield
+        finally:
+            for m, (naming, name) in state.items():
+                m._output_naming, m._output_name = naming, name
+
+
 # Core Modules #####################################################################################
 
 def is_built(module, including_submodules=False):
@@ -261,6 +321,8 @@ class Module(nn.Module, SplittableMixin, InvertibleMixin, ABC):
         self._check = None
         self._mode = dict()
         self._forward_check_pre_hooks = dict()
+        self._output_naming = None  # the global default is used if None
+        self._output_name = None
 
     @property
     def _checked(self):
@@ -274,6 +336,10 @@ class Module(nn.Module, SplittableMixin, InvertibleMixin, ABC):
         device = _try_get_device_from_args(*args, **kwargs)
         if type(self).build != Module.build:
             self.build(*args, **kwargs)
+            if self._output_naming is not None:  # submodules created by `build` inherit it
+                for m in self.modules():
+                    if isinstance(m, Module) and m._output_naming is None:
+                        m._output_naming = self._output_naming
         if device is not None:
             self.to(device)
         if type(self).post_build != Module.post_build:
@@ -328,7 +394,7 @@ class Module(nn.Module, SplittableMixin, InvertibleMixin, ABC):
                 result = self._check_call(*input, **kwargs)
             else:
                 result = super().__call__(*input, **kwargs)
-            return TeName.add(result, vmu.try_get_module_name_from_call_stack(self))
+            return self._name_output(result)
         except Exception as e:
             name = vmu.try_get_module_name_from_call_stack(self)
             error_message = f"Error in {name}, {type(self).__name__}"
@@ -338,6 +404,16 @@ class Module(nn.Module, SplittableMixin, InvertibleMixin, ABC):
             print(error_message)
             raise e
 
+    def _name_output(self, result):
+        mode = self._output_naming or _output_naming_default
+        if mode == 'off':
+            return result
+        if mode == 'call_stack':
+            return TeName.add(result, vmu.try_get_module_name_from_call_stack(self))
+        if self._output_name is None:  # a module created after the table has been computed
+            self._output_name = vmu.try_get_module_name_from_call_stack(self)
+        return TeName.add(result, self._output_name)
+
     def __getattr__(self, name: str) -> T.Union[torch.Tensor, nn.Module]:
         try:
             return super().__getattr__(name)
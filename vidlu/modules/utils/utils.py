@@ -1,4 +1,5 @@
 import itertools
+import time
 import typing as T
 
 import torch
@@ -67,3 +68,38 @@ def map_tensors(a, f):
         return type(a)(map_tensors(x, f) for x in a)
     elif isinstance(a, T.Mapping):
         return type(a)({k: map_tensors(x, f) for k, x in a.items()})
+
+
+# Performance measurement ##########################################################################
+
+@torch.no_grad()
+def forward_time(module, *args, repeat=10, warmup=1, **kwargs):
+    """Returns the average duration of a forward pass in seconds."""
+    def synchronize():
+        if any(x.is_cuda for x in extract_tensors(*args, **kwargs)):
+            torch.cuda.synchronize()
+
+    for _ in range(warmup):
+        module(*args, **kwargs)
+    synchronize()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        module(*args, **kwargs)
+    synchronize()
+    return (time.perf_counter() - start) / repeat
+
+
+def output_naming_overhead(module, *args, repeat=10, **kwargs):
+    """Measures the average forward pass duration for each output naming mode.
+
+    See `vidlu.modules.elements.set_output_naming` for more information.
+
+    Returns:
+        dict: a mapping from modes to durations in seconds.
+    """
+    from vidlu.modules.elements import output_naming
+    times = dict()
+    for mode in ['call_stack', 'precomputed', 'off']:
+        with output_naming(mode, module):
+            times[mode] = forward_time(module, *args, repeat=repeat, **kwargs)
+    return times
@@ -172,6 +172,113 @@ class StateAwareCheckpoint:
             return checkpoint_fix(func, *args, **kwargs)
 
 
+# Deferred scalars
+
+class DeferredScalar:
+    """A handle to a scalar tensor whose value is needed on the host only later.
+
+    In contrast to `tensor.item()`, creating the handle does not synchronize
+    the host with the device. For CUDA tensors, a non-blocking copy to pinned
+    host memory is started, so that the value is usually available when it is
+    materialized with `item()`, `float(...)`, formatting or comparison.
+    Arithmetic with numbers or other handles is performed on the device and
+    produces handles. Accumulating metrics can sum `tensor` on the device.
+
+    Example:
+        >>> loss = DeferredScalar(torch.tensor(4.))
+        >>> half = loss / 2  # a DeferredScalar
+        >>> print(f"{half:.1f}", float(half) < 3)
+        2.0 True
+    """
+    __slots__ = '_tensor', '_host', '_event'
+
+    def __init__(self, tensor: torch.Tensor):
+        self._tensor = tensor.detach()
+        self._host = self._event = None
+        if self._tensor.is_cuda:
+            self._host = torch.empty((), dtype=self._tensor.dtype, pin_memory=True)
+            self._host.copy_(self._tensor.view(()), non_blocking=True)
+            self._event = torch.cuda.Event()
+            self._event.record()
+
+    @property
+    def tensor(self):
+        return self._tensor
+
+    def item(self):
+        if self._event is None:
+            return self._tensor.item()
+        self._event.synchronize()
+        return self._host.item()
+
+    def __float__(self):
+        return float(self.item())
+
+    def __int__(self):
+        return int(self.item())
+
+    def __bool__(self):
+        return bool(self.item())
+
+    def __format__(self, format_spec):
+        return format(self.item(), format_spec)
+
+    def __str__(self):
+        return str(self.item())
+
+    def __repr__(self):
+        return f"DeferredScalar({self._tensor})"
+
+    def _apply(self, func, other):
+        return DeferredScalar(
+            func(self._tensor, other._tensor if isinstance(other, DeferredScalar) else other))
+
+    def __add__(self, other):
+        return self._apply(lambda a, b: a + b, other)
+
+    def __radd__(self, other):
+        return self._apply(lambda a, b: b + a, other)
+
+    def __sub__(self, other):
+        return self._apply(lambda a, b: a - b, other)
+
+    def __rsub__(self, other):
+        return self._apply(lambda a, b: b - a, other)
+
+    def __mul__(self, other):
+        return self._apply(lambda a, b: a * b, other)
+
+    def __rmul__(self, other):
+        return self._apply(lambda a, b: b * a, other)
+
+    def __truediv__(self, other):
+        return self._apply(lambda a, b: a / b, other)
+
+    def __rtruediv__(self, other):
+        return self._apply(lambda a, b: b / a, other)
+
+    def __neg__(self):
+        return DeferredScalar(-self._tensor)
+
+    def __lt__(self, other):
+        return self.item() < other
+
+    def __le__(self, other):
+        return self.item() <= other
+
+    def __gt__(self, other):
+        return self.item() > other
+
+    def __ge__(self, other):
+        return self.item() >= other
+
+
+def to_number(x):
+    """Materializes `x` if it is a `DeferredScalar` and returns it unchanged
+    otherwise."""
+    return x.item() if isinstance(x, DeferredScalar) else x
+
+
 # Cuda memory management
 
 def reset_cuda():
@@ -1,11 +1,21 @@
 import dataclasses as dc
 from pathlib import Path
 import shutil
+import time
+import json
 import warnings
 import typing as T
 import logging
+import threading
+import atexit
+import copy
+import numbers
+from concurrent.futures import ThreadPoolExecutor
 
-from vidlu.utils.path import create_file_atomic
+import numpy as np
+import torch
+
+from vidlu.utils.path import create_file_atomic, get_size
 from vidlu.utils.func import params
 from vidlu.utils.loadsave import TorchLoadSave, JsonLoadSave, TextLoadSave
 
@@ -24,6 +34,45 @@ class _Smallest(float):  # float inheritance needed storing as JSON
 smallest = _Smallest()
 
 
+def _normalize_perf(perf):
+    """Converts a performance value to a float or a tuple of floats so that it
+    can be stored in JSON and compared with loaded values."""
+    if isinstance(perf, _Smallest):
+        return perf
+    if isinstance(perf, (tuple, list)):
+        return tuple(map(_normalize_perf, perf))
+    if isinstance(perf, torch.Tensor) and perf.numel() == 1 or isinstance(perf, np.generic):
+        perf = perf.item()
+    if isinstance(perf, numbers.Real):
+        return float(perf)
+    raise TypeError(f"The performance of a checkpoint should be a real number or a tuple of"
+                    + f" real numbers, not {type(perf).__name__}.")
+
+
+def _perf_to_json(perf):
+    if isinstance(perf, _Smallest):
+        return None
+    return list(map(_perf_to_json, perf)) if isinstance(perf, tuple) else perf
+
+
+def _perf_from_json(perf):
+    if perf is None:
+        return smallest
+    return tuple(map(_perf_from_json, perf)) if isinstance(perf, list) else perf
+
+
+def snapshot_to_cpu(obj):
+    """Returns a copy of a (nested) state with all tensors copied to CPU
+    memory so that it can be saved while the original is being modified."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    elif isinstance(obj, T.Mapping):
+        return type(obj)((k, snapshot_to_cpu(v)) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)) and not hasattr(obj, '_fields'):
+        return type(obj)(snapshot_to_cpu(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
 class Files:
     extracted_state = (None, TorchLoadSave)
     state = ('training_state.pth', TorchLoadSave)
@@ -96,6 +145,13 @@ class CheckpointManager(object):
         reset (bool, optional):
             If True, existing checkpoints with the same checkpoints_dir and
             experiment_name will be deleted.
+        async_save (bool, optional):
+            If True, `save` only copies the state to CPU memory and the
+            checkpoint is written by a background thread while training
+            continues. Errors are raised in the next call to `save` or `flush`.
+        max_pending_saves (int, optional):
+            The maximum number of checkpoints being written in the background.
+            If it is reached, `save` waits for the oldest one to be written.
 
     Notes:
         These names are used to specify filenames for saved objects. Each
@@ -106,6 +162,16 @@ class CheckpointManager(object):
         state object passed to `save`, 'checkpoint.info' - CheckpointManager
         state, and, optionally, 'log.txt' - the log (lines) provided as the
         second argument to `save`.
+        The experiment directory also contains a manifest, 'checkpoints.json',
+        with the index, performance, creation time and size of each checkpoint.
+        It is updated atomically after each saving or removal so that
+        checkpoints can be listed, ranked and removed without loading them.
+        Only checkpoints missing from the manifest (e.g. ones saved by an older
+        version) need their summaries loaded in `sync`.
+        A checkpoint is written into a temporary directory which is renamed
+        when all files are written, so that incomplete checkpoints are never
+        listed. The time `save` blocks the caller is stored in
+        `save_latencies`.
 
     Examples:
         >>> import os
@@ -122,10 +188,13 @@ class CheckpointManager(object):
         ['lin33_1', 'lin33_2']
     """
 
+    manifest_name = 'checkpoints.json'
+
     def __init__(self, checkpoints_dir, experiment_name: str, info: T.Mapping = None,
                  n_last_kept=1, n_best_kept=0, mode: T.Literal['restart', 'resume', 'new'] = False,
                  separately_saved_state_parts: T.Sequence[str] = (), perf_func=lambda s: smallest,
-                 log_func=lambda s: "", name_suffix_func=lambda s: ""):
+                 log_func=lambda s: "", name_suffix_func=lambda s: "", async_save=False,
+                 max_pending_saves=1):
         self._logger = logging.getLogger(f"{__name__}.{type(self).__name__}")
         self._logger.addHandler(logging.NullHandler())
 
@@ -136,6 +205,16 @@ class CheckpointManager(object):
         self.separately_saved_state_parts = separately_saved_state_parts
         self.perf_func, self.log_func, self.name_suffix_func = perf_func, log_func, name_suffix_func
 
+        self.async_save, self.max_pending_saves = async_save, max_pending_saves
+        self.save_latencies = []
+        self._lock = threading.RLock()  # for the list of saved checkpoints and the manifest
+        self._pending_saves = []
+        self._executor = None
+        if async_save:
+            self._executor = ThreadPoolExecutor(max_workers=1,
+                                                thread_name_prefix="checkpoint_writer")
+            atexit.register(self.flush)
+
         self.index = 0
         self.sync()
         if mode == 'restart':
@@ -149,26 +228,60 @@ class CheckpointManager(object):
                                + " want to use this ID anyway, pass `mode='resume'`.")
 
     def restart(self):
+        self.flush()
         self.remove_old_checkpoints(0, 0)  # does not remove checkpoints when called from __init__
         self.index = 0
         self.resuming_required = False
 
+    @property
+    def manifest_path(self):
+        return self.experiment_dir / self.manifest_name
+
     def sync(self):
         def get_existing_checkpoints():
             if not self.experiment_dir.exists():
                 return []
-            return sorted([p.name for p in self.experiment_dir.iterdir()],
+            return sorted([p.name for p in self.experiment_dir.iterdir()
+                           if p.is_dir() and p.name.split("_")[0].isdigit()],  # not temporary
                           key=lambda p: int(p.split("_")[0]))
 
         self.saved = get_existing_checkpoints()
-        self.id_to_perf = dict()
+        manifest = self._load_manifest()
+        self.manifest = dict()
         for id in list(self.saved):
-            try:
-                self.id_to_perf[id] = self.perf_func(
-                    Checkpoint.load(self.experiment_dir / id).summary)
-            except EOFError as e:
+            if id in manifest:
+                self.manifest[id] = manifest[id]
+                continue
+            path = self.experiment_dir / id
+            try:  # only the summary is loaded
+                perf = _normalize_perf(self.perf_func(Checkpoint._load(path, 'summary')))
+            except (EOFError, FileNotFoundError) as e:
                 warnings.warn(f"Checkpoint loading error:\n{e}")
                 self.saved.remove(id)
+                continue
+            self.manifest[id] = self._create_manifest_entry(id, perf, path.stat().st_mtime)
+        self.id_to_perf = {id: _perf_from_json(entry['perf'])
+                           for id, entry in self.manifest.items()}
+        if self.manifest != manifest and self.experiment_dir.exists():
+            self._save_manifest()
+
+    def _load_manifest(self):
+        if not self.manifest_path.exists():
+            return dict()
+        try:
+            with self.manifest_path.open() as file:
+                return json.load(file)
+        except ValueError as e:
+            warnings.warn(f"Invalid checkpoint manifest {self.manifest_path}:\n{e}")
+            return dict()
+
+    def _save_manifest(self):
+        create_file_atomic(path=self.manifest_path, mode="w+",
+                           write_action=lambda f: json.dump(self.manifest, f, indent=1))
+
+    def _create_manifest_entry(self, id, perf, time_):
+        return dict(index=int(id.split("_")[0]), perf=_perf_to_json(perf), time=time_,
+                    size=get_size(self.experiment_dir / id))
 
     def save(self, state, summary=None):
         if self.resuming_required:
@@ -177,28 +290,67 @@ class CheckpointManager(object):
         if len(state) == 0:
             raise RuntimeError("There are no objects to checkpoint in `state`.")
 
+        start = time.perf_counter()
         self.index += 1
 
+        if self.async_save:
+            state, summary = snapshot_to_cpu(state), snapshot_to_cpu(summary)
         cp = Checkpoint(state=state, summary=summary, progress_info=dict(index=self.index),
                         info=dict(info=self.info,
                                   separately_saved_state_parts=self.separately_saved_state_parts),
-                        perf=self.perf_func(summary), log=self.log_func(summary))
+                        perf=_normalize_perf(self.perf_func(summary)), log=self.log_func(summary))
         name = f"{self.index}" + (
             "" if (suff := self.name_suffix_func(summary)) == "" else f"_{suff}")
+        if self.async_save:
+            self._collect_pending_saves(max_count=self.max_pending_saves - 1)
+            self._pending_saves.append(self._executor.submit(self._write, cp, name))
+        else:
+            self._write(cp, name)
+        self.save_latencies.append(latency := time.perf_counter() - start)
+        self._logger.info(f"Saving checkpoint {name} blocked for {latency:.3f} s.")
+
+    def _write(self, cp, name):
         path = self.experiment_dir / name
-        path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.experiment_dir / f".{name}.tmp"
+        tmp_path.mkdir(parents=True, exist_ok=True)
         self._logger.info(f"Saving checkpoint {name} in {self.experiment_dir}.")
-        cp.save(path)
-        self.saved.append(name)
-        self.id_to_perf[name] = cp.perf
-        self.remove_old_checkpoints()
+        try:
+            cp.save(tmp_path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        tmp_path.rename(path)
+        with self._lock:
+            self.saved.append(name)
+            self.manifest[name] = self._create_manifest_entry(name, cp.perf, time.time())
+            self.id_to_perf[name] = cp.perf
+            self._save_manifest()
+            self._remove_old_checkpoints()
+
+    def _collect_pending_saves(self, max_count=0):
+        """Waits until at most `max_count` checkpoints are being written and
+        raises an exception if writing of some checkpoint failed."""
+        while len(self._pending_saves) > max_count:
+            self._pending_saves.pop(0).result()
+
+    def flush(self):
+        """Waits until all checkpoints are written."""
+        self._collect_pending_saves()
+
+    def close(self):
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+            atexit.unregister(self.flush)
 
     @property
     def last_checkpoint_path(self):
+        self.flush()
         return self.experiment_dir / self.saved[-1]
 
     @property
     def best_checkpoint_path(self):
+        self.flush()
         return self.experiment_dir / max(self.saved, key=self.id_to_perf.__getitem__)
 
     def load_last(self, map_location=None):
@@ -216,6 +368,11 @@ class CheckpointManager(object):
         return cp.state, cp.summary
 
     def remove_old_checkpoints(self, n_recent_kept=None, n_best_kept=None):
+        self.flush()
+        with self._lock:
+            self._remove_old_checkpoints(n_recent_kept, n_best_kept)
+
+    def _remove_old_checkpoints(self, n_recent_kept=None, n_best_kept=None):
         n_recent_kept = self.n_recent_kept if n_recent_kept is None else n_recent_kept
         n_best_kept = self.n_best_kept if n_best_kept is None else n_best_kept
         best = set(() if n_best_kept == 0 else
@@ -230,5 +387,9 @@ class CheckpointManager(object):
             except FileNotFoundError:
                 warnings.warn(f"Old checkpoint {path} is already deleted.")
         self.id_to_perf = {k: self.id_to_perf[k] for k in self.saved}
-        if len(self.saved) == 0 and self.experiment_dir.exists():
-            shutil.rmtree(self.experiment_dir)
+        self.manifest = {k: self.manifest[k] for k in self.saved}
+        if len(self.saved) == 0:
+            if self.experiment_dir.exists():
+                shutil.rmtree(self.experiment_dir)
+        elif len(removed) > 0:
+            self._save_manifest()
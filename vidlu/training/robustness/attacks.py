@@ -93,13 +93,13 @@ class AttackState:
     x_adv: torch.Tensor
     output: torch.Tensor
     loss: torch.Tensor
-    loss_sum: float
-    reg_loss_sum: float
+    loss_sum: T.Union[float, vtu.DeferredScalar]
+    reg_loss_sum: T.Union[float, vtu.DeferredScalar]
     grad: torch.Tensor
     y_adv: torch.Tensor = None
     step: int = None
-    loss_mean: float = dc.field(init=False)
-    reg_loss_mean: float = dc.field(init=False)
+    loss_mean: T.Union[float, vtu.DeferredScalar] = dc.field(init=False)
+    reg_loss_mean: T.Union[float, vtu.DeferredScalar] = dc.field(init=False)
     pert_model: torch.nn.Module = None
 
     def __post_init__(self):
@@ -247,7 +247,8 @@ class DummyAttack(OptimizingAttack):
     def _perturb(self, model, x, y=None, backward_callback=None):
         output, loss_s, grad = self._get_output_and_loss_s_and_grad(model, x, y)
         if backward_callback is not None:
-            backward_callback(AttackState(x=x, y=y, output=output, x_adv=x, loss_sum=loss_s.item(),
+            backward_callback(AttackState(x=x, y=y, output=output, x_adv=x,
+                                          loss_sum=vtu.DeferredScalar(loss_s),
                                           grad=grad, loss=None, reg_loss_sum=0))
         return x
 
@@ -366,8 +367,10 @@ def perturb_iterative(model, x, y, step_count, update, loss, minimize=False, ini
         zero_grad(delta)
         ((-loss if minimize else loss) - reg_loss).backward()  # maximized
 
-        state = AttackState(x=x, y=y, output=output, x_adv=x_adv, loss_sum=loss.item(),
-                            reg_loss_sum=reg_loss.item(), grad=delta.grad, step=i, loss=unred_loss)
+        state = AttackState(x=x, y=y, output=output, x_adv=x_adv,
+                            loss_sum=vtu.DeferredScalar(loss),
+                            reg_loss_sum=vtu.DeferredScalar(reg_loss), grad=delta.grad, step=i,
+                            loss=unred_loss)
         backward_callback(state)
 
         with torch.no_grad():
@@ -538,7 +541,8 @@ def perturb_iterative_with_perturbation_model(
             ((loss if minimize else -loss) + reg_loss).backward()  # minimized
 
         state = AttackState(x=x, y=y, output=output, x_adv=x_p, y_adv=y_, loss=unred_loss,
-                            loss_sum=loss_no_mask.item(), reg_loss_sum=reg_loss.item(), grad=None,
+                            loss_sum=vtu.DeferredScalar(loss_no_mask),
+                            reg_loss_sum=vtu.DeferredScalar(reg_loss), grad=None,
                             step=i, pert_model=pert_model)
         backward_callback(state)
         del output, loss, reg_loss, loss_no_mask  # free some memory
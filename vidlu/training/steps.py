@@ -13,7 +13,7 @@ from torch import nn
 from vidlu.data import BatchTuple
 from vidlu.utils.collections import NameDict
 from vidlu.torch_utils import (concatenate_tensors_trees, switch_training,
-                               batchnorm_stats_tracking_off)
+                               batchnorm_stats_tracking_off, DeferredScalar)
 import vidlu.modules as vm
 import vidlu.modules.losses as vml
 import vidlu.modules.utils as vmu
@@ -48,7 +48,8 @@ def supervised_eval_step(trainer, batch):
     x, y = batch
     output, other_outputs = trainer.extend_output(trainer.model(x))
     loss = trainer.loss(output, y).mean()
-    return NameDict(x=x, target=y, output=output, other_outputs=other_outputs, loss=loss.item())
+    return NameDict(x=x, target=y, output=output, other_outputs=other_outputs,
+                    loss=DeferredScalar(loss))
 
 
 def _supervised_train_step_x_y(trainer, x, y):
@@ -56,7 +57,8 @@ def _supervised_train_step_x_y(trainer, x, y):
     output, other_outputs = trainer.extend_output(trainer.model(x))
     loss = trainer.loss(output, y).mean()
     do_optimization_step(trainer.optimizer, loss)
-    return NameDict(x=x, target=y, output=output, other_outputs=other_outputs, loss=loss.item())
+    return NameDict(x=x, target=y, output=output, other_outputs=other_outputs,
+                    loss=DeferredScalar(loss))
 
 
 def supervised_train_step(trainer, batch):
@@ -74,7 +76,8 @@ class ClassifierEnsembleEvalStep:
         output = self.combine(model(x) for model in self.model_iter(trainer.model))
         _, other_outputs = trainer.extend_output(output)
         loss = trainer.loss(output, y).mean()
-        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs, loss=loss.item())
+        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs,
+                        loss=DeferredScalar(loss))
 
 
 # generative flows and discriminative hybrids
@@ -123,8 +126,8 @@ class DiscriminativeFlowSupervisedTrainStep:  # TODO: improve
         do_optimization_step(trainer.optimizer, loss)
 
         return NameDict(x=x, target=y, z=z, output=output, other_outputs=other_outputs,
-                        loss=loss.item(), loss_dis=loss_dis.item(),
-                        loss_gen_b=loss_gen.item() / np.log(2.))
+                        loss=DeferredScalar(loss), loss_dis=DeferredScalar(loss_dis),
+                        loss_gen_b=DeferredScalar(loss_gen) / np.log(2.))
 
 
 @dc.dataclass
@@ -147,8 +150,8 @@ class DiscriminativeFlowSupervisedEvalStep:  # TODO: improve
         loss = self.dis_weight * loss_dis + self.gen_weight * loss_gen
 
         return NameDict(x=x, target=y, z=z, output=output, other_outputs=other_outputs,
-                        loss=loss.item(), loss_dis=loss_dis.item(),
-                        loss_gen_b=loss_gen.item() / np.log(2.))
+                        loss=DeferredScalar(loss), loss_dis=DeferredScalar(loss_dis),
+                        loss_gen_b=DeferredScalar(loss_gen) / np.log(2.))
 
 
 @dc.dataclass
@@ -211,9 +214,10 @@ class AdversarialDiscriminativeFlowSupervisedTrainStep:  # TODO: improve
         #     h.remove()
 
         return NameDict(x=x, target=y, z=z, output=output, other_outputs=other_outputs,
-                        loss=loss.item(), loss_dis=loss_dis.item(),
-                        loss_gen_b=loss_gen.item() / np.log(2.), loss_adv=loss_adv.item(),
-                        loss_adv_=loss_adv_.item())
+                        loss=DeferredScalar(loss), loss_dis=DeferredScalar(loss_dis),
+                        loss_gen_b=DeferredScalar(loss_gen) / np.log(2.),
+                        loss_adv=DeferredScalar(loss_adv),
+                        loss_adv_=DeferredScalar(loss_adv_))
 
 
 @dc.dataclass
@@ -245,8 +249,9 @@ class AdversarialDiscriminativeFlowSupervisedEvalStep:  # TODO: improve
         loss = self.dis_weight * loss_dis + self.gen_weight * loss_gen + self.adv_weight * loss_adv
 
         return NameDict(x=x, target=y, z=z, output=output, other_outputs=other_outputs,
-                        loss=loss.item(), loss_dis=loss_dis.item(),
-                        loss_gen_b=loss_gen.item() / np.log(2.), loss_adv=loss_adv.item())
+                        loss=DeferredScalar(loss), loss_dis=DeferredScalar(loss_dis),
+                        loss_gen_b=DeferredScalar(loss_gen) / np.log(2.),
+                        loss_adv=DeferredScalar(loss_adv))
 
 
 @dc.dataclass
@@ -297,8 +302,9 @@ class AdversarialDiscriminativeFlowSupervisedTrainStep2:  # TODO: improve
             do_optimization_step(trainer.optimizer, self.adv_weight * loss_adv)
 
         return NameDict(x=x, target=y, z=z, output=logits, other_outputs=other_outputs,
-                        loss=loss.item(), loss_dis=loss_dis.item(),
-                        loss_gen_b=loss_gen.item() / np.log(2.), loss_adv=loss_adv.item())
+                        loss=DeferredScalar(loss), loss_dis=DeferredScalar(loss_dis),
+                        loss_gen_b=DeferredScalar(loss_gen) / np.log(2.),
+                        loss_adv=DeferredScalar(loss_adv))
 
 
 @dc.dataclass
@@ -330,8 +336,9 @@ class SupervisedTrainMultiStep:
                 loss = trainer.loss(output, y).mean()
                 do_optimization_step(trainer.optimizer, loss)
                 if i == 0:
-                    initial = dict(output=output, other_outputs=other_outputs, loss=loss.item())
-        final = dict(output=output, other_outputs=other_outputs, loss=loss.item())
+                    initial = dict(output=output, other_outputs=other_outputs,
+                                   loss=DeferredScalar(loss))
+        final = dict(output=output, other_outputs=other_outputs, loss=DeferredScalar(loss))
         return NameDict(x=x, target=y, **initial, **{f"{k}_post": v for k, v in final.items()})
 
 
@@ -392,7 +399,7 @@ class SupervisedSlidingBatchTrainStep:
                 loss = trainer.loss(output, inter_y).mean()
                 do_optimization_step(trainer.optimizer, loss)
                 result = result or NameDict(x=inter_x, target=inter_y, output=output,
-                                            other_outputs=other_outputs, loss=loss.item())
+                                            other_outputs=other_outputs, loss=DeferredScalar(loss))
         self.start_index = starts[0 if self.reversed else -1] + stride - len(self.prev_x_y[0])
         # Data for the last inter-batch iteration is returned
         # The last inter-batch is not necessarily `batch`
@@ -436,7 +443,7 @@ class SupervisedTrainAcumulatedBatchStep:
         trainer.optimizer.step()
         return NameDict(x=x, target=y, output=torch.cat(outputs, dim=0),
                         other_outputs=concatenate_tensors_trees(other_outputses),
-                        loss=total_loss.item())
+                        loss=DeferredScalar(total_loss))
 
 
 # Adversarial
@@ -493,7 +500,7 @@ class AdversarialTrainStep:
         >>> return NameDict(x=x, output=crc.result.output, target=y,
         >>>                 other_outputs=crc.result.other_outputs, loss=crc.result.loss_mean,
         >>>                 x_p=x_p, target_p=y, output_p=output,
-        >>>                 other_outputs_p=other_outputs, loss_p=loss_p.item())
+        >>>                 other_outputs_p=other_outputs, loss_p=DeferredScalar(loss_p))
         """
         x, y = batch
         cln_count = round(self.clean_proportion * len(x))
@@ -518,7 +525,7 @@ class AdversarialTrainStep:
         return NameDict(x=x, output=crc.result.output, target=y,
                         other_outputs=crc.result.other_outputs, loss=crc.result.loss_mean,
                         x_p=x_p, target_p=y_a, output_p=output_p,
-                        other_outputs_p=other_outputs_p, loss_p=loss_p.item())
+                        other_outputs_p=other_outputs_p, loss_p=DeferredScalar(loss_p))
 
 
 @dc.dataclass
@@ -564,9 +571,9 @@ class AdversarialCombinedLossTrainStep:
                              loss=self.clean_weight * loss_c + self.adv_weight * loss_p)
 
         return NameDict(x=x, output=output_c, target=y, other_outputs=other_outputs_c,
-                        loss=loss_c.item(),
+                        loss=DeferredScalar(loss_c),
                         x_p=x_p, output_p=output_p, other_outputs_p=other_outputs_p,
-                        loss_p=loss_p.item())
+                        loss_p=DeferredScalar(loss_p))
 
 
 @dc.dataclass
@@ -636,7 +643,7 @@ class AdversarialTrainMultiStep:
         return NameDict(x=x, target=y, output=clean_result.output,
                         other_outputs=trainer.extend_output(clean_result.output)[1],
                         loss=clean_result.loss_mean, x_p=x_p, output_p=output_p,
-                        other_outputs_p=other_outputs_p, loss_p=loss_p.item())
+                        other_outputs_p=other_outputs_p, loss_p=DeferredScalar(loss_p))
 
 
 @dc.dataclass
@@ -668,9 +675,10 @@ class VATTrainStep:
             loss += self.entropy_loss_coef * loss_ent if self.entropy_loss_coef != 1 else loss_ent
         do_optimization_step(trainer.optimizer, loss=loss)
 
-        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs, loss=loss.item(),
+        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs,
+                        loss=DeferredScalar(loss),
                         x_p=x_p, output_p=output_p, other_outputs_p=other_outputs_p,
-                        loss_p=loss_p.item(), loss_ent=loss_ent.item())
+                        loss_p=DeferredScalar(loss_p), loss_ent=DeferredScalar(loss_ent))
 
 
 @dc.dataclass
@@ -700,11 +708,12 @@ class PertConsistencyTrainStep:  # TODO
                 loss += self.entropy_loss_coef * loss_ent
             do_optimization_step(trainer.optimizer, loss=loss)
 
-        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs, loss=loss.item(),
+        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs,
+                        loss=DeferredScalar(loss),
                         x_p=x_p, target_p=target_p, output_p=output_p,
                         other_outputs_p=other_outputs_p,
-                        loss_p=loss_p.item(),
-                        loss_ent=loss_ent.item() if self.entropy_loss_coef else -1)
+                        loss_p=DeferredScalar(loss_p),
+                        loss_ent=DeferredScalar(loss_ent) if self.entropy_loss_coef else -1)
 
 
 @torch.no_grad()
@@ -760,9 +769,9 @@ class SemisupVATEvalStep:
 
         other_outs_l = type(other_outs)({k: v[:len(x_l)] for k, v in other_outs.items()})
         return NameDict(x=x_all, output=out, other_outputs=other_outs, output_l=out_l,
-                        other_outputs_l=other_outs_l, loss_l=loss_l.item(), x_p=x_p,
-                        loss_p=loss_p.item(), x_l=x_l, target=y_l, output_p=out_p,
-                        other_outputs_p=other_outs_p, loss_ent_adv=loss_ent_p.item())
+                        other_outputs_l=other_outs_l, loss_l=DeferredScalar(loss_l), x_p=x_p,
+                        loss_p=DeferredScalar(loss_p), x_l=x_l, target=y_l, output_p=out_p,
+                        other_outputs_p=other_outs_p, loss_ent_adv=DeferredScalar(loss_ent_p))
 
 
 @dc.dataclass
@@ -803,9 +812,10 @@ class SemisupVATTrainStep:
         other_outs_l = type(other_outs)({k: v[:len(x_l)] for k, v in other_outs.items()})
 
         return NameDict(x=x, output=out, other_outputs=other_outs, output_l=out_l,
-                        other_outputs_l=other_outs_l, loss_l=loss_l.item(), loss_p=loss_p.item(),
+                        other_outputs_l=other_outs_l, loss_l=DeferredScalar(loss_l),
+                        loss_p=DeferredScalar(loss_p),
                         x_l=x_l, target=y_l, x_p=x_p, output_p=out_p, other_outputs_p=other_outs_p,
-                        loss_ent=loss_ent.item())
+                        loss_ent=DeferredScalar(loss_ent))
 
 
 @dc.dataclass
@@ -869,11 +879,13 @@ class SemisupVATCorrEvalStep:
         other_outs_l = type(other_outs)({k: v[:len(x_l)] for k, v in other_outs.items()})
 
         return NameDict(x=x, output=out, other_outputs=other_outs, output_l=out_l,
-                        other_outputs_l=other_outs_l, loss_l=loss_l.item(), loss_p=loss_p.item(),
+                        other_outputs_l=other_outs_l, loss_l=DeferredScalar(loss_l),
+                        loss_p=DeferredScalar(loss_p),
                         x_l=x_l, target=y_l, x_p=x_p, output_p=out_p, other_outputs_p=other_outs_p,
-                        loss_ent=loss_ent.item(),
-                        corr_c=corr_c.item(), corr_p=corr_p.item(), corr_ucp=corr_ucp.item(),
-                        corr_dcp=corr_dcp.item())
+                        loss_ent=DeferredScalar(loss_ent),
+                        corr_c=DeferredScalar(corr_c), corr_p=DeferredScalar(corr_p),
+                        corr_ucp=DeferredScalar(corr_ucp),
+                        corr_dcp=DeferredScalar(corr_dcp))
 
 
 @dc.dataclass
@@ -906,11 +918,12 @@ class OldMeanTeacherTrainStep:  # TODO
                 loss += self.entropy_loss_coef * loss_ent
             do_optimization_step(trainer.optimizer, loss=loss)
 
-        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs, loss=loss.item(),
+        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs,
+                        loss=DeferredScalar(loss),
                         x_p=x_p, target_p=target_p, output_p=output_p,
                         other_outputs_p=other_outputs_p,
-                        loss_p=loss_p.item(),
-                        loss_ent=loss_ent.item() if self.entropy_loss_coef else -1)
+                        loss_p=DeferredScalar(loss_p),
+                        loss_ent=DeferredScalar(loss_ent) if self.entropy_loss_coef else -1)
 
 
 @dc.dataclass
@@ -961,9 +974,10 @@ class MeanTeacherTrainStep:
                 pt.mul_(self.ema_decay).add(p, alpha=1 - self.ema_decay)
 
         return NameDict(x=x, output=None, other_outputs=None, output_l=out_l,
-                        other_outputs_l=other_outs_l, loss_l=loss_l.item(), loss_c=loss_c.item(),
+                        other_outputs_l=other_outs_l, loss_l=DeferredScalar(loss_l),
+                        loss_c=DeferredScalar(loss_c),
                         x_l=x_l, target=y_l, x_p=x_p, output_p=out_p, other_outputs_p=other_outs_p,
-                        loss_ent=loss_ent.item())
+                        loss_ent=DeferredScalar(loss_ent))
 
     def state_dict(self):
         return self.ema_teacher.state_dict()
@@ -992,9 +1006,10 @@ class AdversarialEvalStep:
             loss_p = (attack.loss(output_p, attack.output_to_target(output)) if self.virtual
                       else trainer.loss(output_p, y)).mean()
 
-        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs, loss=loss.item(),
+        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs,
+                        loss=DeferredScalar(loss),
                         x_p=x_p, output_p=output_p, other_outputs_p=other_outputs_p,
-                        loss_p=loss_p.item())
+                        loss_p=DeferredScalar(loss_p))
 
 
 class AdversarialTargetedEvalStep:
@@ -1019,11 +1034,13 @@ class AdversarialTargetedEvalStep:
             with torch.no_grad():
                 result[f"output_p{i}"], result[f"other_outputs_p{i}"] = trainer.extend_output(
                     trainer.model(x_p))
-                result[f"loss_p_targ{i}"] = trainer.loss(result[f"output_p{i}"],
-                                                         t_var).mean().item()
-                result[f"loss_p{i}"] = trainer.loss(result[f"output_p{i}"], y).mean().item()
+                result[f"loss_p_targ{i}"] = DeferredScalar(
+                    trainer.loss(result[f"output_p{i}"], t_var).mean())
+                result[f"loss_p{i}"] = DeferredScalar(
+                    trainer.loss(result[f"output_p{i}"], y).mean())
 
-        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs, loss=loss.item(),
+        return NameDict(x=x, target=y, output=output, other_outputs=other_outputs,
+                        loss=DeferredScalar(loss),
                         x_p=x_p, **result)
 
 
@@ -1035,7 +1052,7 @@ def autoencoder_train_step(trainer, batch):
     x_r = trainer.model(x)
     loss = trainer.loss(x_r, x).mean()
     do_optimization_step(trainer.optimizer, loss)
-    return NameDict(x_r=x_r, x=x, loss=loss.item())
+    return NameDict(x_r=x_r, x=x, loss=DeferredScalar(loss))
 
 
 '''
@@ -1064,7 +1081,7 @@ class GANTrainStep:
         # training discriminator with real
         output = discriminator(real)
         errD_real = trainer.loss(output, real_labels).mean()  # torch.nn.BCELoss()
-        D_real = output.mean().item()
+        D_real = DeferredScalar(output.mean())
         errD_real.backward()
 
         fake = generator(trainer.model.sample_z(batch_size))
@@ -1072,7 +1089,7 @@ class GANTrainStep:
         # training discriminator with fake
         output = discriminator(fake.detach())
         errD_fake = trainer.loss(output, self._get_fake_labels(batch_size)).mean()
-        D_fake1 = output.mean().item()
+        D_fake1 = DeferredScalar(output.mean())
         errD_fake.backward()
 
         trainer.optimizer['D'].step()
@@ -1084,11 +1101,12 @@ class GANTrainStep:
         # We want to make a step that will make it more likely that D outputs "real"
         output = discriminator(fake)
         errG = trainer.loss(output, real_labels).mean()
-        D_fake2 = output.mean().item()
+        D_fake2 = DeferredScalar(output.mean())
 
         errG.backward()
         trainer.optimizer['G'].step()
 
-        return NameDict(errD=(errD_real + errD_fake).item(), errG=errG.item(), D_real=D_real,
+        return NameDict(errD=DeferredScalar(errD_real + errD_fake), errG=DeferredScalar(errG),
+                        D_real=D_real,
                         D_fake1=D_fake1, D_fake2=D_fake2)
 '''
@@ -9,13 +9,14 @@ from tqdm import tqdm
 import torch
 
 import vidlu.modules.utils as vmu
-from vidlu.data import Record, DataLoader, BatchTuple
+from vidlu.data import Record, DataLoader, BatchTuple, in_ram_data_loader
 import vidlu.data.utils as vdu
 from vidlu.optim.lr_schedulers import ConstLR
 from vidlu.utils.func import params, Empty, Required
 from vidlu.utils.collections import NameDict
 from vidlu.utils.misc import Event, Stopwatch
 import vidlu.configs.training as vct
+from vidlu.transforms.jitter.jitter import BatchJitter
 
 
 # Engine based on Ignite Engine ####################################################################
@@ -197,7 +198,8 @@ class Evaluator:
     loss: T.Callable = Required
     prepare_batch: T.Callable = default_prepare_batch
     data_loader_f: vdu.TMultiDataLoaderF = partial(
-        vdu.simple_or_zip_data_loader, data_loader_f=DataLoader, num_workers=2, shuffle=True)
+        vdu.simple_or_zip_data_loader, data_loader_f=in_ram_data_loader, num_workers=2,
+        shuffle=True)
     batch_size: int = 1
     metrics: list = dc.field(default_factory=list)
     extend_output: T.Callable = extend_output
@@ -235,8 +237,11 @@ class Evaluator:
             self._reset_metrics()
         return metric_evals
 
-    def _run_step(self, step, batch):
+    def _run_step(self, step, batch, batch_jitter=None):
         batch = self.prepare_batch(batch)
+        if batch_jitter is not None:
+            batch = (BatchTuple(map(batch_jitter, batch)) if isinstance(batch, BatchTuple)
+                     else batch_jitter(batch))
         if torch.cuda.is_available():
             torch.cuda.reset_peak_memory_stats()
         with Stopwatch() as t:
@@ -269,7 +274,7 @@ class Trainer(Evaluator):
     epoch_count: int = Required  # optimization
     optimizer_f: InitVar[T.Callable] = None  # optimization; vidlu.optim
     lr_scheduler_f: InitVar[T.Callable] = ConstLR  # optimization; vidlu.optim.lr_schedulers
-    jitter: T.Callable = None  # learning
+    jitter: T.Callable = None  # learning; vidlu.transforms.jitter, per-example or BatchJitter
     train_step: T.Callable = Required  # learning; vidlu.training.steps
     extension_fs: InitVar[T.Sequence] = ()  # learning
 
@@ -290,7 +295,8 @@ class Trainer(Evaluator):
             lr_scheduler_f = partial(lr_scheduler_f, epoch_count=self.epoch_count)
         self.lr_scheduler = lr_scheduler_f(optimizer=self.optimizer)
 
-        self.training = Engine(lambda e, b: self._run_step(self.train_step, b))
+        self.training = Engine(
+            lambda e, b: self._run_step(self.train_step, b, batch_jitter=self._batch_jitter))
         self.training.epoch_completed.add_handler(lambda e: self.lr_scheduler.step())
         self.training.epoch_started.add_handler(lambda e: self._reset_metrics())
         self.training.iter_completed.add_handler(self._update_metrics)
@@ -306,8 +312,19 @@ class Trainer(Evaluator):
 
         self._initialized = True
 
+    @property
+    def _batch_jitter(self):
+        return self.jitter if isinstance(self.jitter, BatchJitter) else None
+
     def train(self, *datasets, restart=False):
-        datasets_jittered = [ds.map(self.jitter) for ds in datasets] if self.jitter else datasets
+        """Trains the model.
+
+        If `jitter` is a `BatchJitter`, it is applied to whole batches after
+        they are moved to the device of the model. Otherwise it is applied to
+        each example in data loading workers.
+        """
+        per_example = self.jitter is not None and self._batch_jitter is None
+        datasets_jittered = [ds.map(self.jitter) for ds in datasets] if per_example else datasets
         data_loader = self.data_loader_f(
             *datasets_jittered, drop_last=True, batch_size=self.batch_size)
         return self.training.run(data_loader, max_epochs=self.epoch_count, restart=restart)
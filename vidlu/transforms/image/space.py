@@ -2,6 +2,7 @@ from vidlu.utils.func import partial
 from numbers import Number
 import typing as T
 
+import torch
 from torch import Tensor
 import torch.nn.functional as nnF
 import numpy as np
@@ -171,3 +172,108 @@ def random_scale_crop(x, shape, max_scale, min_scale=None, overflow=0, is_segmen
 
 
 RandomScaleCrop = func_to_module_class(random_scale_crop)
+
+
+# Random, batched (per-example random parameters)
+
+def _as_tuple(x):
+    return (x, True) if isinstance(x, tuple) else ((x,), False)
+
+
+def random_hflip_batch(x: T.Union[Tensor, tuple], p=0.5):
+    """Flips each example of a batch (or of a tuple of batches) horizontally
+    with probability `p`."""
+    xs, multiple = _as_tuple(x)
+    mask = torch.rand(len(xs[0]), device=xs[0].device) < p
+    xs = tuple(torch.where(mask.view(-1, *[1] * (a.dim() - 1)), a.flip(-1), a) for a in xs)
+    return xs if multiple else xs[0]
+
+
+RandomHFlipBatch = func_to_module_class(random_hflip_batch)
+
+
+def random_crop_batch(x: T.Union[Tensor, tuple], shape):
+    """Crops a different random window of shape `shape` from each example of a
+    batch (or of a tuple of batches with equal heights and widths) with a
+    single indexing operation."""
+    xs, multiple = _as_tuple(x)
+    n, device = len(xs[0]), xs[0].device
+    input_shape, shape = np.array(xs[0].shape[-2:]), np.array(shape)
+    if np.any(input_shape < shape):
+        raise RuntimeError(f"The inputs ({tuple(input_shape)}) are smaller than the crop shape"
+                           + f" ({tuple(shape)}).")
+    p0 = (torch.rand(n, 2, device=device) * torch.tensor(input_shape - shape + 1, device=device)
+          ).long()
+    rows = (p0[:, 0, None] + torch.arange(shape[0], device=device))[:, :, None]
+    cols = (p0[:, 1, None] + torch.arange(shape[1], device=device))[:, None, :]
+    ind_n = torch.arange(n, device=device)[:, None, None]
+    # advanced indices separated by `...` are moved to the front: NHW... -> N...HW
+    xs = tuple(a[ind_n, ..., rows, cols].movedim((1, 2), (-2, -1)) for a in xs)
+    return xs if multiple else xs[0]
+
+
+RandomCropBatch = func_to_module_class(random_crop_batch)
+
+
+def random_scale_crop_batch(x: T.Union[Tensor, tuple], shape, max_scale, min_scale=None,
+                            overflow=0, is_segmentation=False, pad_value=0, label_pad_value=-1,
+                            hflip_p=0.):
+    """A batched version of `random_scale_crop` followed by `pad_to_shape`.
+
+    Scaling, cropping and padding are done with a single `grid_sample` call
+    for each input with a different random scale and location for each
+    example. Unlike in `random_scale_crop` with `pad_to_shape`, padding is not
+    centered, but appears where the crop window exceeds the input.
+
+    Args:
+        x (Tensor or tuple): A batch or a tuple of batches (NCHW images or NHW
+            segmentations) with equal heights and widths.
+        shape: Output shape.
+        max_scale, min_scale, overflow: See `random_scale_crop`.
+        is_segmentation (bool or Sequence[bool]): Whether the input is a
+            segmentation that requires nearest neighbor interpolation.
+        pad_value (float or 'mean'): The padding value for images. If it is
+            'mean', the mean of each channel of each image is used.
+        label_pad_value (int): The padding value for segmentations.
+        hflip_p (float): The probability of horizontally flipping an example.
+            Flipping is done by the same `grid_sample` call.
+    """
+    xs, multiple = _as_tuple(x)
+    if isinstance(is_segmentation, bool):
+        is_segmentation = [is_segmentation] * len(xs)
+    if min_scale is None:
+        min_scale = 1 / max_scale
+    n, device = len(xs[0]), xs[0].device
+    if not all(a.shape[-2:] == xs[0].shape[-2:] for a in xs):
+        raise RuntimeError("All inputs must have the same height and width.")
+
+    input_shape = torch.tensor(xs[0].shape[-2:], dtype=torch.float, device=device)
+    scale = torch.rand(n, 1, device=device) * (max_scale - min_scale) + min_scale
+    crop_shape = torch.tensor(shape, dtype=torch.float, device=device) / scale  # (N, 2)
+    overflow = (crop_shape / 2 if overflow == 'half' else
+                torch.tensor(_resolve_padding(overflow, shape), dtype=torch.float, device=device))
+    p0 = torch.rand(n, 2, device=device) * (input_shape - crop_shape) - overflow / 2
+
+    # normalized (align_corners=False) input coordinates: a * output_coordinates + b
+    a, b = crop_shape / input_shape, (2 * p0 + crop_shape) / input_shape - 1
+    if hflip_p > 0:
+        a[:, 1] *= 1 - 2 * (torch.rand(n, device=device) < hflip_p).to(a.dtype)
+    theta = torch.zeros(n, 2, 3, device=device)
+    theta[:, 0, 0], theta[:, 0, 2] = a[:, 1], b[:, 1]  # x
+    theta[:, 1, 1], theta[:, 1, 2] = a[:, 0], b[:, 0]  # y
+    grid = nnF.affine_grid(theta, (n, 1, *shape), align_corners=False)
+
+    def transform(x, is_seg):
+        if is_seg:
+            xf = x.unsqueeze(1).to(grid.dtype) - label_pad_value
+            y = nnF.grid_sample(xf, grid, mode='nearest', padding_mode='zeros', align_corners=False)
+            return round_float_to_int(y.squeeze(1) + label_pad_value, x.dtype)
+        value = x.mean((2, 3), keepdim=True) if pad_value == 'mean' else pad_value
+        return nnF.grid_sample(x - value, grid.to(x.dtype), mode='bilinear', padding_mode='zeros',
+                               align_corners=False).add_(value)
+
+    xs = tuple(transform(x, iss) for x, iss in zip(xs, is_segmentation))
+    return xs if multiple else xs[0]
+
+
+RandomScaleCropBatch = func_to_module_class(random_scale_crop_batch)
@@ -18,3 +18,23 @@ def prepare_label(y):
 
 def prepare_input_image(x):
     return compose(iti.to_torch, iti.hwc_to_chw, lambda x: x.to(dtype=torch.float), iti.Div(255))(x)
+
+
+def prepare_label_batch(y):
+    """Like `prepare_label`, but for a batch of labels."""
+    y = torch.from_numpy(y) if isinstance(y, np.ndarray) else y
+    return y if y.is_floating_point() else y.to(dtype=torch.int64)
+
+
+def prepare_input_image_batch(x):
+    """Like `prepare_input_image`, but for a NHWC or NHW (single channel)
+    batch of images."""
+    x = torch.from_numpy(x) if isinstance(x, np.ndarray) else x
+    if x.dim() == 3:
+        x = x.unsqueeze(-1)
+    return iti.hwc_to_chw(x).to(dtype=torch.float, memory_format=torch.contiguous_format).div_(255)
+
+
+# versions for batches used by `vidlu.data.InRAMDataLoader`
+prepare_label.batched = prepare_label_batch
+prepare_input_image.batched = prepare_input_image_batch
@@ -24,6 +24,9 @@ class Composition:
 
 class PhTPS20:
     def __init__(self):
+        self._reset()
+
+    def _reset(self):
         from vidlu.training.robustness import attacks
         from vidlu.training.robustness import perturbation as pert
         self.pert_model = pert.PhotoTPS20()
@@ -37,15 +40,16 @@ class PhTPS20:
 
     def __call__(self, x):
         x, y = x
-        x_ = x.unsqueeze(0)
+        return self._perturb(x.unsqueeze(0)).squeeze(0), y
+
+    def _perturb(self, x):
         with torch.no_grad():
             if not vm.is_built(self.pert_model, including_submodules=True):
-                self.pert_model(x_)
+                self.pert_model(x)
                 for p in self.pert_model.parameters():
                     p.requires_grad = False
-            self.init(self.pert_model, x_)
-        x = self.pert_model(x_).squeeze(0)
-        return x, y
+            self.init(self.pert_model, x)
+            return self.pert_model(x)
 
 
 class SegmentationJitter:
@@ -106,7 +110,7 @@ class SegRandScaleCropPadHFlip(SegmentationJitter):
     min_scale: float = None
     align_corners: bool = True
     image_pad_value: T.Union[torch.Tensor, float, T.Literal['mean']] = 'mean'
-    label_pad_value = -1
+    label_pad_value: int = -1
 
     def apply(self, xy):
         xy = RandomScaleCrop(shape=self.shape, max_scale=self.max_scale,
@@ -129,3 +133,98 @@ class RandAugment(ClassificationJitter):
             h = vti.torch_to_pil(h.permute(1, 2, 0).cpu())
             h = self.pil_randaugment(h)
             return vti.pil_to_torch(h).to(dtype=x.dtype, device=x.device).permute(2, 0, 1) / 256
+
+
+# Batch jitter #####################################################################################
+
+class BatchJitter:
+    """Base class for jitter that is applied to whole collated batches.
+
+    Random parameters are sampled independently for each example. The trainer
+    applies instances of this class after collation (and after moving the
+    batch to the model device) instead of mapping them over the dataset.
+    """
+
+    def __call__(self, batch):
+        raise NotImplementedError()
+
+
+class BatchClassificationJitter(BatchJitter):
+    def __call__(self, batch):
+        if len(batch) == 1:
+            return (self.apply_input(batch[0]),)
+        return self.apply_input(batch[0]), self.apply_label(batch[1])
+
+    def apply_input(self, x):
+        return x
+
+    def apply_label(self, y):
+        return y
+
+
+class BatchSegmentationJitter(BatchJitter):
+    def __call__(self, batch):
+        return self.apply(tuple(batch))
+
+    def apply(self, xy):
+        raise NotImplementedError()
+
+
+class BatchComposition(BatchJitter):
+    def __init__(self, *jitters):
+        self.jitters = jitters
+
+    def __call__(self, batch):
+        for f in self.jitters:
+            batch = f(batch)
+        return batch
+
+
+class BatchPhTPS20(PhTPS20, BatchJitter):
+    def __call__(self, batch):
+        x, y = batch
+        if vm.is_built(self.pert_model, including_submodules=True) \
+                and self._input_shape != x.shape:
+            self._reset()  # perturbation parameters depend on the batch size
+        self._input_shape = x.shape
+        return self._perturb(x), y
+
+
+class BatchCifarPadRandCropHFlip(BatchClassificationJitter):
+    def apply_input(self, x):
+        return vti.random_hflip_batch(vti.random_crop_batch(vti.pad(x, 4), x.shape[-2:]))
+
+
+class BatchSegRandHFlip(BatchSegmentationJitter):
+    def apply(self, xy):
+        return vti.random_hflip_batch(xy)
+
+
+@dc.dataclass
+class BatchSegRandCropHFlip(BatchSegmentationJitter):
+    crop_shape: tuple
+
+    def apply(self, xy):
+        return vti.random_hflip_batch(vti.random_crop_batch(xy, self.crop_shape))
+
+
+@dc.dataclass
+class BatchSegRandScaleCropPadHFlip(BatchSegmentationJitter):
+    """A batched version of `SegRandScaleCropPadHFlip`.
+
+    Padding is not centered, but appears where the crop window exceeds the
+    image. `align_corners` is not supported.
+    """
+    shape: tuple
+    max_scale: float
+    overflow: object
+    min_scale: float = None
+    image_pad_value: T.Union[float, T.Literal['mean']] = 'mean'
+    label_pad_value: int = -1
+
+    def apply(self, xy):
+        return vti.random_scale_crop_batch(xy, shape=self.shape, max_scale=self.max_scale,
+                                           min_scale=self.min_scale, overflow=self.overflow,
+                                           is_segmentation=(False, True),
+                                           pad_value=self.image_pad_value,
+                                           label_pad_value=self.label_pad_value, hflip_p=0.5)
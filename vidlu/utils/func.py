@@ -7,6 +7,7 @@ import itertools
 import typing
 import warnings
 import sys
+import weakref
 
 from vidlu.utils import text
 from vidlu.utils import tree
@@ -19,6 +20,30 @@ def identity(x):
 
 # Partial ##########################################################################################
 
+_keyword_names_cache = weakref.WeakKeyDictionary()
+
+
+def _get_keyword_names(func):
+    """Returns the set of parameter names of `func` or `None` if it accepts
+    arbitrary keyword arguments or has no signature. Results are cached for
+    functions that support weak references."""
+    try:
+        return _keyword_names_cache[func]
+    except (KeyError, TypeError):
+        pass
+    try:
+        sigparams = list(inspect.signature(func).parameters.values())
+        names = (frozenset(params(func).keys()) if len(sigparams) > 0
+                 and sigparams[-1].kind is not inspect.Parameter.VAR_KEYWORD else None)
+    except ValueError:
+        names = None
+    try:
+        _keyword_names_cache[func] = names
+    except TypeError:  # not weakly referenceable or not hashable
+        pass
+    return names
+
+
 class partial(functools.partial):
     """ partial with a more informative error message and parameters accessible
     using the dot operator.
@@ -45,21 +70,17 @@ class partial(functools.partial):
     #     return super().__new__(cls, func, *args, **keywords)
 
     def __call__(self, *args, **kwargs):
-        try:
-            func = self.func
-            sig = inspect.signature(func)
-            sigparams = list(sig.parameters.items())
-            if len(sigparams) > 0 and sigparams[-1][1].kind is not inspect.Parameter.VAR_KEYWORD:
-                params_ = set(params(func).keys())
-                provided = set({**self.keywords, **kwargs}.keys())
-                unexpected = provided.difference(params_)
-                if len(unexpected) > 0:
-                    raise RuntimeError(f"Unexpected arguments {unexpected} for {func.__name__}"
-                                       + f" with signature {sig}.")
-        except ValueError:
-            pass
+        names = _get_keyword_names(self.func)  # cached per function, not per instance
+        if names is not None and not (names.issuperset(self.keywords)
+                                      and names.issuperset(kwargs)):
+            self._raise_unexpected_args((self.keywords.keys() | kwargs.keys()) - names)
         return functools.partial.__call__(self, *args, **kwargs)
 
+    def _raise_unexpected_args(self, unexpected):
+        func = self.func
+        raise RuntimeError(f"Unexpected arguments {set(unexpected)} for {func.__name__}"
+                           + f" with signature {inspect.signature(func)}.")
+
     def __getitem__(self, item):
         # Using `params(self)[item]` instead of the line below causes infinite recursion
         return self.keywords[item] if item in self.keywords else params(self.func)[item]